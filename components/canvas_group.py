@@ -0,0 +1,189 @@
+import collections
+import functools
+import io
+import os
+import statistics
+import time
+
+import streamlit as st
+from PIL import Image
+from streamlit_drawable_canvas import st_canvas
+
+from services.canvas_raster import (
+    BACKGROUND,
+    CANVAS_HEIGHT,
+    CANVAS_VECTOR,
+    CANVAS_WIDTH,
+    has_strokes,
+    render_png,
+)
+from services.stroke_simplify import simplify_drawing
+
+# 0이면 fragment 없이 획마다 페이지 전체를 다시 실행 (측정 비교용)
+CANVAS_FRAGMENTS = os.getenv("SURGIFORM_CANVAS_FRAGMENTS", "1") != "0"
+# 1이면 캔버스 그룹마다 서버 처리 시간을 표시
+CANVAS_MEASURE = os.getenv("SURGIFORM_CANVAS_MEASURE", "0") == "1"
+# 측정값을 보관하는 최근 실행 수
+TIMING_WINDOW = 50
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_SCALE = THUMBNAIL_WIDTH / CANVAS_WIDTH
+# 캔버스마다 세션에 두는 값 (위젯 키 canvas_<group>_<i> 제외)
+CANVAS_STATE_SUFFIXES = ("_data", "_image", "_png", "_initial")
+
+
+def canvas_count_key(group):
+    return f"canvas_count_{group}"
+
+
+def _active_key(group):
+    return f"canvas_active_{group}"
+
+
+def add_canvas(group):
+    key = canvas_count_key(group)
+    st.session_state[key] = st.session_state.get(key, 0) + 1
+    # 새 캔버스는 바로 그릴 수 있게 열어 둠
+    edit_canvas(group, st.session_state[key] - 1)
+
+
+def delete_canvas(group):
+    """Remove the canvas being edited and shift the later ones down"""
+    index = st.session_state.get(_active_key(group))
+    count = st.session_state.get(canvas_count_key(group), 0)
+    if index is None or index >= count:
+        return
+    # 편집 중인 캔버스만 마운트되어 있으므로 뒤쪽 캔버스의 저장값만 옮기면 됨
+    for i in range(index, count):
+        for suffix in CANVAS_STATE_SUFFIXES:
+            source = f"canvas_{group}_{i + 1}{suffix}"
+            if i + 1 < count and source in st.session_state:
+                st.session_state[f"canvas_{group}_{i}{suffix}"] = st.session_state[source]
+            else:
+                st.session_state.pop(f"canvas_{group}_{i}{suffix}", None)
+    st.session_state[canvas_count_key(group)] = count - 1
+    close_canvas(group)
+
+
+def edit_canvas(group, index):
+    """Mount canvas index of the group as a live component, restoring its strokes"""
+    st.session_state[_active_key(group)] = index
+    _restore_strokes(group)
+
+
+def _restore_strokes(group):
+    index = st.session_state.get(_active_key(group))
+    if index is not None:
+        key = f"canvas_{group}_{index}"
+        # 편집하는 동안 바뀌지 않도록 열 때의 그림을 고정해서 initial_drawing으로 넘김
+        st.session_state[f"{key}_initial"] = st.session_state.get(f"{key}_data")
+
+
+def close_canvas(group):
+    st.session_state[_active_key(group)] = None
+
+
+def record_timing(kind, started):
+    """Keep the server time of one page or canvas-group run, in ms"""
+    timings = st.session_state.setdefault("canvas_timings", {})
+    window = timings.setdefault(kind, collections.deque(maxlen=TIMING_WINDOW))
+    window.append((time.perf_counter() - started) * 1000)
+    return window[-1]
+
+
+def timing_summary(kind):
+    window = st.session_state.get("canvas_timings", {}).get(kind)
+    if not window:
+        return "-"
+    return f"{statistics.median(window):.1f}ms (n={len(window)})"
+
+
+def _canvas_group(group):
+    """Add button and canvases of one section; runs as its own fragment.
+
+    Only the canvas being edited is a live st_canvas iframe. The others are
+    shown together as one image grid of the PNG sent with their last stroke,
+    so the cost of a run stays flat as canvases pile up. In vector mode those
+    PNGs are rendered on the server from the stroke JSON, once per drawing.
+    """
+    started = time.perf_counter()
+    # 콜백에서 상태를 바꾸면 같은 실행 안에서 바로 반영되어 st.rerun이 필요 없음
+    st.button("Add Canvas", key=f"add_canvas_{group}", on_click=add_canvas, args=(group,))
+    count = st.session_state.get(canvas_count_key(group), 0)
+    if count:
+        active = st.session_state.get(_active_key(group))
+        collapsed = [i for i in range(count) if i != active]
+        if collapsed:
+            st.image(
+                [_thumbnail(f"canvas_{group}_{i}") for i in collapsed],
+                caption=[f"캔버스 {i + 1}" for i in collapsed],
+                width=THUMBNAIL_WIDTH, output_format="PNG",
+            )
+        st.segmented_control(
+            "편집할 캔버스", list(range(count)), format_func=lambda i: f"✏️ {i + 1}",
+            key=_active_key(group), on_change=_restore_strokes, args=(group,),
+        )
+        if active is not None and active < count:
+            _live_canvas(f"canvas_{group}_{active}")
+            col1, col2 = st.columns([1, 1])
+            col1.button("✔ 완료", key=f"close_canvas_{group}", on_click=close_canvas, args=(group,))
+            col2.button("🗑️ 삭제", key=f"delete_canvas_{group}", on_click=delete_canvas, args=(group,))
+    if CANVAS_MEASURE:
+        elapsed = record_timing("canvas_group", started)
+        st.caption(
+            f"⏱ 캔버스 그룹 {group}: 이번 실행 {elapsed:.1f}ms · "
+            f"그룹 중앙값 {timing_summary('canvas_group')} · "
+            f"페이지 전체 중앙값 {timing_summary('page')} "
+            f"({'fragment' if CANVAS_FRAGMENTS else '전체 페이지'} 재실행)"
+        )
+
+
+def _live_canvas(key):
+    canvas_result = st_canvas(
+        fill_color="#fff", stroke_width=3, stroke_color="#222",
+        background_color=BACKGROUND, height=CANVAS_HEIGHT, width=CANVAS_WIDTH,
+        drawing_mode="freedraw", initial_drawing=st.session_state.get(f"{key}_initial"),
+        return_image_data=not CANVAS_VECTOR, key=key
+    )
+    # PDF 출력 단계에서 읽을 수 있도록 세션에 보관 (마우스 샘플은 허용 오차 안에서 줄임)
+    data = simplify_drawing(canvas_result.json_data)
+    if data is not None and data != st.session_state.get(f"{key}_data"):
+        st.session_state[f"{key}_data"] = data
+        # 그림이 바뀌었으니 썸네일은 접힐 때 다시 그림
+        st.session_state.pop(f"{key}_png", None)
+    if CANVAS_VECTOR:
+        return
+    image = canvas_result.image_data
+    if image is not None:
+        st.session_state[f"{key}_image"] = image
+        # 접힌 상태에서 보여줄 썸네일은 획마다 한 번만 만들어 둠
+        st.session_state[f"{key}_png"] = _thumbnail_png(Image.fromarray(image))
+
+
+def _thumbnail_png(image):
+    """PNG already at thumbnail size, so st.image sends it as is (no resize per run)"""
+    height = round(image.height * THUMBNAIL_WIDTH / image.width)
+    buffer = io.BytesIO()
+    image.resize((THUMBNAIL_WIDTH, height), Image.BILINEAR).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _thumbnail(key):
+    """PNG of a collapsed canvas, rendered from its strokes the first time it is needed"""
+    png = st.session_state.get(f"{key}_png")
+    if png is None:
+        data = st.session_state.get(f"{key}_data")
+        if not has_strokes(data):
+            return _blank_png()
+        png = render_png(data, THUMBNAIL_SCALE)
+        st.session_state[f"{key}_png"] = png
+    return png
+
+
+@functools.lru_cache(maxsize=1)
+def _blank_png():
+    """Thumbnail for a canvas nobody has drawn on yet"""
+    return render_png(None, THUMBNAIL_SCALE)
+
+
+# 획을 그으면 이 그룹만 다시 실행되고 나머지 페이지는 그대로 유지
+render_canvas_group = st.fragment(_canvas_group) if CANVAS_FRAGMENTS else _canvas_group
@@ -0,0 +1,69 @@
+import streamlit as st
+
+from services.consent_jobs import (
+    CONSENT_SECTION_KEYS,
+    DONE,
+    FAILED,
+    SOURCE_BACKEND,
+    collect_consent_job,
+    consent_job_pending,
+    consent_sections,
+    current_consent_job,
+)
+
+
+@st.fragment(run_every=1)
+def _poll_consent_job(refresh_page):
+    """Poll the background job without rerunning the whole page"""
+    job, changed = collect_consent_job()
+    if job is None:
+        st.warning("생성 작업을 찾을 수 없습니다. 기본 정보 페이지에서 다시 생성해주세요.")
+        return
+    if refresh_page and (changed or job.finished):
+        # 새 섹션이 도착하면 폼의 text_area 값이 갱신되도록 전체 페이지를 다시 그림
+        st.rerun()
+    if job.finished:
+        # 페이지를 다시 그리지 않는 경우 결과도 이 fragment 안에 표시
+        _render_outcome(job)
+        return
+
+    streamed = sum(1 for text in consent_sections(job.partial).values() if text)
+    if streamed:
+        st.info(
+            f"⏳ 생성된 항목부터 표시하고 있습니다... "
+            f"({streamed}/{len(CONSENT_SECTION_KEYS)}, {job.elapsed():.0f}초 경과)"
+        )
+    elif st.session_state.get("consent_baseline_shown"):
+        st.info(
+            f"⏳ 기본 템플릿을 먼저 표시했습니다. 환자 맞춤 내용을 생성하고 있습니다... "
+            f"({job.elapsed():.0f}초 경과)"
+        )
+    else:
+        st.info(f"⏳ 수술 동의서를 생성하고 있습니다... ({job.elapsed():.0f}초 경과)")
+
+
+def render_consent_job_status(refresh_page=True):
+    """Show progress of the session's consent job, or its final outcome.
+
+    With refresh_page the whole page reruns whenever sections arrive, so the
+    surgery-info text areas show them. Pages without those text areas pass
+    False: progress then only reruns the status fragment, and an open
+    dialog on the page stays open.
+    """
+    if consent_job_pending():
+        _poll_consent_job(refresh_page)
+        return
+
+    job = current_consent_job()
+    if job is None:
+        return
+    _render_outcome(job)
+
+
+def _render_outcome(job):
+    if job.status == DONE and job.source != SOURCE_BACKEND:
+        st.success("동일한 조건으로 생성된 수술 동의서를 불러왔습니다.")
+    elif job.status == DONE:
+        st.success(f"수술 동의서가 성공적으로 생성되었습니다! ({job.elapsed():.0f}초 소요)")
+    elif job.status == FAILED:
+        st.error(f"수술 동의서 생성 실패: {job.error}")
@@ -0,0 +1,88 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 화면 갱신 주기와 한 번에 모아 보낼 최대 글자 수
+FLUSH_INTERVAL = 0.075
+FLUSH_CHARS = 200
+PARAGRAPH_BREAK = "\n\n"
+
+
+class StreamRenderer:
+    """Render a token stream into a placeholder without redrawing it per token.
+
+    Chunks are buffered and flushed every FLUSH_INTERVAL seconds or
+    FLUSH_CHARS characters. Finished paragraphs are written once into their
+    own element and never sent again; only the paragraph still being written
+    is updated. finish() replaces everything with one full render.
+    """
+
+    def __init__(self, placeholder, to_html, flush_interval=FLUSH_INTERVAL, flush_chars=FLUSH_CHARS):
+        self._placeholder = placeholder
+        self._to_html = to_html
+        self._flush_interval = flush_interval
+        self._flush_chars = flush_chars
+        self._body = placeholder.container()
+        self._tail = self._body.empty()
+        self.text = ""
+        self._pending = ""
+        self._frozen = 0
+        self._started = time.perf_counter()
+        self._first_chunk = None
+        self._last_flush = self._started
+        self.chunks = 0
+        self.renders = 0
+        self.bytes_sent = 0
+
+    def feed(self, delta):
+        if not delta:
+            return
+        if self._first_chunk is None:
+            self._first_chunk = time.perf_counter()
+        self.chunks += 1
+        self._pending += delta
+        if (len(self._pending) >= self._flush_chars
+                or time.perf_counter() - self._last_flush >= self._flush_interval):
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self.text += self._pending
+        self._pending = ""
+        self._last_flush = time.perf_counter()
+        # 완성된 문단은 현재 요소에 마지막으로 그리고 새 요소로 넘어감
+        end = self.text.rfind(PARAGRAPH_BREAK, self._frozen)
+        if end != -1:
+            self._draw(self._tail, self.text[self._frozen:end])
+            self._tail = self._body.empty()
+            self._frozen = end + len(PARAGRAPH_BREAK)
+        if self._frozen < len(self.text):
+            self._draw(self._tail, self.text[self._frozen:])
+
+    def finish(self):
+        """Final full render; returns the stream stats"""
+        self.flush()
+        if self.text:
+            self._draw(self._placeholder, self.text)
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started
+        streaming = elapsed - ((self._first_chunk or self._started) - self._started)
+        return {
+            "chunks": self.chunks,
+            "chars": len(self.text),
+            "renders": self.renders,
+            "bytes_sent": self.bytes_sent,
+            "seconds": round(elapsed, 3),
+            "ttft_seconds": round(self._first_chunk - self._started, 3) if self._first_chunk else None,
+            "tokens_per_second": round(self.chunks / streaming, 1) if streaming > 0 else None,
+        }
+
+    def _draw(self, element, text):
+        html = self._to_html(text)
+        element.markdown(html, unsafe_allow_html=True)
+        self.renders += 1
+        self.bytes_sent += len(html.encode("utf-8"))
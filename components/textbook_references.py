@@ -0,0 +1,77 @@
+import html
+
+import streamlit as st
+
+from services.citation_align import get_citation_aligner
+from services.consent_jobs import consent_scope
+from services.section_patch import SECTION_LABELS
+from services.textbook_index import load_textbook_index
+
+# 항목마다 보여줄 교과서 발췌 수
+REFERENCES_PER_SECTION = 3
+SNIPPET_CHARS = 220
+
+
+def _section_references(index):
+    """Passages per section, looked up once per surgery/diagnosis and index version"""
+    # 수술명/진단명 위젯 값은 이 페이지에서 비어 있으므로 보관해 둔 선택값을 사용
+    scope = (*consent_scope(), index.version)
+    cached = st.session_state.get("textbook_references")
+    if cached is None or cached["scope"] != scope:
+        cached = {
+            "scope": scope,
+            "sections": index.section_passages(scope[0], scope[1], REFERENCES_PER_SECTION),
+        }
+        st.session_state.textbook_references = cached
+    return cached["sections"]
+
+
+def _annotated_html(alignment):
+    """Section text with a superscript [n] after each sentence backed by passage n"""
+    parts = []
+    for entry in alignment:
+        markers = "".join(f"[{index + 1}]" for index in entry["sources"])
+        sentence = html.escape(entry["sentence"])
+        parts.append(f"{sentence}<sup style='color:#176d36;'>{markers}</sup>" if markers else sentence)
+    return " ".join(parts)
+
+
+def render_textbook_references():
+    """출처 보기 tab: textbook passages behind each consent section"""
+    index = load_textbook_index()
+    if index is None:
+        st.info(
+            "참고 교과서 색인이 아직 없습니다. "
+            "`python -m tools.build_textbook_index <청크 파일>`로 교과서를 색인하면 항목별 출처가 표시됩니다."
+        )
+        return
+
+    references = _section_references(index)
+    # 모든 항목의 문장을 한 번에 발췌와 맞춰 봄 (바뀐 문장만 다시 계산)
+    aligner = get_citation_aligner()
+    alignment = aligner.align({key: st.session_state.get(key, "") for key in references}, references)
+    for key, passages in references.items():
+        st.markdown(f"#### {SECTION_LABELS[key]}")
+        if alignment[key]:
+            st.markdown(f"""
+            <div style="background:#f6f8f6;padding:10px 14px;border-radius:8px;margin-bottom:0.8rem;">
+                {_annotated_html(alignment[key])}
+            </div>
+            """, unsafe_allow_html=True)
+        if not passages:
+            st.caption("관련된 교과서 내용을 찾지 못했습니다.")
+            continue
+        for i, passage in enumerate(passages, start=1):
+            text = passage["text"]
+            if len(text) > SNIPPET_CHARS:
+                text = text[:SNIPPET_CHARS] + "…"
+            source = html.escape(passage["citation"])
+            if passage.get("url"):
+                source = f'<a href="{html.escape(passage["url"])}" target="_blank">{source}</a>'
+            st.markdown(f"""
+            <div style="margin-bottom:1rem;">
+                <strong>{i}. {source}</strong><br>
+                <span style="color:#555;">{html.escape(text)}</span>
+            </div>
+            """, unsafe_allow_html=True)
+    st.caption(f"문장-출처 연결 {aligner.stats()['last_ms']:.0f}ms")
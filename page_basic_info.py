@@ -1,21 +1,34 @@
 import streamlit as st
 import json
-import requests
-from components.buttons import big_green_button
-import logging
+from components.consent_job_status import render_consent_job_status
+from services.consent_catalog import DIAGNOSES, SURGERY_NAMES
+from services.consent_jobs import (
+    collect_consent_job,
+    consent_scope,
+    remember_consent_scope,
+    start_consent_prefetch,
+    submit_consent_job,
+)
+from possum_calculator import possum_dialog
 
 
 
 
-# Initialize session state for POSSUM results and navigation
+# Initialize session state for POSSUM results
 if 'possum_results' not in st.session_state:
     st.session_state.possum_results = None
 
-if 'navigate_to_possum' not in st.session_state:
-    st.session_state.navigate_to_possum = False
 
-if 'show_possum' not in st.session_state:
-    st.session_state.show_possum = False
+def _prefetch_consent():
+    """Start generating default-condition content as soon as both are chosen"""
+    surgery_name, diagnosis = st.session_state.get("surgery_name"), st.session_state.get("diagnosis")
+    # 위젯 키는 다른 페이지로 가면 지워지므로 선택값을 따로 보관
+    remember_consent_scope(surgery_name, diagnosis)
+    start_consent_prefetch(surgery_name, diagnosis)
+
+
+def _option_index(options, value):
+    return options.index(value) if value in options else None
 
 
 def page_basic_info():
@@ -45,17 +58,25 @@ def page_basic_info():
 
     col1, col2, col3 = st.columns([1, 6, 1]) 
     with col2:
-        with st.form("basic_info_form"):
-            st.markdown("### 0. 수술 기본 정보")
+        st.markdown("### 0. 수술 기본 정보")
+        # 수술명/진단명은 폼 밖에 두어 선택 즉시 동의서 사전 생성을 시작
+        # 다른 페이지에 다녀오면 위젯 값이 사라지므로 보관해 둔 선택값으로 복원
+        saved_surgery, saved_diagnosis = consent_scope()
+        col1, col2 = st.columns(2)
+        with col1:
             surgery_name = st.selectbox(
-                "수술명",
-                [
-                    "복강경 담낭절제", "복강경 충수절제", "십이지장궤양 천공의 일차봉합",
-                    "위궤양 천공으로 인한 위절제술", "소장 절제 및 문합", "회장맹장절제",
-                    "결장우반절제술", "하트만 수술", "탐색개복술", "서혜부 탈장 수술", "절개탈장 수술"
-                ]
+                "수술명", SURGERY_NAMES, index=_option_index(SURGERY_NAMES, saved_surgery),
+                placeholder="수술명을 선택하세요",
+                key="surgery_name", on_change=_prefetch_consent
+            )
+        with col2:
+            diagnosis = st.selectbox(
+                "진단명", DIAGNOSES, index=_option_index(DIAGNOSES, saved_diagnosis),
+                placeholder="진단명을 선택하세요",
+                key="diagnosis", on_change=_prefetch_consent
             )
 
+        with st.form("basic_info_form"):
             # 첫 줄에 등록번호 / 환자명, 둘째 줄에 나이/성별 / 시행예정일
             col1, col2 = st.columns(2)
             with col1:
@@ -69,25 +90,6 @@ def page_basic_info():
             with col4:
                 scheduled_date = st.text_input("시행예정일")
 
-            # 진단명 드롭다운
-            diagnosis = st.selectbox(
-                "진단명",
-                [
-                    "Acute cholecystitis (급성담낭염)",
-                    "Acute appendicitis (급성충수염)",
-                    "Duodenal ulcer perforation (십이지장궤양 천공)",
-                    "Gastric ulcer perforation (위궤양 천공)",
-                    "Small intestine obstruction (소장 폐쇄)",
-                    "Small intestine perforation (소장 천공)",
-                    "Ascending colon perforation (상행결장 천공)",
-                    "Transverse colon perforation (횡행결장 천공)",
-                    "Sigmoid colon perforation (에스상결장 천공)",
-                    "Pneumoperitoneum (기복증)",
-                    "Inguinal hernia (서혜부 탈장)",
-                    "Incisional hernia (절개탈장)"
-                ]
-            )
-
             col5, col6 = st.columns(2)
             with col5:
                 surgery_site = st.radio("수술부위표시", ["R", "L", "Both", "해당없음"], horizontal=True)
@@ -144,12 +146,13 @@ def page_basic_info():
             with col2:
                 submitted = st.form_submit_button("수술 동의서 생성하기")
 
-            # POSSUM button: Navigate to calculator (no validation required)
-            if possum:
-                st.session_state.navigate_to_possum = True
-
             # 동의서 생성 로직
             if submitted:
+                if not surgery_name or not diagnosis:
+                    st.error("수술명과 진단명을 선택해주세요.")
+                    st.stop()
+                remember_consent_scope(surgery_name, diagnosis)
+
                 doctors = []
                 for i in range(1, 4):
                     operator = st.session_state.get(f"operator_{i}", "")
@@ -245,6 +248,7 @@ def page_basic_info():
                     "age": age,
                     "gender": gender,
                     "scheduled_date": scheduled_date,
+                    "surgery_name": surgery_name,
                     "diagnosis": diagnosis,
                     "surgical_site_mark": surgery_site,
                     "participants": participants,
@@ -279,39 +283,16 @@ def page_basic_info():
                 }
                 with open("patient_data.json", "w", encoding="utf-8") as f:
                     json.dump(patient_data, f, ensure_ascii=False, indent=2)
-                # API 호출
-                url = "http://10.104.198.155:8000/consent"
-                headers = {"Content-Type": "application/json"}
-
-                response = requests.post(url, json=payload, headers=headers, timeout=60)
-                result = response.json()
-                consents = result.get("consents", {})
-                st.session_state["no_surgery_prognosis"] = consents.get("prognosis_without_surgery", "")
-                st.session_state["alternative_methods"] = consents.get("alternative_treatments", "")
-                st.session_state["purpose"] = consents.get("surgery_purpose_necessity_effect", "")
-                st.session_state["method_1"] = consents.get("surgery_method_content", {}).get("overall_description", "")
-                st.session_state["method_2"] = consents.get("surgery_method_content", {}).get("estimated_duration", "")
-                st.session_state["method_3"] = consents.get("surgery_method_content", {}).get("method_change_or_addition", "")
-                st.session_state["method_4"] = consents.get("surgery_method_content", {}).get("transfusion_possibility", "")
-                st.session_state["method_5"] = consents.get("surgery_method_content", {}).get("surgeon_change_possibility", "")
-                st.session_state["complications"] = consents.get("possible_complications_sequelae", "")
-                st.session_state["preop_care"] = consents.get("emergency_measures", "")
-                st.session_state["mortality_risk"] = consents.get("mortality_risk", "")
-                if response.status_code == 200:
-                    result = response.json()
-                    st.success("수술 동의서가 성공적으로 생성되었습니다!")
-                    st.markdown("#### 수술 동의서 본문")
-                    st.text_area("동의서", result.get("consent_text", ""), height=400)
-                    st.json(result)
-                else:
-                    st.error(f"수술 동의서 생성 실패: {response.status_code}\n{response.text}")
-
-
-
-
-    
-
-# Navigation handler for POSSUM calculator
-    if possum:  
-        st.session_state.show_possum = True
-        st.rerun()
+                # API 호출은 백그라운드 작업으로 넘기고 바로 반환
+                submit_consent_job(payload)
+                # 캐시/라이브러리 적중 시 바로 반영, 아니면 기본 템플릿을 먼저 표시
+                job, _ = collect_consent_job()
+                if job is None or not job.finished:
+                    st.info("수술 동의서 생성을 시작했습니다. 생성되는 동안 다른 단계로 이동하셔도 됩니다.")
+
+        # 이 페이지에는 동의서 text_area가 없으므로 진행 상황만 갱신해 POSSUM 대화상자가 닫히지 않게 함
+        render_consent_job_status(refresh_page=False)
+
+    # POSSUM 계산기는 이 페이지 위의 대화상자로 열어 입력한 폼 내용이 유지됨
+    if possum:
+        possum_dialog()
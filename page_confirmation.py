@@ -1,7 +1,15 @@
 import streamlit as st
-from streamlit_drawable_canvas import st_canvas
 import json
+import time
 from datetime import datetime
+from components.canvas_group import CANVAS_MEASURE, record_timing, render_canvas_group, timing_summary
+from services.consent_archive import RASTER_PNG, write_canvas_data
+from services.consent_jobs import CONSENT_SECTION_KEYS
+from services.stroke_simplify import simplify_drawing
+import os
+
+# 동의서 보관 파일의 캔버스 래스터 형식 (png 또는 raw)
+CONSENT_ARCHIVE_RASTER = os.getenv("SURGIFORM_CONSENT_ARCHIVE_RASTER", RASTER_PNG)
 
 def load_patient_data():
     try:
@@ -11,21 +19,11 @@ def load_patient_data():
         st.error(f"데이터 파일을 읽을 수 없습니다: {e}")
         return {}
 
-def add_canvas(section_idx, sub_idx=None):
-    key = f"canvas_count_{section_idx}_{sub_idx}" if sub_idx is not None else f"canvas_count_{section_idx}"
-    if key not in st.session_state:
-        st.session_state[key] = 0
-    st.session_state[key] += 1
-
-def delete_canvas(section_idx, canvas_idx, sub_idx=None):
-    key = f"canvas_count_{section_idx}_{sub_idx}" if sub_idx is not None else f"canvas_count_{section_idx}"
-    if key in st.session_state and st.session_state[key] > 0:
-        st.session_state[key] -= 1
-
-def save_all_canvas_data():
-    """Save all canvas data including counts and drawing content"""
+def collect_canvas_data(state, patient_info):
+    """Gather canvas counts, drawings, images and section text from state into one dict"""
     canvas_data = {
-        'patient_info': load_patient_data(),
+        'patient_info': patient_info,
+        'sections': {key: state[key] for key in CONSENT_SECTION_KEYS if isinstance(state.get(key), str)},
         'canvas_counts': {},
         'canvas_drawings': {},
         'canvas_images': {},
@@ -33,31 +31,39 @@ def save_all_canvas_data():
     }
     
     # Save canvas counts
-    for key in st.session_state:
+    for key in state:
         if key.startswith("canvas_count_"):
-            canvas_data['canvas_counts'][key] = st.session_state[key]
+            canvas_data['canvas_counts'][key] = state[key]
     
     # Save canvas drawing data and images
-    for key in st.session_state:
+    for key in state:
         if key.startswith("canvas_") and not key.startswith("canvas_count_"):
-            canvas_obj = st.session_state[key]
+            canvas_obj = state[key]
             if hasattr(canvas_obj, 'json_data') and canvas_obj.json_data:
-                canvas_data['canvas_drawings'][key] = canvas_obj.json_data
+                canvas_data['canvas_drawings'][key] = simplify_drawing(canvas_obj.json_data)
             if hasattr(canvas_obj, 'image_data') and canvas_obj.image_data is not None:
-                canvas_data['canvas_images'][key] = canvas_obj.image_data.tolist()
+                canvas_data['canvas_images'][key] = canvas_obj.image_data
+            # 캔버스 그룹은 획과 이미지를 canvas_<group>_<i>_data / _image에 보관
+            if key.endswith("_data") and state[key]:
+                canvas_data['canvas_drawings'][key[:-len("_data")]] = simplify_drawing(state[key])
+            if key.endswith("_image") and state[key] is not None:
+                canvas_data['canvas_images'][key[:-len("_image")]] = state[key]
     
     # Save confirmation canvas
-    if 'confirmation_big_canvas' in st.session_state:
-        confirmation_canvas = st.session_state['confirmation_big_canvas']
+    if 'confirmation_big_canvas' in state:
+        confirmation_canvas = state['confirmation_big_canvas']
         if hasattr(confirmation_canvas, 'json_data') and confirmation_canvas.json_data:
-            canvas_data['canvas_drawings']['confirmation_signature'] = confirmation_canvas.json_data
+            canvas_data['canvas_drawings']['confirmation_signature'] = simplify_drawing(confirmation_canvas.json_data)
         if hasattr(confirmation_canvas, 'image_data') and confirmation_canvas.image_data is not None:
-            canvas_data['canvas_images']['confirmation_signature'] = confirmation_canvas.image_data.tolist()
-    
+            canvas_data['canvas_images']['confirmation_signature'] = confirmation_canvas.image_data
+    return canvas_data
+
+def save_all_canvas_data():
+    """Save all canvas data including counts and drawing content"""
+    canvas_data = collect_canvas_data(st.session_state, load_patient_data())
     try:
-        filename = f"consent_form_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(canvas_data, f, ensure_ascii=False, indent=2)
+        filename = f"consent_form_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        write_canvas_data(filename, canvas_data, raster=CONSENT_ARCHIVE_RASTER)
         st.success(f"데이터가 {filename}에 저장되었습니다.")
         return True
     except Exception as e:
@@ -65,6 +71,7 @@ def save_all_canvas_data():
         return False
 
 def page_confirmation():
+    started = time.perf_counter()
     st.markdown("""
         <h2 style='text-align:center; color:#176d36; margin: 0 0 20px 0'>앞서 작성한 모든 정보입니다. 환자 숙지 후 서명을 부탁드립니다.</h2>
     """, unsafe_allow_html=True)
@@ -201,27 +208,7 @@ def page_confirmation():
         # Section 2
         st.markdown("### 2. 예정된 수술을 하지 않을 경우의 예후")
         st.markdown(st.session_state.get("no_surgery_prognosis", ""))
-        if st.button("Add Canvas", key="add_canvas_2"):
-            add_canvas(2)
-        
-        for i in range(st.session_state.get("canvas_count_2", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_2_{i}"):
-                    delete_canvas(2, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_2_{i}"
-                )
-                # Store canvas result in session state for later saving
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_2_{i}_data"] = canvas_result.json_data
-                    print(st.session_state[f"canvas_2_{i}_data"])
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_2_{i}_image"] = canvas_result.image_data
+        render_canvas_group("2")
 
         st.divider()
 
@@ -229,48 +216,14 @@ def page_confirmation():
         st.markdown("### 3. 예정된 수술 이외의 시행 가능한 다른 방법")
         st.markdown(st.session_state.get("alternative_methods", ""))
 
-        if st.button("Add Canvas", key="add_canvas_3"):
-            add_canvas(3)
-        for i in range(st.session_state.get("canvas_count_3", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_3_{i}"):
-                    delete_canvas(3, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_3_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_3_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_3_{i}_image"] = canvas_result.image_data
+        render_canvas_group("3")
         st.divider()
 
         # Section 4
         st.markdown("### 4. 수술의 목적/필요성/효과")
         st.markdown(st.session_state.get("purpose", ""))
 
-        if st.button("Add Canvas", key="add_canvas_4"):
-            add_canvas(4)
-        for i in range(st.session_state.get("canvas_count_4", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_4_{i}"):
-                    delete_canvas(4, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_4_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_4_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_4_{i}_image"] = canvas_result.image_data
+        render_canvas_group("4")
         st.divider()
 
         # Section 5
@@ -280,47 +233,13 @@ def page_confirmation():
         st.markdown("**1) 수술 과정 전반에 대한 설명**")
         st.markdown(st.session_state.get("method_1", ""))
 
-        if st.button("Add Canvas", key="add_canvas_5_1"):
-            add_canvas(5, 1)
-        for i in range(st.session_state.get("canvas_count_5_1", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️ (Section 5-1, Canvas {i+1})", key=f"delete_canvas_5_1_{i}"):
-                    delete_canvas(5, i, 1)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_5_1_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_5_1_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_5_1_{i}_image"] = canvas_result.image_data
+        render_canvas_group("5_1")
 
         # Subsection 2
         st.markdown("**2) 수술 추정 소요시간**")
         st.markdown(st.session_state.get("method_2", ""))
 
-        if st.button("Add Canvas", key="add_canvas_5_2"):
-            add_canvas(5, 2)
-        for i in range(st.session_state.get("canvas_count_5_2", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️ (Section 5-2, Canvas {i+1})", key=f"delete_canvas_5_2_{i}"):
-                    delete_canvas(5, i, 2)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_5_2_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_5_2_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_5_2_{i}_image"] = canvas_result.image_data
+        render_canvas_group("5_2")
 
         # Subsection 3
         st.markdown("**3) 수술 변경 및 수술 추가 가능성**")
@@ -330,47 +249,13 @@ def page_confirmation():
         > 다만, 수술/시술/검사의 시행 도중에 환자의 상태에 따라 미리 설명하고 동의를 얻을 수 없을 정도로 긴급한 변경 또는 추가가 요구되는 경우에는  
         > 시행 후에 지체 없이 그 사유 및 결과를 환자 또는 대리인에게 설명하도록 합니다.
         """)
-        if st.button("Add Canvas", key="add_canvas_5_3"):
-            add_canvas(5, 3)
-        for i in range(st.session_state.get("canvas_count_5_3", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️ (Section 5-3, Canvas {i+1})", key=f"delete_canvas_5_3_{i}"):
-                    delete_canvas(5, i, 3)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_5_3_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_5_3_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_5_3_{i}_image"] = canvas_result.image_data
+        render_canvas_group("5_3")
 
         # Subsection 4
         st.markdown("**4) 수혈 가능성**")
         st.markdown(st.session_state.get("method_4", ""))
 
-        if st.button("Add Canvas", key="add_canvas_5_4"):
-            add_canvas(5, 4)
-        for i in range(st.session_state.get("canvas_count_5_4", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_5_4_{i}"):
-                    delete_canvas(5, i, 4)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_5_4_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_5_4_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_5_4_{i}_image"] = canvas_result.image_data
+        render_canvas_group("5_4")
 
         # Subsection 5
         st.markdown("**5) 진단/수술 관련 사망 위험성**")
@@ -380,96 +265,28 @@ def page_confirmation():
         > 다만, 시행 도중에 미리 설명하고 동의를 얻을 수 없을 정도로 긴급한 변경이 요구되는 경우에는 시행 후에  
         > 지체 없이 구체적인 변경 사유 및 시행결과를 환자 또는 대리인에게 설명하도록 합니다.
         """)
-        if st.button("Add Canvas", key="add_canvas_5_5"):
-            add_canvas(5, 5)
-        for i in range(st.session_state.get("canvas_count_5_5", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_5_5_{i}"):
-                    delete_canvas(5, i, 5)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_5_5_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_5_5_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_5_5_{i}_image"] = canvas_result.image_data
+        render_canvas_group("5_5")
         st.divider()
 
         # Section 6
         st.markdown("### 6. 발생 가능한 합병증/후유증/부작용")
         st.markdown(st.session_state.get("complications", ""))
 
-        if st.button("Add Canvas", key="add_canvas_6"):
-            add_canvas(6)
-        for i in range(st.session_state.get("canvas_count_6", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_6_{i}"):
-                    delete_canvas(6, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_6_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_6_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_6_{i}_image"] = canvas_result.image_data
+        render_canvas_group("6")
         st.divider()
 
         # Section 7
         st.markdown("### 7. 문제 발생시 조치사항")
         st.markdown(st.session_state.get("preop_care", ""))
 
-        if st.button("Add Canvas", key="add_canvas_7_1"):
-            add_canvas(7, 1)
-        for i in range(st.session_state.get("canvas_count_7_1", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_7_1_{i}"):
-                    delete_canvas(7, i, 1)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_7_1_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_7_1_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_7_1_{i}_image"] = canvas_result.image_data
+        render_canvas_group("7_1")
         st.divider()
 
         # Section 8
         st.markdown("### 8. 진단/수술 관련 사망 위험성")
         st.markdown(st.session_state.get("mortality_risk", ""))
 
-        if st.button("Add Canvas", key="add_canvas_8"):
-            add_canvas(8)
-        for i in range(st.session_state.get("canvas_count_8", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_8_{i}"):
-                    delete_canvas(8, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_8_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_8_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_8_{i}_image"] = canvas_result.image_data
+        render_canvas_group("8")
         st.divider()
 
         # Signature and Confirmation Section
@@ -487,24 +304,7 @@ def page_confirmation():
         """)
 
         st.markdown("**추가 정보/서명란 (필요시 담당의 입력)**")
-        if st.button("Add Canvas", key="add_canvas_9"):
-            add_canvas(9)
-        for i in range(st.session_state.get("canvas_count_9", 0)):
-            col1, col2 = st.columns([1, 10])
-            with col1:
-                if st.button(f"🗑️", key=f"delete_canvas_9_{i}"):
-                    delete_canvas(9, i)
-                    st.rerun()
-            with col2:
-                canvas_result = st_canvas(
-                    fill_color="#fff", stroke_width=3, stroke_color="#222",
-                    background_color="#f9f9f9", height=200, width=750,
-                    drawing_mode="freedraw", key=f"canvas_9_{i}"
-                )
-                if canvas_result.json_data is not None:
-                    st.session_state[f"canvas_9_{i}_data"] = canvas_result.json_data
-                if canvas_result.image_data is not None:
-                    st.session_state[f"canvas_9_{i}_image"] = canvas_result.image_data
+        render_canvas_group("9")
         st.divider()        
         st.markdown("</div>", unsafe_allow_html=True)
         st.markdown("<br>", unsafe_allow_html=True)
@@ -523,4 +323,12 @@ def page_confirmation():
                     st.session_state.step = 3
                     st.rerun()
                 else:
-                    st.error("데이터 저장에 실패했습니다. 다시 시도해주세요.")
\ No newline at end of file
+                    st.error("데이터 저장에 실패했습니다. 다시 시도해주세요.")
+
+        if CANVAS_MEASURE:
+            # 획 하나에 전체 페이지(SURGIFORM_CANVAS_FRAGMENTS=0)와 그룹만 재실행할 때를 비교
+            elapsed = record_timing("page", started)
+            st.caption(
+                f"⏱ 페이지 전체 실행 {elapsed:.1f}ms · 페이지 중앙값 {timing_summary('page')} · "
+                f"캔버스 그룹 중앙값 {timing_summary('canvas_group')}"
+            )
\ No newline at end of file
@@ -1,6 +1,4 @@
 import streamlit as st
-from streamlit_drawable_canvas import st_canvas
-import json
 import numpy as np
 from PIL import Image
 import io
@@ -8,11 +6,21 @@ import base64
 from page_confirmation import load_patient_data
 import pdfkit
 import os
+from services.canvas_raster import has_strokes, render_png
 
-def canvas_to_base64(canvas_key):
+# 벡터로 저장된 그림을 PDF용으로 그릴 때의 배율 (2면 1500x400px, 인쇄에서도 선명함)
+CANVAS_PDF_SCALE = float(os.getenv("SURGIFORM_CANVAS_PDF_SCALE", "2"))
+
+def canvas_to_base64(canvas_key, state=None):
     """Convert canvas image to base64 HTML img tag"""
-    if f"{canvas_key}_image" in st.session_state:
-        img_array = st.session_state[f"{canvas_key}_image"].astype(np.uint8)
+    state = st.session_state if state is None else state
+    if f"{canvas_key}_image" not in state and has_strokes(state.get(f"{canvas_key}_data")):
+        # 벡터 모드: 획 JSON을 PDF 해상도로 그림 (표시 폭은 그대로 750)
+        png = render_png(state[f"{canvas_key}_data"], CANVAS_PDF_SCALE)
+        img_str = base64.b64encode(png).decode("utf-8")
+        return f'<img src="data:image/png;base64,{img_str}" width="750" style="margin-bottom:12px;"><br>'
+    if f"{canvas_key}_image" in state:
+        img_array = state[f"{canvas_key}_image"].astype(np.uint8)
         if img_array.shape[2] == 4:  # Remove alpha channel if RGBA
             img_array = img_array[:, :, :3]
         img = Image.fromarray(img_array)
@@ -22,8 +30,11 @@ def canvas_to_base64(canvas_key):
         return f'<img src="data:image/png;base64,{img_str}" width="750" style="margin-bottom:12px;"><br>'
     return ""
 
-def collect_all_content():
-    consent_data = load_patient_data()
+def collect_all_content(state=None, consent_data=None):
+    """Build the consent HTML from state (default: st.session_state)"""
+    state = st.session_state if state is None else state
+    if consent_data is None:
+        consent_data = load_patient_data()
     full_html = ""
     
     # Patient & Surgery Info Table
@@ -134,26 +145,26 @@ def collect_all_content():
 
     # Section 2
     full_html += "<h3>2. 예정된 수술을 하지 않을 경우의 예후</h3>"
-    full_html += f"<p>{st.session_state.get('no_surgery_prognosis', '')}</p>"
+    full_html += f"<p>{state.get('no_surgery_prognosis', '')}</p>"
     
     # Add canvas images for section 2
-    for i in range(st.session_state.get("canvas_count_2", 0)):
-        canvas_html = canvas_to_base64(f"canvas_2_{i}")
+    for i in range(state.get("canvas_count_2", 0)):
+        canvas_html = canvas_to_base64(f"canvas_2_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Section 3
     full_html += "<h3>3. 예정된 수술 이외의 시행 가능한 다른 방법</h3>"
-    full_html += f"<p>{st.session_state.get('alternative_methods', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_3", 0)):
-        canvas_html = canvas_to_base64(f"canvas_3_{i}")
+    full_html += f"<p>{state.get('alternative_methods', '')}</p>"
+    for i in range(state.get("canvas_count_3", 0)):
+        canvas_html = canvas_to_base64(f"canvas_3_{i}", state)
         if canvas_html:
             full_html += canvas_html
     # Section 4
     full_html += "<h3>4. 수술의 목적/필요성/효과</h3>"
-    full_html += f"<p>{st.session_state.get('purpose', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_4", 0)):
-        canvas_html = canvas_to_base64(f"canvas_4_{i}")
+    full_html += f"<p>{state.get('purpose', '')}</p>"
+    for i in range(state.get("canvas_count_4", 0)):
+        canvas_html = canvas_to_base64(f"canvas_4_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
@@ -162,17 +173,17 @@ def collect_all_content():
     
     # Subsection 1
     full_html += "<h4>1) 수술 과정 전반에 대한 설명</h4>"
-    full_html += f"<p>{st.session_state.get('method_1', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_5_1", 0)):
-        canvas_html = canvas_to_base64(f"canvas_5_1_{i}")
+    full_html += f"<p>{state.get('method_1', '')}</p>"
+    for i in range(state.get("canvas_count_5_1", 0)):
+        canvas_html = canvas_to_base64(f"canvas_5_1_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Subsection 2
     full_html += "<h4>2) 수술 추정 소요시간</h4>"
-    full_html += f"<p>{st.session_state.get('method_2', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_5_2", 0)):
-        canvas_html = canvas_to_base64(f"canvas_5_2_{i}")
+    full_html += f"<p>{state.get('method_2', '')}</p>"
+    for i in range(state.get("canvas_count_5_2", 0)):
+        canvas_html = canvas_to_base64(f"canvas_5_2_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
@@ -186,16 +197,16 @@ def collect_all_content():
     시행 후에 지체 없이 그 사유 및 결과를 환자 또는 대리인에게 설명하도록 합니다.
     </blockquote>
     """
-    for i in range(st.session_state.get("canvas_count_5_3", 0)):
-        canvas_html = canvas_to_base64(f"canvas_5_3_{i}")
+    for i in range(state.get("canvas_count_5_3", 0)):
+        canvas_html = canvas_to_base64(f"canvas_5_3_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Subsection 4
     full_html += "<h4>4) 수혈 가능성</h4>"
-    full_html += f"<p>{st.session_state.get('method_4', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_5_4", 0)):
-        canvas_html = canvas_to_base64(f"canvas_5_4_{i}")
+    full_html += f"<p>{state.get('method_4', '')}</p>"
+    for i in range(state.get("canvas_count_5_4", 0)):
+        canvas_html = canvas_to_base64(f"canvas_5_4_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
@@ -209,32 +220,32 @@ def collect_all_content():
     지체 없이 구체적인 변경 사유 및 시행결과를 환자 또는 대리인에게 설명하도록 합니다.
     </blockquote>
     """
-    for i in range(st.session_state.get("canvas_count_5_5", 0)):
-        canvas_html = canvas_to_base64(f"canvas_5_5_{i}")
+    for i in range(state.get("canvas_count_5_5", 0)):
+        canvas_html = canvas_to_base64(f"canvas_5_5_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Section 6
     full_html += "<h3>6. 발생 가능한 합병증/후유증/부작용</h3>"
-    full_html += f"<p>{st.session_state.get('complications', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_6", 0)):
-        canvas_html = canvas_to_base64(f"canvas_6_{i}")
+    full_html += f"<p>{state.get('complications', '')}</p>"
+    for i in range(state.get("canvas_count_6", 0)):
+        canvas_html = canvas_to_base64(f"canvas_6_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Section 7
     full_html += "<h3>7. 문제 발생시 조치사항</h3>"
-    full_html += f"<p>{st.session_state.get('preop_care', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_7_1", 0)):
-        canvas_html = canvas_to_base64(f"canvas_7_1_{i}")
+    full_html += f"<p>{state.get('preop_care', '')}</p>"
+    for i in range(state.get("canvas_count_7_1", 0)):
+        canvas_html = canvas_to_base64(f"canvas_7_1_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
     # Section 8
     full_html += "<h3>8. 진단/수술 관련 사망 위험성</h3>"
-    full_html += f"<p>{st.session_state.get('mortality_risk', '')}</p>"
-    for i in range(st.session_state.get("canvas_count_8", 0)):
-        canvas_html = canvas_to_base64(f"canvas_8_{i}")
+    full_html += f"<p>{state.get('mortality_risk', '')}</p>"
+    for i in range(state.get("canvas_count_8", 0)):
+        canvas_html = canvas_to_base64(f"canvas_8_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
@@ -254,8 +265,8 @@ def collect_all_content():
     """
 
     full_html += "<h4>추가 정보/서명란 (필요시 담당의 입력)</h4>"
-    for i in range(st.session_state.get("canvas_count_9", 0)):
-        canvas_html = canvas_to_base64(f"canvas_9_{i}")
+    for i in range(state.get("canvas_count_9", 0)):
+        canvas_html = canvas_to_base64(f"canvas_9_{i}", state)
         if canvas_html:
             full_html += canvas_html
 
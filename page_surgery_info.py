@@ -1,7 +1,42 @@
 import streamlit as st
 from groq import Groq
+from components.consent_job_status import render_consent_job_status
+from components.stream_renderer import StreamRenderer
+from components.textbook_references import render_textbook_references
+from services.answer_cache import get_answer_cache
+from services.chat_backend import CANCELLED, cancel_chat_generation, chat_session_id, get_chat_backend
+from services.chat_memory import SUMMARY_MODEL, ChatMemory, groq_summarizer
+from services.chat_router import ROUTE_FAST, ROUTE_SEARCH, ROUTE_TEXTBOOK, get_chat_router
+from services.consent_jobs import consent_scope
+from services.groq_scheduler import get_groq_scheduler, priority_for_timing
+from services.textbook_index import format_passages, load_textbook_index
+from services.section_patch import (
+    PATCH_PROMPT,
+    SECTION_LABELS,
+    PatchError,
+    apply_patch,
+    parse_patch,
+    sections_context,
+)
+import html
+import logging
 import os
-from typing import List, Dict
+import time
+from datetime import datetime
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 수정안 모드는 웹 검색이 필요 없으므로 JSON 출력을 지원하는 일반 모델 사용
+PATCH_MODEL = os.getenv("SURGIFORM_PATCH_MODEL", "llama-3.3-70b-versatile")
+
+SYSTEM_PROMPT = """당신은 의료진을 위한 수술 동의서 작성 도우미입니다. 
+                다음 역할을 수행해주세요:
+                1. 수술 관련 정보 수정 및 보완 제안
+                2. 의학적으로 정확하고 환자가 이해하기 쉬운 설명 제공
+                3. 동의서 작성 시 놓칠 수 있는 중요한 사항 알림
+                4. 전문적이면서도 친근한 톤으로 대화
+                항상 한국어로 응답하고, 의료진에게 존댓말을 사용해주세요."""
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -11,6 +46,15 @@ def initialize_session_state():
         ]
     if "chatbot_input_key" not in st.session_state:
         st.session_state.chatbot_input_key = 0
+    if "chat_memory" not in st.session_state:
+        st.session_state.chat_memory = ChatMemory()
+
+def assistant_bubble(text: str) -> str:
+    return f"""
+    <div style='background:#e8f5e9;color:#176d36;padding:10px 14px;border-radius:12px 12px 12px 2px;margin-bottom:8px;max-width:85%;'>
+        {text}
+    </div>
+    """
 
 # Initialize Groq client
 @st.cache_resource
@@ -21,85 +65,273 @@ def get_groq_client():
         return None
     return Groq(api_key=api_key)
 
-def get_streaming_response(messages: List[Dict[str, str]], response_placeholder) -> str:
-    """Get streaming response from Groq API with real-time updates"""
+def _answer_scope():
+    """(surgery, diagnosis) that cached answers are filed under, or None before both are chosen"""
+    surgery_name, diagnosis = consent_scope()
+    if not surgery_name or not diagnosis:
+        # 범위 없이 저장/조회하면 다른 수술·환자의 답변이 섞이므로 캐시를 쓰지 않음
+        return None
+    return surgery_name, diagnosis
+
+def _request_refresh(index: int):
+    st.session_state.chat_refresh_index = index
+
+def _chat_priority() -> int:
+    """Rate-limit queue priority from the case's POSSUM timing of surgery"""
+    possum = st.session_state.get("possum_results") or {}
+    return priority_for_timing(possum.get("timing"))
+
+def _chat_memory(client):
+    memory = st.session_state.chat_memory
+    if memory.summarize_fn is None:
+        # 요약은 대화 요청보다 뒤에 처리되도록 가장 낮은 우선순위로 대기
+        memory.summarize_fn = groq_summarizer(client, scheduler=get_groq_scheduler(SUMMARY_MODEL))
+    return memory
+
+def _textbook_passages(prompt: str) -> List[Dict]:
+    """Local textbook excerpts relevant to the question, if the index is built"""
+    index = load_textbook_index()
+    if index is None:
+        return []
+    # 수술명/진단명 위젯 값은 이 페이지에서 비어 있으므로 보관해 둔 선택값을 사용
+    surgery_name, diagnosis = consent_scope()
+    return index.relevant(f"{surgery_name or ''} {diagnosis or ''} {prompt}")
+
+def _wait_in_queue(backend, generation, placeholder):
+    """Show the queue position until the rate-limit scheduler lets the call start"""
+    shown = None
+    while generation.queued:
+        position = backend.queue_position(generation)
+        if position and position != shown:
+            placeholder.info(f"⏳ 요청이 많아 순서를 기다리고 있습니다 ({position}번째)")
+            shown = position
+        time.sleep(0.3)
+    if shown is not None:
+        placeholder.empty()
+
+def get_streaming_response(messages: List[Dict[str, str]], response_placeholder,
+                           cache_question: Optional[str] = None,
+                           route: Optional[Dict] = None,
+                           passages: Optional[List[Dict]] = None) -> str:
+    """Get streaming response from Groq API with real-time updates.
+
+    route is the chat router's decision for the turn (search model if None).
+    passages are textbook excerpts given to the model and cited under the
+    answer. A successful answer is stored in the answer cache under
+    cache_question.
+    """
+    router = get_chat_router()
+    route = route or {"route": ROUTE_SEARCH, "model": router.models[ROUTE_SEARCH]}
     client = get_groq_client()
-    if not client:
+    backend = get_chat_backend()
+    if not client or not backend:
         return "죄송합니다. API 연결에 문제가 있습니다."
     
     try:
-        # Convert messages to Groq format and add system prompt
-        groq_messages = [
-            {
-                "role": "system", 
-                "content": """당신은 의료진을 위한 수술 동의서 작성 도우미입니다. 
-                다음 역할을 수행해주세요:
-                1. 수술 관련 정보 수정 및 보완 제안
-                2. 의학적으로 정확하고 환자가 이해하기 쉬운 설명 제공
-                3. 동의서 작성 시 놓칠 수 있는 중요한 사항 알림
-                4. 전문적이면서도 친근한 톤으로 대화
-                항상 한국어로 응답하고, 의료진에게 존댓말을 사용해주세요."""
-            }
-        ]
+        # System prompt, rolling summary and the newest turns within the token budget
+        memory = _chat_memory(client)
+        groq_messages = memory.context(messages, SYSTEM_PROMPT)
+        if passages:
+            groq_messages.insert(1, {"role": "system", "content": format_passages(passages)})
         
-        # Add conversation history
-        recent_messages = messages[-10:] if len(messages) > 10 else messages
-        for msg in recent_messages:
-            groq_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        # Use compound-beta model
-        completion = client.chat.completions.create(
-            model="compound-beta",
+        # Routed model; starting replaces this session's previous generation
+        generation = backend.start(
+            chat_session_id(),
+            priority=_chat_priority(),
+            model=route["model"],
             messages=groq_messages,
             temperature=0.7,
             max_tokens=1000,
             top_p=1,
-            stream=True,
             stop=None,
         )
         
-        # Stream and update in real-time
-        response_text = ""
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                response_text += chunk.choices[0].delta.content
-                
-                # Update the placeholder with current response
-                response_placeholder.markdown(f"""
-                <div style='background:#e8f5e9;color:#176d36;padding:10px 14px;border-radius:12px 12px 12px 2px;margin-bottom:8px;max-width:85%;'>
-                    {response_text}
-                </div>
-                """, unsafe_allow_html=True)
+        # Stream with batched updates; finished paragraphs are not re-sent
+        renderer = StreamRenderer(response_placeholder, assistant_bubble)
+        try:
+            _wait_in_queue(backend, generation, response_placeholder)
+            for delta in generation.iter_text():
+                renderer.feed(delta)
+        finally:
+            # 새 입력이나 대화창 닫기로 스크립트가 중단되면 생성도 바로 취소
+            backend.cancel_generation(generation, "interrupted")
+        if generation.error is not None:
+            router.record(route["route"], failed=True)
+            return api_error_message(generation.error)
+        if generation.status == CANCELLED:
+            return "⏹ 답변 생성이 취소되었습니다."
+        stats = renderer.finish()
+        response_text = renderer.text
+        stats["route"] = route["route"]
+        st.session_state.chat_stream_stats = stats
+        router.record(route["route"], stats["seconds"], stats["ttft_seconds"])
+        logger.info("chat stream: %s", stats)
         
         if not response_text:
             return "응답을 받지 못했습니다. 다시 시도해주세요."
+        if passages:
+            sources = " · ".join(f"[{i}] {p['citation']}" for i, p in enumerate(passages, start=1))
+            response_text += f"\n\n📚 참고: {sources}"
+            response_placeholder.markdown(assistant_bubble(response_text), unsafe_allow_html=True)
+        if cache_question and (scope := _answer_scope()):
+            get_answer_cache().put(*scope, cache_question, response_text)
             
         return response_text
         
     except Exception as e:
-        error_message = str(e)
-        
-        if "rate_limit" in error_message.lower():
-            return "⏰ API 사용량 한도를 초과했습니다. 잠시 후 다시 시도해주세요."
-        elif "authentication" in error_message.lower() or "401" in error_message:
-            return "🔑 API 키 인증에 문제가 있습니다. 설정을 확인해주세요."
-        elif "model_decommissioned" in error_message.lower():
-            return "🚫 사용하려는 모델이 더 이상 지원되지 않습니다."
-        else:
-            return f"❌ API 오류가 발생했습니다: {error_message}"
+        return api_error_message(e)
+
+def api_error_message(e: Exception) -> str:
+    error_message = str(e)
+    
+    if "rate_limit" in error_message.lower():
+        return "⏰ API 사용량 한도를 초과했습니다. 잠시 후 다시 시도해주세요."
+    elif "authentication" in error_message.lower() or "401" in error_message:
+        return "🔑 API 키 인증에 문제가 있습니다. 설정을 확인해주세요."
+    elif "model_decommissioned" in error_message.lower():
+        return "🚫 사용하려는 모델이 더 이상 지원되지 않습니다."
+    else:
+        return f"❌ API 오류가 발생했습니다: {error_message}"
+
+def get_patch_response(messages: List[Dict[str, str]]) -> Dict:
+    """Ask for a structured edit of the current sections instead of prose.
+
+    Returns the assistant message to store: content is a short summary and,
+    on success, "patch" holds the edits.
+    """
+    client = get_groq_client()
+    backend = get_chat_backend()
+    if not client or not backend:
+        return {"role": "assistant", "content": "죄송합니다. API 연결에 문제가 있습니다."}
+    
+    memory = _chat_memory(client)
+    groq_messages = memory.context(messages, SYSTEM_PROMPT + "\n\n" + PATCH_PROMPT)
+    groq_messages.insert(1, {"role": "system", "content": sections_context(st.session_state)})
+    
+    started = time.perf_counter()
+    generation = backend.start(
+        chat_session_id(),
+        stream=False,
+        priority=_chat_priority(),
+        model=PATCH_MODEL,
+        messages=groq_messages,
+        temperature=0.2,
+        max_tokens=800,
+        response_format={"type": "json_object"},
+    )
+    try:
+        _wait_in_queue(backend, generation, st.empty())
+        generation.wait()
+    finally:
+        backend.cancel_generation(generation, "interrupted")
+    if generation.status == CANCELLED:
+        return {"role": "assistant", "content": "⏹ 수정안 생성이 취소되었습니다."}
+    completion = generation.completion
+    try:
+        if generation.error is not None:
+            raise generation.error
+        patch = parse_patch(generation.text)
+    except PatchError as e:
+        return {"role": "assistant", "content": f"❌ {e} 다시 요청해주세요."}
+    except Exception as e:
+        return {"role": "assistant", "content": api_error_message(e)}
+    logger.info(
+        "chat patch: %d edits, %s completion tokens, %.2fs",
+        len(patch["edits"]),
+        getattr(completion.usage, "completion_tokens", None),
+        time.perf_counter() - started,
+    )
+    
+    lines = [patch["note"] or "수정안입니다."]
+    for edit in patch["edits"]:
+        lines.append(f"[{edit['key']}] '{edit['find']}' → '{edit['replace']}'")
+    return {
+        "role": "assistant",
+        "content": "\n".join(lines),
+        "note": patch["note"],
+        "patch": patch["edits"],
+        "patch_status": None,
+    }
+
+def _apply_patch_message(index: int):
+    message = st.session_state.messages[index]
+    message["patch_status"] = apply_patch(message["patch"])
+    # 콜백 안에서는 st.rerun()이 동작하지 않으므로 대화상자 본문에서 처리
+    st.session_state.chat_patch_applied = index
+
+def render_patch(index: int, message: Dict):
+    """Show a patch message as a diff with an apply button"""
+    st.markdown(assistant_bubble(html.escape(message["note"] or "수정안입니다.")), unsafe_allow_html=True)
+    statuses = message.get("patch_status") or [None] * len(message["patch"])
+    for edit, status in zip(message["patch"], statuses):
+        removed = (
+            f"<div style='background:#ffebee;color:#b71c1c;padding:4px 8px;'><s>{html.escape(edit['find'])}</s></div>"
+            if edit["find"] else ""
+        )
+        st.markdown(f"""
+        <div style='margin:4px 0 8px 0;max-width:85%;font-size:0.9rem;'>
+            <b>{SECTION_LABELS[edit['key']]}</b>
+            {removed}
+            <div style='background:#e8f5e9;color:#1b5e20;padding:4px 8px;'>{html.escape(edit['replace'])}</div>
+        </div>
+        """, unsafe_allow_html=True)
+        if status not in (None, "applied"):
+            st.caption(f"⚠️ 적용하지 못했습니다: {status}")
+    if not message["patch"]:
+        return
+    if message.get("patch_status") is None:
+        st.button("수정안 적용", key=f"chat_apply_patch_{index}", on_click=_apply_patch_message,
+                  args=(index,), type="primary")
+    else:
+        applied = message["patch_status"].count("applied")
+        st.caption(f"✅ {applied}/{len(message['patch'])}개 수정이 수술 정보 폼에 반영되었습니다.")
+
+def _on_chatbot_dismiss():
+    cancel_chat_generation("dialog closed")
 
-@st.dialog("챗봇", width="large")
+try:
+    _chatbot_dialog = st.dialog("챗봇", width="large", on_dismiss=_on_chatbot_dismiss)
+except TypeError:
+    # on_dismiss가 없는 Streamlit 버전: 다음 입력이나 중단된 실행에서 취소됨
+    _chatbot_dialog = st.dialog("챗봇", width="large")
+
+@_chatbot_dialog
 def chatbot_modal():
     # Initialize session state at the beginning of the modal
     initialize_session_state()
+
+    # 대화상자는 자신만 다시 실행되므로, 수정안을 적용했으면 앱 전체를 다시 실행해 뒤의 폼에 반영
+    # (대화상자는 닫힘)
+    applied_index = st.session_state.pop("chat_patch_applied", None)
+    if applied_index is not None:
+        statuses = st.session_state.messages[applied_index].get("patch_status") or []
+        if "applied" in statuses:
+            st.session_state.chat_patch_notice = (
+                f"✅ 챗봇 수정안 {statuses.count('applied')}/{len(statuses)}개가 폼에 반영되었습니다."
+            )
+            st.rerun()
     
     st.markdown("#### AI 수술 동의서 작성 도우미")
     
+    refresh_index = st.session_state.pop("chat_refresh_index", None)
+    
     # ✅ DISPLAY CHAT MESSAGES
     for i, message in enumerate(st.session_state.messages):
+        if i == refresh_index and message.get("cached"):
+            # 저장된 답변 대신 새로 생성해 같은 자리에 표시
+            question = message["question"]
+            # 비슷한 질문으로 찾은 답변이면 원래 저장된 질문의 항목을 지움
+            if scope := _answer_scope():
+                get_answer_cache().invalidate(*scope, message["cached_question"])
+            response = get_streaming_response(
+                st.session_state.messages[:i], st.empty(), cache_question=question
+            )
+            message = {"role": "assistant", "content": response}
+            st.session_state.messages[i] = message
+            continue
+        if message.get("patch") is not None:
+            render_patch(i, message)
+            continue
         if message["role"] == "user":
             st.markdown(f"""
             <div style='background:#e3f2fd;color:#0d47a1;padding:10px 14px;border-radius:12px 12px 2px 12px;margin-bottom:8px;max-width:85%;margin-left:auto;'>
@@ -107,12 +339,15 @@ def chatbot_modal():
             </div>
             """, unsafe_allow_html=True)
         else:
-            st.markdown(f"""
-            <div style='background:#e8f5e9;color:#176d36;padding:10px 14px;border-radius:12px 12px 12px 2px;margin-bottom:8px;max-width:85%;'>
-                {message['content']}
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(assistant_bubble(message['content']), unsafe_allow_html=True)
+            if message.get("cached"):
+                badge_col, refresh_col = st.columns([4, 1])
+                with badge_col:
+                    st.caption(f"⚡ 저장된 답변 ({message['cached_at']} 저장)")
+                with refresh_col:
+                    st.button("새로 받기", key=f"chat_refresh_{i}", on_click=_request_refresh, args=(i,))
     
+    new_patch_index = None
     # ✅ CHAT INPUT FORM - ONLY THIS USES st.rerun()
     with st.form("chat_form"):
         prompt = st.text_input(
@@ -123,6 +358,12 @@ def chatbot_modal():
         )
         
         col1, col2 = st.columns([3, 1])
+        with col1:
+            patch_mode = st.toggle(
+                "수정안 모드",
+                key="chat_patch_mode",
+                help="현재 항목 내용을 보내고, 바뀌는 문장만 받아 폼에 바로 적용합니다."
+            )
         with col2:
             submitted = st.form_submit_button("전송", use_container_width=True)
         
@@ -130,18 +371,55 @@ def chatbot_modal():
             # Add user message
             st.session_state.messages.append({"role": "user", "content": prompt})
             
-            # Create placeholder for streaming response
-            response_placeholder = st.empty()
-            
-            # Get streaming response and update in real-time
-            with st.spinner("AI가 실시간으로 답변을 생성하고 있습니다..."):
-                response = get_streaming_response(st.session_state.messages, response_placeholder)
+            # 검색이 필요한 질문만 compound 모델로, 단순 문장 수정은 빠른 모델로
+            route = None if patch_mode else get_chat_router().route(prompt)
             
-            # Add final response to session state
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            if patch_mode:
+                with st.spinner("수정안을 만들고 있습니다..."):
+                    st.session_state.messages.append(get_patch_response(st.session_state.messages))
+                new_patch_index = len(st.session_state.messages) - 1
+            # 같은 수술/진단에 대해 이미 받은 (비슷한) 질문이면 저장된 답변을 바로 사용
+            # 문장 수정 요청은 대화 맥락에 따라 답이 달라지므로 저장하지 않음
+            elif (route["route"] == ROUTE_SEARCH and (scope := _answer_scope())
+                    and (cached := get_answer_cache().get(*scope, prompt))):
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": cached["answer"],
+                    "cached": True,
+                    "question": prompt,
+                    "cached_question": cached["question"],
+                    "cached_at": datetime.fromtimestamp(cached["stored_at"]).strftime("%m/%d %H:%M"),
+                })
+                st.markdown(assistant_bubble(cached["answer"]), unsafe_allow_html=True)
+                st.caption("⚡ 저장된 답변입니다. 새로 받으려면 답변 아래의 '새로 받기'를 눌러주세요.")
+            else:
+                # 로컬 교과서에서 근거를 찾으면 웹 검색 없이 발췌를 주고 답변
+                passages = _textbook_passages(prompt) if route["route"] == ROUTE_SEARCH else []
+                if passages:
+                    route = get_chat_router().reroute(route, ROUTE_TEXTBOOK)
+                
+                # Create placeholder for streaming response
+                response_placeholder = st.empty()
+                
+                # Get streaming response and update in real-time
+                with st.spinner("AI가 실시간으로 답변을 생성하고 있습니다..."):
+                    response = get_streaming_response(
+                        st.session_state.messages, response_placeholder,
+                        cache_question=prompt if route["route"] != ROUTE_FAST else None,
+                        route=route,
+                        passages=passages,
+                    )
+                
+                # Add final response to session state
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            st.session_state.chat_memory.after_turn(st.session_state.messages, SYSTEM_PROMPT)
             st.session_state.chatbot_input_key += 1
             # ✅ ONLY RERUN FOR FORM SUBMISSION TO CLEAR INPUT
     
+    # 적용 버튼은 폼 안에 둘 수 없으므로 새 수정안은 폼 아래에 표시
+    if new_patch_index is not None:
+        render_patch(new_patch_index, st.session_state.messages[new_patch_index])
+    
     
     
 
@@ -149,6 +427,8 @@ def page_surgery_info():
     st.set_page_config(layout="wide")
     # Initialize session state at the beginning of the page
     initialize_session_state()
+    if notice := st.session_state.pop("chat_patch_notice", None):
+        st.toast(notice)
     # 여백 제거 및 container 최대 폭 확장
     st.markdown("""
         <style>
@@ -172,6 +452,8 @@ def page_surgery_info():
     )
     col1, col2, col3 = st.columns([1, 6, 1])
     with col2:  # Place all content in the middle column
+        # 백그라운드에서 생성 중인 동의서가 있으면 진행 상황 표시 및 완료 시 반영
+        render_consent_job_status()
 
         tabs = st.tabs(["수술 정보", "출처 보기"])
 
@@ -275,35 +557,8 @@ def page_surgery_info():
                     st.session_state.step = 2
                     st.rerun()
         with tabs[1]:  # 출처 탭
-            #st.markdown("## 📚 각 항목별 출처")
-            # 참조한 정보 리스트 : api 연결시 여기에 실시간으로 받아오면 될듯듯
-            references = [
-                {
-                    "url": "https://blog.naver.com/nahye24/221922…",
-                    "name": "네이버 블로그 | 나애리 세상",
-                    "desc": "다양한 자료를 참고하게 되는 데 전문성을 갖춘 참고문헌이 많고…"
-                },
-                {
-                    "url": "https://citation.sawoo.com/ref/guide/apa",
-                    "name": "citation.sawoo.com",
-                    "desc": "스타일 출처표기법 가이드 - Chicago, APA, MLA, Vancouver"
-                },
-                {
-                    "url": "https://allforyoung.com/users/%EC%9A…",
-                    "name": "allforyoung.com",
-                    "desc": "대학생 보고서 작성 시 인용할 자료가 한두 가지가 아닙니다. 잘못된 표기 방법은 레포트의 신뢰도를 떨어뜨려요."
-                },
-                # 필요한 만큼 더 추가...
-            ]
-
-            # 루프 돌며 번호·링크·이름·설명 출력
-            for i, ref in enumerate(references, start=1):
-                st.markdown(f"""
-                <div style="margin-bottom:1.5rem;">
-                    <strong>{i}. <a href="{ref['url']}" target="_blank">{ref['name']}</a></strong><br>
-                    <span style="color:#555;">{ref['desc']}</span>
-                </div>
-                """, unsafe_allow_html=True)
+            # 로컬 교과서 색인에서 항목별 근거 발췌를 검색해 표시
+            render_textbook_references()
 
     with col3:
         st.markdown("""
@@ -1,206 +1,182 @@
 # pages/possum_calculator.py
+import pandas as pd
 import streamlit as st
-import math
-
-# POSSUM physiological variables with proper scoring options
-physiological_variables = {
-    "Age": {
-        "options": ["≤ 60", "61-70", "≥ 71"],
-        "scores": [1, 2, 4]
-    },
-    "Cardiac signs | Chest X-ray": {
-        "options": [
-            "Normal",
-            "Cardiac drugs or steroids", 
-            "Oedema; warfarin | Borderline cardiomegaly",
-            "Jugular venous pressure | Cardiomegaly"
-        ],
-        "scores": [1, 2, 4, 8]
-    },
-    "Respiratory signs | Chest X-ray": {
-        "options": [
-            "Normal",
-            "Shortness of breath on exertion | Mild chronic obstructive airway disease",
-            "Shortness of breath on stairs | Moderate chronic obstructive airway disease", 
-            "Shortness of breath at rest | Any other change"
-        ],
-        "scores": [1, 2, 4, 8]
-    },
-    "Systolic blood pressure (mmHg)": {
-        "options": ["110-130", "131-170 or 100-109", "≥ 171 or 90-99", "≤ 89"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Pulse rate (bpm)": {
-        "options": ["50-80", "81-100 or 40-49", "101-120 or ≤ 39", "≥ 121"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Glasgow Coma Scale": {
-        "options": ["15", "12-14", "9-11", "≤ 8"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Hemoglobin (g/dL)": {
-        "options": [
-            "13-16 (male), 11.5-14.5 (female)",
-            "10-12.9 or 16.1-17",
-            "8-9.9 or 17.1-18",
-            "≤ 7.9 or ≥ 18.1"
-        ],
-        "scores": [1, 2, 4, 8]
-    },
-    "White cell count (×10⁹/L)": {
-        "options": ["4-10", "10.1-20 or 3.1-3.9", "≥ 20.1 or ≤ 3", "N/A"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Urea (mmol/L)": {
-        "options": ["≤ 7.5", "7.6-10", "10.1-15", "≥ 15.1"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Sodium (mmol/L)": {
-        "options": ["≥ 136", "131-135", "126-130", "≤ 125"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Potassium (mmol/L)": {
-        "options": ["3.5-5", "3.2-3.4 or 5.1-5.3", "2.9-3.1 or 5.4-5.9", "≤ 2.8 or ≥ 6"],
-        "scores": [1, 2, 4, 8]
-    },
-    "ECG": {
-        "options": [
-            "Normal",
-            "Atrial fibrillation (rate 60-90)",
-            "Other arrhythmia or minor abnormality", 
-            "Ventricular arrhythmia or multiple abnormalities"
-        ],
-        "scores": [1, 2, 4, 8]
-    }
+
+from services.possum_banding import RAW_BANDS, SEX_COLUMNS, band_columns, band_value, is_female
+from services.possum_engine import (
+    MODEL_P_POSSUM,
+    MODEL_POSSUM,
+    OPERATIVE,
+    OPERATIVE_VARIABLES,
+    PHYSIOLOGICAL,
+    PHYSIOLOGICAL_VARIABLES,
+    score_case,
+)
+
+# 변수 정의는 services/possum_engine.py에서 관리 (CLI와 공유)
+physiological_variables = PHYSIOLOGICAL_VARIABLES
+operative_variables = OPERATIVE_VARIABLES
+
+MODEL_LABELS = {
+    MODEL_P_POSSUM: "P-POSSUM (Portsmouth)",
+    MODEL_POSSUM: "POSSUM (original)",
 }
 
-# Operative variables
-operative_variables = {
-    "Operative severity": {
-        "options": ["Minor", "Intermediate", "Major", "Major+"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Multiple procedures": {
-        "options": ["No", "Yes, 2 procedures", "Yes, major procedure", "Yes, >1 major procedure"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Total blood loss (ml)": {
-        "options": ["< 100", "100-500", "501-999", "≥ 1000"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Peritoneal soiling": {
-        "options": ["None", "Minor (serous fluid)", "Local pus", "Free pus or blood or feces"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Presence of malignancy": {
-        "options": ["None", "Primary only", "Nodal mets", "Distant mets"],
-        "scores": [1, 2, 4, 8]
-    },
-    "Timing of surgery": {
-        "options": ["Elective", "Emergency (within 24h)", "Emergency (within 6h)", "Emergency (immediate)"],
-        "scores": [1, 2, 4, 8]
-    }
+# 선택지 표시 문자열 "라벨 (점수)"를 미리 만들어 둠
+OPTION_LABELS = {
+    name: {option: f"{option} ({score})" for option, score in zip(data["options"], data["scores"])}
+    for name, data in {**PHYSIOLOGICAL_VARIABLES, **OPERATIVE_VARIABLES}.items()
 }
 
+# 소수점 한 자리로 입력받는 검사값 (나머지는 정수)
+DECIMAL_VALUES = {"Hemoglobin (g/dL)", "White cell count (×10⁹/L)", "Urea (mmol/L)", "Potassium (mmol/L)"}
+
 def get_score(variable_name, variable_type):
     """Get the score for a selected option"""
     key_prefix = "physio_" if variable_type == "physiological" else "opera_"
     selected_option = st.session_state.get(f"{key_prefix}{variable_name}", None)
-    variable_data = physiological_variables[variable_name] if variable_type == "physiological" else operative_variables[variable_name]
-    if selected_option and selected_option in variable_data["options"]:
-        option_index = variable_data["options"].index(selected_option)
-        return variable_data["scores"][option_index]
-    return 0
+    table = PHYSIOLOGICAL if variable_type == "physiological" else OPERATIVE
+    return table.score_of(variable_name, selected_option)
 
-def main():
-    #여백 제거 및 container 최대 폭 확장
-    st.markdown("""
-        <style>
-        .block-container {
-            padding: 0rem;
-            max-width: 100% !important;
-            margin-bottom: 1rem;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    _, col, _ = st.columns([1, 6, 1])
-
-    with col:
-        st.title("POSSUM Calculator")
-        st.subheader("Physiological and Operative Severity Score for the enUmeration of Mortality and Morbidity")
-        
-        # Physiological Score Section
-        st.header("Physiological Score")
-        physiological_score = 0
-        
-        for i, (var_name, var_data) in enumerate(physiological_variables.items(), 1):
-            st.markdown(f"**{i}. {var_name}**")
-            selected = st.radio(
-                f"Select option for {var_name}:",
-                options=var_data["options"],
-                key=f'physio_{var_name}',
-                format_func=lambda x, scores=var_data["scores"], options=var_data["options"]: 
-                    f"{x} ({scores[options.index(x)]})" if x in options else x
-            )
-            if selected:
-                physiological_score += get_score(var_name, "physiological")
-            st.write("")  # Add spacing
-        
-        st.write(f"**Total Physiological Score: {physiological_score}**")
-        st.write("")
-        
-        # Operative Score Section
-        st.header("Operative Score")
-        operative_score = 0
-        
-        for i, (var_name, var_data) in enumerate(operative_variables.items(), 1):
-            st.markdown(f"**{i}. {var_name}**")
-            selected = st.radio(
-                f"Select option for {var_name}:",
-                options=var_data["options"],
-                key=f'opera_{var_name}',
-                format_func=lambda x, scores=var_data["scores"], options=var_data["options"]: 
-                    f"{x} ({scores[options.index(x)]})" if x in options else x
-            )
-            if selected:
-                operative_score += get_score(var_name, "operative")
-            st.write("")  # Add spacing
-        
-        st.write(f"**Total Operative Score: {operative_score}**")
-        st.write("")
-        
-        # Calculate Risk
-        if st.button("Calculate Risk", type="primary"):
-            if physiological_score > 0 and operative_score > 0:
-                # POSSUM equations
-                # Mortality: ln(R1/(1-R1)) = -9.065 + 0.1692 * physiological + 0.1550 * operative
-                # Morbidity: ln(R2/(1-R2)) = -5.91 + 0.16 * physiological + 0.19 * operative
-                
-                logit_mortality = -9.065 + 0.1692 * physiological_score + 0.1550 * operative_score
-                logit_morbidity = -5.91 + 0.16 * physiological_score + 0.19 * operative_score
-                
-                mortality_risk = 1 / (1 + math.exp(-logit_mortality))
-                morbidity_risk = 1 / (1 + math.exp(-logit_morbidity))
-                
-                st.session_state['possum_results'] = {
-                    'mortality': mortality_risk,
-                    'morbidity': morbidity_risk
-                }
-                
-                st.subheader("Predicted Risk")
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.metric("Mortality Risk", f"{mortality_risk:.2%}")
-                with col2:
-                    st.metric("Morbidity Risk", f"{morbidity_risk:.2%}")
+def current_selections():
+    """{variable name: selected option} from the calculator's radio keys"""
+    selections = {name: st.session_state.get(f"physio_{name}") for name in physiological_variables}
+    selections.update({name: st.session_state.get(f"opera_{name}") for name in operative_variables})
+    return selections
+
+def _apply_raw_values():
+    """Band the entered lab values and pre-select the matching options"""
+    sex = st.session_state.get("raw_sex")
+    for name in RAW_BANDS:
+        option = band_value(name, st.session_state.get(f"raw_{name}"), sex)
+        if option is not None:
+            st.session_state[f"physio_{name}"] = option
+
+def _read_lab_export(uploaded):
+    if uploaded.name.lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(uploaded)
+    return pd.read_csv(uploaded)
+
+def _fill_from_export(frame, row):
+    """Copy one row of a lab export into the value inputs and options"""
+    for name, band in RAW_BANDS.items():
+        column = next((c for c in band.columns if c in frame), None)
+        if column is not None:
+            value = pd.to_numeric(frame[column].iloc[row], errors="coerce")
+            st.session_state[f"raw_{name}"] = None if pd.isna(value) else float(value)
+    sex = next((frame[c].iloc[row] for c in SEX_COLUMNS if c in frame), None)
+    if sex is not None:
+        st.session_state.raw_sex = "F" if is_female(sex) else "M"
+    _apply_raw_values()
+
+def render_lab_values():
+    """Raw lab/vital inputs and lab-export import that pre-fill the banded options"""
+    with st.expander("Lab values", expanded=True):
+        uploaded = st.file_uploader("Import lab export (CSV / Parquet)", type=["csv", "parquet"],
+                                    key="possum_lab_export")
+        if uploaded is not None:
+            frame = _read_lab_export(uploaded)
+            # 모든 행을 열 단위로 한 번에 구간화해서 미리 보기
+            banded = pd.DataFrame(band_columns(frame))
+            if banded.empty:
+                st.warning("No lab columns found (expected e.g. sbp, pulse, gcs, hb, wbc, urea, na, k, age_years).")
             else:
-                st.error("Please complete all physiological and operative assessments before calculating risk.")
-        
-        # Return to Basic Info
-        if st.button("← Return to Basic Info"):
-            st.session_state.show_possum = False
-            st.rerun()
+                st.dataframe(pd.concat([frame.iloc[:, :1], banded], axis=1), hide_index=True)
+                row = st.selectbox("Patient row", range(len(frame)),
+                                   format_func=lambda i: f"{i + 1}. {frame.iloc[i, 0]}")
+                st.button("Fill from lab export", on_click=_fill_from_export, args=(frame, row))
+
+        # 값 입력 중에는 다시 실행하지 않고 적용할 때 한 번만 구간화
+        with st.form("possum_lab_values", border=False):
+            st.radio("Sex (for haemoglobin)", ["M", "F"], key="raw_sex", horizontal=True)
+            columns = st.columns(3)
+            for i, (name, band) in enumerate(RAW_BANDS.items()):
+                decimal = name in DECIMAL_VALUES
+                with columns[i % 3]:
+                    st.number_input(name, min_value=0.0, value=None, key=f"raw_{name}",
+                                    step=0.1 if decimal else 1.0, format="%.1f" if decimal else "%.0f")
+            st.form_submit_button("Apply lab values", on_click=_apply_raw_values)
+
+def _input_keys():
+    keys = [f"physio_{name}" for name in physiological_variables]
+    keys += [f"opera_{name}" for name in operative_variables]
+    keys += [f"raw_{name}" for name in RAW_BANDS]
+    return keys + ["raw_sex", "possum_model"]
+
+def _restore_inputs():
+    """Put back the inputs of the last time the calculator was open"""
+    # 대화상자가 닫히면 위젯 상태가 지워지므로 별도 키에 보관했다가 복원
+    for key, value in st.session_state.get("possum_inputs", {}).items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+def _keep_inputs():
+    st.session_state.possum_inputs = {key: st.session_state[key] for key in _input_keys() if key in st.session_state}
+
+def _score_radios(variables, prefix):
+    for i, (var_name, var_data) in enumerate(variables.items(), 1):
+        st.radio(
+            f"**{i}. {var_name}**",
+            options=var_data["options"],
+            key=f"{prefix}{var_name}",
+            format_func=OPTION_LABELS[var_name].get,
+        )
+
+def render_calculator():
+    """Lab values, the 18 POSSUM variables, a live total and a save button.
+
+    Call it inside a fragment or dialog so that each click reruns only the
+    calculator; saving writes possum_results and reruns the app once.
+    """
+    _restore_inputs()
+    render_lab_values()
+
+    # Physiological Score Section
+    st.header("Physiological Score")
+    _score_radios(physiological_variables, "physio_")
+
+    # Operative Score Section
+    st.header("Operative Score")
+    _score_radios(operative_variables, "opera_")
+
+    model = st.radio(
+        "Mortality model",
+        options=list(MODEL_LABELS),
+        format_func=MODEL_LABELS.get,
+        key="possum_model",
+        horizontal=True,
+    )
+    # POSSUM / P-POSSUM equations (services/possum_engine.py)
+    result = score_case(current_selections(), model)
+    _keep_inputs()
+
+    st.subheader("Predicted Risk")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Physiological Score", result["physiological_score"])
+    col2.metric("Operative Score", result["operative_score"])
+    col3.metric("Mortality Risk", f"{result['mortality']:.2%}")
+    col4.metric("Morbidity Risk", f"{result['morbidity']:.2%}")
+
+    if st.button("Save to Basic Info", type="primary", disabled=not result["complete"]):
+        st.session_state['possum_results'] = {
+            'mortality': result["mortality"],
+            'morbidity': result["morbidity"],
+            'model': model,
+            # 챗봇 요청 대기열 우선순위에 사용
+            'timing': st.session_state.get('opera_Timing of surgery')
+        }
+        st.rerun()
+
+@st.dialog("POSSUM Calculator", width="large")
+def possum_dialog():
+    st.caption("Physiological and Operative Severity Score for the enUmeration of Mortality and Morbidity")
+    render_calculator()
+
+def main():
+    """Standalone page: streamlit run possum_calculator.py"""
+    st.title("POSSUM Calculator")
+    st.subheader("Physiological and Operative Severity Score for the enUmeration of Mortality and Morbidity")
+    st.fragment(render_calculator)()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""Local cache of chatbot answers per surgery and diagnosis.
+
+Clinicians ask the same questions about the same operation over and over,
+and each one is a fresh compound-beta call with web search. Answers are
+stored in SQLite keyed by (surgery, diagnosis, normalized question). A
+question that misses the exact key is compared against the stored questions
+for the same pair with local n-gram embeddings, and a close enough match is
+served instead. Entries expire after a TTL and the least recently used ones
+are evicted past a size limit.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+from services.consent_cache import CACHE_DIR
+from services.text_embedding import embed_one, normalize_text
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("SURGIFORM_ANSWER_CACHE_TTL", str(3 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("SURGIFORM_ANSWER_CACHE_SIZE", "2000"))
+# 이 값 이상의 코사인 유사도면 같은 질문으로 간주
+SIMILARITY_THRESHOLD = float(os.getenv("SURGIFORM_ANSWER_CACHE_SIMILARITY", "0.85"))
+
+
+def answer_key(surgery_name, diagnosis, question):
+    canonical = "\x1f".join([surgery_name or "", diagnosis or "", normalize_text(question)])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """SQLite answer store with exact and embedding-similarity lookup"""
+
+    def __init__(self, db_path, ttl=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, threshold=SIMILARITY_THRESHOLD):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answer_cache ("
+            " key TEXT PRIMARY KEY, surgery TEXT, diagnosis TEXT, question TEXT NOT NULL,"
+            " embedding BLOB NOT NULL, answer TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS answer_cache_pair ON answer_cache (surgery, diagnosis)"
+        )
+        self._db.commit()
+
+    def get(self, surgery_name, diagnosis, question):
+        """Return {"answer", "question", "similarity", "stored_at"} or None"""
+        now = time.time()
+        key = answer_key(surgery_name, diagnosis, question)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, question, answer, stored_at FROM answer_cache"
+                " WHERE key = ? AND stored_at >= ?", (key, now - self.ttl),
+            ).fetchone()
+            exact, similarity = row is not None, 1.0
+            if not exact:
+                row, similarity = self._most_similar(surgery_name, diagnosis, question, now)
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["exact_hits" if exact else "similar_hits"] += 1
+            self._db.execute("UPDATE answer_cache SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._db.commit()
+        return {"question": row[1], "answer": row[2], "stored_at": row[3], "similarity": similarity}
+
+    def put(self, surgery_name, diagnosis, question, answer):
+        now = time.time()
+        key = answer_key(surgery_name, diagnosis, question)
+        embedding = embed_one(question).tobytes()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answer_cache"
+                " (key, surgery, diagnosis, question, embedding, answer, stored_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, surgery_name, diagnosis, question, embedding, answer, now, now),
+            )
+            self._db.execute("DELETE FROM answer_cache WHERE stored_at < ?", (now - self.ttl,))
+            # 크기 상한을 넘으면 가장 오래 사용되지 않은 항목부터 삭제
+            self._db.execute(
+                "DELETE FROM answer_cache WHERE key IN ("
+                " SELECT key FROM answer_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+            self._stats["stores"] += 1
+
+    def invalidate(self, surgery_name, diagnosis, question):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM answer_cache WHERE key = ?",
+                (answer_key(surgery_name, diagnosis, question),),
+            )
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._db.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+        lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _most_similar(self, surgery_name, diagnosis, question, now):
+        rows = self._db.execute(
+            "SELECT key, question, answer, stored_at, embedding FROM answer_cache"
+            " WHERE surgery IS ? AND diagnosis IS ? AND stored_at >= ?",
+            (surgery_name, diagnosis, now - self.ttl),
+        ).fetchall()
+        if not rows:
+            return None, 0.0
+        matrix = np.stack([np.frombuffer(row[4], dtype=np.float32) for row in rows])
+        scores = matrix @ embed_one(question)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None, float(scores[best])
+        return rows[best][:4], float(scores[best])
+
+
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(os.path.join(CACHE_DIR, "answer_cache.sqlite3"))
@@ -0,0 +1,181 @@
+"""Server-side rasterizer for st_canvas drawings (fabric.js JSON).
+
+In vector mode the confirmation page keeps only the stroke JSON of each
+canvas; nothing else travels over the websocket or sits in the session.
+PNGs are rendered here when they are actually needed: a thumbnail for a
+collapsed canvas, or a high-resolution image for the PDF.
+
+Free-draw paths (M/L/Q/C/Z commands) and lines are supported, including
+objects moved, scaled or rotated with the canvas edit toggle. Curves are
+flattened into short segments and drawn supersampled with Pillow, then
+downscaled for antialiasing. Rendered PNGs are cached by a hash of the JSON
+and the scale, so each drawing is rasterized once per size.
+"""
+import collections
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 1이면 획 JSON만 주고받고 PNG는 서버에서 필요할 때 그림 (0이면 브라우저가 매번 RGBA 이미지를 보냄)
+CANVAS_VECTOR = os.getenv("SURGIFORM_CANVAS_VECTOR", "1") != "0"
+CANVAS_WIDTH, CANVAS_HEIGHT = 750, 200
+BACKGROUND = "#f9f9f9"
+# 안티에일리어싱을 위해 이 배율로 그린 뒤 줄임
+SUPERSAMPLE = 2
+# 곡선 하나를 나누는 최대 선분 수와 선분 하나의 대략적인 길이(px)
+CURVE_SEGMENTS = 8
+SEGMENT_LENGTH = 2.0
+PNG_CACHE_SIZE = 512
+
+_ORIGIN = {"left": 0.0, "top": 0.0, "center": 0.5, "right": 1.0, "bottom": 1.0}
+
+_lock = threading.Lock()
+_png_cache = collections.OrderedDict()
+
+
+def _flatten(segments):
+    """(n, 2) points along cubic segments given as an (m, 4, 2) array of (start, c1, c2, end)"""
+    # 손글씨 곡선은 대부분 몇 px 길이라 경로에서 가장 긴 곡선에 맞춰 분할 수를 정함
+    length = np.abs(np.diff(segments, axis=1)).sum(axis=(1, 2)).max()
+    steps = int(max(1, min(CURVE_SEGMENTS, math.ceil(length / SEGMENT_LENGTH))))
+    t = (np.arange(1, steps + 1) / steps)[:, None]
+    u = 1 - t
+    weights = np.stack([u ** 3, 3 * u * u * t, 3 * u * t * t, t ** 3], axis=-1)[..., 0, :]
+    points = np.einsum("sk,mkd->msd", weights, segments).reshape(-1, 2)
+    return np.vstack([segments[:1, 0], points])
+
+
+def path_polylines(commands):
+    """(n, 2) arrays, one per subpath, in path coordinates from fabric.js path commands"""
+    subpaths, segments = [], []
+    position = start = (0.0, 0.0)
+
+    def close_subpath():
+        if segments:
+            subpaths.append(_flatten(np.asarray(segments, dtype=np.float64)))
+            segments.clear()
+
+    for command in commands:
+        op, args = command[0], [float(a) for a in command[1:]]
+        if op == "M":
+            close_subpath()
+            position = start = (args[0], args[1])
+            subpaths.append(np.asarray([position]))
+            continue
+        if op == "L":
+            end = (args[0], args[1])
+            segments.append((position, position, end, end))
+        elif op == "Q":
+            # 2차 곡선을 같은 모양의 3차 곡선으로 바꿔 한 번에 계산
+            (cx, cy), end = (args[0], args[1]), (args[2], args[3])
+            c1 = (position[0] + 2 / 3 * (cx - position[0]), position[1] + 2 / 3 * (cy - position[1]))
+            c2 = (end[0] + 2 / 3 * (cx - end[0]), end[1] + 2 / 3 * (cy - end[1]))
+            segments.append((position, c1, c2, end))
+        elif op == "C":
+            end = (args[4], args[5])
+            segments.append((position, (args[0], args[1]), (args[2], args[3]), end))
+        elif op in ("Z", "z"):
+            end = start
+            segments.append((position, position, end, end))
+        else:
+            continue
+        position = end
+    close_subpath()
+    # M 뒤에 곡선이 이어지면 시작점만 있는 배열은 버림
+    return [line for i, line in enumerate(subpaths)
+            if len(line) > 1 or i + 1 == len(subpaths) or len(subpaths[i + 1]) == 1]
+
+
+def _transform(obj):
+    """(matrix, translation) mapping path coordinates to canvas coordinates"""
+    offset = obj.get("pathOffset")
+    if offset is None or "left" not in obj:
+        # 위치 정보가 없으면 경로 좌표를 캔버스 좌표로 그대로 사용
+        return np.eye(2), np.zeros(2)
+    stroke = float(obj.get("strokeWidth", 0) or 0)
+    scale_x, scale_y = float(obj.get("scaleX", 1)), float(obj.get("scaleY", 1))
+    width = (float(obj.get("width", 0)) + stroke) * scale_x
+    height = (float(obj.get("height", 0)) + stroke) * scale_y
+    angle = math.radians(float(obj.get("angle", 0) or 0))
+    rotation = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+    # left/top은 (회전된) 기준점 위치이므로 중심점을 구한 뒤 중심 기준으로 변환
+    anchor = np.array([
+        (0.5 - _ORIGIN.get(obj.get("originX", "left"), 0.0)) * width,
+        (0.5 - _ORIGIN.get(obj.get("originY", "top"), 0.0)) * height,
+    ])
+    center = np.array([float(obj["left"]), float(obj["top"])]) + rotation @ anchor
+    scale = np.diag([scale_x * (-1 if obj.get("flipX") else 1), scale_y * (-1 if obj.get("flipY") else 1)])
+    matrix = rotation @ scale
+    return matrix, center - matrix @ np.array([float(offset["x"]), float(offset["y"])])
+
+
+def _object_polylines(obj):
+    kind = obj.get("type")
+    if kind == "path":
+        lines = path_polylines(obj.get("path") or [])
+    elif kind == "line":
+        # fabric Line의 x1..y2는 객체 중심 기준 좌표
+        obj = {**obj, "pathOffset": {"x": 0, "y": 0}}
+        lines = [np.array([[obj.get("x1", 0), obj.get("y1", 0)], [obj.get("x2", 0), obj.get("y2", 0)]],
+                          dtype=np.float64)]
+    else:
+        return []
+    matrix, translation = _transform(obj)
+    return [line @ matrix.T + translation for line in lines]
+
+
+def rasterize(json_data, scale=1.0, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, background=BACKGROUND):
+    """PIL image of a canvas drawing at scale × the canvas size"""
+    factor = scale * SUPERSAMPLE
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    image = Image.new("RGB", size, background)
+    draw = ImageDraw.Draw(image)
+    for obj in (json_data or {}).get("objects", []):
+        if obj.get("visible") is False:
+            continue
+        color = obj.get("stroke") or "#000000"
+        stroke = max(1, round(float(obj.get("strokeWidth", 1) or 1) * float(obj.get("scaleX", 1)) * factor))
+        radius = stroke / 2
+        for line in _object_polylines(obj):
+            points = line * factor
+            if len(points) > 1:
+                # joint="curve"는 꼭짓점마다 원을 그려 수 배 느림; 잘게 나눈 곡선이라 이음새가 보이지 않음
+                draw.line(points.ravel().tolist(), fill=color, width=stroke)
+            # 둥근 끝 (펜 모양)
+            for x, y in (points[0], points[-1]):
+                draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    if SUPERSAMPLE > 1:
+        image = image.reduce(SUPERSAMPLE)
+    return image
+
+
+def drawing_digest(json_data):
+    text = json.dumps(json_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def render_png(json_data, scale=1.0):
+    """PNG bytes of a drawing, rendered once per (drawing, scale)"""
+    key = (drawing_digest(json_data), scale)
+    with _lock:
+        if key in _png_cache:
+            _png_cache.move_to_end(key)
+            return _png_cache[key]
+    buffer = io.BytesIO()
+    rasterize(json_data, scale).save(buffer, format="PNG")
+    png = buffer.getvalue()
+    with _lock:
+        _png_cache[key] = png
+        while len(_png_cache) > PNG_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+    return png
+
+
+def has_strokes(json_data):
+    return bool(json_data and json_data.get("objects"))
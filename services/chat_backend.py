@@ -0,0 +1,269 @@
+"""Cancellable chatbot generations on a shared asyncio loop.
+
+Groq calls run as tasks on one background event loop (AsyncGroq) instead of
+blocking the Streamlit script thread for the whole answer. Each session has
+at most one live generation: starting a new one, closing the chat dialog or
+an interrupted script run cancels the previous task, which closes its HTTP
+stream so the request stops counting against the rate limit. The script
+thread only reads the text accumulated so far.
+
+Before calling Groq a generation takes a ticket from the model's rate-limit
+scheduler (services/groq_scheduler.py) and waits for its turn; the script
+thread can show the ticket's queue position meanwhile. A 429 puts the ticket
+back in line instead of failing the answer.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+from groq import AsyncGroq, RateLimitError
+
+from services.chat_memory import estimate_tokens
+from services.groq_scheduler import (
+    PRIORITY_ELECTIVE,
+    RATE_LIMIT_RETRIES,
+    TicketCancelled,
+    get_groq_scheduler,
+)
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 취소 지연 통계로 보관하는 최근 샘플 수
+CANCEL_SAMPLES = 200
+# 대기 중인 티켓이 배정됐는지 확인하는 간격(초)
+QUEUE_POLL_SECONDS = 0.1
+
+
+class ChatGeneration:
+    """One model call; text grows while streaming"""
+
+    def __init__(self, session_id, stream):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.stream = stream
+        self.status = RUNNING
+        self.text = ""
+        self.completion = None
+        self.error = None
+        self.created_at = time.perf_counter()
+        self.cancel_requested_at = None
+        self.cancel_reason = None
+        self.task = None
+        self.scheduler = None
+        self.ticket = None
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status != RUNNING
+
+    @property
+    def queued(self):
+        """Still waiting for the rate-limit scheduler"""
+        return self.ticket is not None and not self.ticket.granted and not self.finished
+
+    def _settle(self, _future=None):
+        # 코루틴이 시작되기 전에 취소되면 _run이 상태를 정리하지 못함
+        if self.status == RUNNING:
+            self.status = CANCELLED
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def iter_text(self, poll=0.5):
+        """Yield new text as it arrives until the generation ends"""
+        sent = 0
+        while True:
+            with self._changed:
+                if len(self.text) == sent and not self.finished:
+                    self._changed.wait(poll)
+            text, finished = self.text, self.finished
+            if len(text) > sent:
+                yield text[sent:]
+                sent = len(text)
+            elif finished:
+                return
+
+    def wait(self, timeout=None):
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+
+class ChatBackend:
+    """Background event loop running at most one generation per session"""
+
+    def __init__(self, api_key, scheduler_for=None):
+        self._api_key = api_key
+        # model → GroqScheduler; None이면 대기열 없이 바로 호출
+        self._scheduler_for = scheduler_for
+        self._client = None
+        self._live = {}
+        self._lock = threading.Lock()
+        self._metrics = {"started": 0, "completed": 0, "failed": 0, "cancelled": 0, "rate_limited": 0}
+        self._cancel_latencies = []
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="chat-backend", daemon=True).start()
+
+    def start(self, session_id, stream=True, priority=PRIORITY_ELECTIVE, **request):
+        """Cancel the session's live generation and start a new one.
+
+        priority orders the call in the model's rate-limit queue (lower first).
+        """
+        self.cancel(session_id, "superseded")
+        generation = ChatGeneration(session_id, stream)
+        scheduler = self._scheduler_for(request["model"]) if self._scheduler_for else None
+        if scheduler is not None:
+            # 예상 토큰: 입력 메시지 + 최대 출력
+            tokens = sum(estimate_tokens(m["content"]) for m in request.get("messages", []))
+            tokens += request.get("max_tokens") or 0
+            generation.scheduler = scheduler
+            generation.ticket = scheduler.enqueue(session_id, priority, max(1, tokens))
+        with self._lock:
+            self._live[session_id] = generation
+            self._metrics["started"] += 1
+        generation.task = asyncio.run_coroutine_threadsafe(
+            self._run(generation, request), self._loop
+        )
+        generation.task.add_done_callback(generation._settle)
+        return generation
+
+    def cancel(self, session_id, reason="cancelled"):
+        """Cancel whatever the session has running"""
+        with self._lock:
+            generation = self._live.get(session_id)
+        return generation is not None and self.cancel_generation(generation, reason)
+
+    def cancel_generation(self, generation, reason="cancelled"):
+        with self._lock:
+            if self._live.get(generation.session_id) is generation:
+                del self._live[generation.session_id]
+        if generation.finished or generation.cancel_requested_at is not None:
+            return False
+        generation.cancel_requested_at = time.perf_counter()
+        generation.cancel_reason = reason
+        if generation.ticket is not None and not generation.ticket.granted:
+            generation.scheduler.cancel(generation.ticket)
+        generation.task.cancel()
+        return True
+
+    def queue_position(self, generation):
+        """1-based place in the rate-limit queue, 0 once the call has started"""
+        if not generation.queued:
+            return 0
+        return generation.scheduler.position(generation.ticket)
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            latencies = sorted(self._cancel_latencies)
+        metrics["live"] = sum(1 for g in list(self._live.values()) if not g.finished)
+        if latencies:
+            metrics["cancel_latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            metrics["cancel_latency_max_ms"] = round(latencies[-1] * 1000, 1)
+        return metrics
+
+    async def _run(self, generation, request):
+        if self._client is None:
+            # httpx 비동기 클라이언트는 이 이벤트 루프 안에서 만들어야 함
+            # 429 재시도는 SDK 대신 스케줄러 대기열에서 처리
+            self._client = AsyncGroq(api_key=self._api_key, max_retries=0)
+        response = None
+        try:
+            response = await self._call(generation, request)
+            if generation.stream:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        generation.text += chunk.choices[0].delta.content
+                        generation._notify()
+            else:
+                generation.completion = response
+                generation.text = response.choices[0].message.content or ""
+            generation.status = DONE
+        except asyncio.CancelledError:
+            generation.status = CANCELLED
+            if generation.stream and response is not None:
+                # 스트림을 닫아야 서버 쪽 생성도 멈춤
+                await response.close()
+            latency = time.perf_counter() - (generation.cancel_requested_at or time.perf_counter())
+            with self._lock:
+                self._metrics["cancelled"] += 1
+                self._cancel_latencies = (self._cancel_latencies + [latency])[-CANCEL_SAMPLES:]
+            logger.info("chat generation %s cancelled (%s) after %d chars in %.1f ms",
+                        generation.id, generation.cancel_reason, len(generation.text), latency * 1000)
+        except TicketCancelled:
+            generation.status = CANCELLED
+        except Exception as e:
+            generation.status = FAILED
+            generation.error = e
+        finally:
+            with self._lock:
+                if generation.status == DONE:
+                    self._metrics["completed"] += 1
+                elif generation.status == FAILED:
+                    self._metrics["failed"] += 1
+                if self._live.get(generation.session_id) is generation:
+                    del self._live[generation.session_id]
+            generation._notify()
+
+    async def _call(self, generation, request):
+        """Wait for the scheduler, then call Groq; 429s go back in the queue"""
+        scheduler, ticket = generation.scheduler, generation.ticket
+        if scheduler is None:
+            return await self._client.chat.completions.create(stream=generation.stream, **request)
+        attempt = 0
+        while True:
+            try:
+                while not scheduler.wait(ticket, timeout=0):
+                    await asyncio.sleep(QUEUE_POLL_SECONDS)
+            except asyncio.CancelledError:
+                scheduler.cancel(ticket)
+                raise
+            generation._notify()
+            try:
+                raw = await self._client.chat.completions.with_raw_response.create(
+                    stream=generation.stream, **request
+                )
+            except RateLimitError as e:
+                scheduler.record_rate_limited(e.response.headers)
+                with self._lock:
+                    self._metrics["rate_limited"] += 1
+                attempt += 1
+                if attempt > RATE_LIMIT_RETRIES:
+                    raise
+                scheduler.requeue(ticket)
+                generation._notify()
+                continue
+            scheduler.record_headers(raw.headers)
+            return await raw.parse()
+
+
+@st.cache_resource
+def get_chat_backend():
+    api_key = st.secrets.get("GROQ_API_KEY") or os.getenv("GROQ_API_KEY")
+    if not api_key:
+        return None
+    return ChatBackend(api_key, scheduler_for=get_groq_scheduler)
+
+
+def chat_session_id():
+    """Stable id of the current browser session"""
+    if "chat_session_id" not in st.session_state:
+        st.session_state.chat_session_id = uuid.uuid4().hex
+    return st.session_state.chat_session_id
+
+
+def cancel_chat_generation(reason="cancelled"):
+    backend = get_chat_backend()
+    if backend is not None:
+        backend.cancel(chat_session_id(), reason)
@@ -0,0 +1,174 @@
+"""Token-budgeted conversation memory for the surgery-info chatbot.
+
+Instead of sending the last N messages whatever their size, the prompt is
+filled newest-first up to a token budget. Turns that fall out of the window
+are folded into a rolling summary by a small model on a background thread,
+so the next prompt carries them in compressed form without waiting for the
+summary. The message list kept in session state is capped; only turns that
+are already in the summary are dropped.
+"""
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from groq import RateLimitError
+
+from services.groq_scheduler import PRIORITY_BACKGROUND, RATE_LIMIT_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# 시스템 프롬프트와 요약을 포함한 대화 문맥의 토큰 예산
+CONTEXT_TOKEN_BUDGET = int(os.getenv("SURGIFORM_CHAT_CONTEXT_TOKENS", "3000"))
+# 세션에 보관하는 최대 메시지 수 (요약에 반영된 오래된 메시지부터 삭제)
+MAX_STORED_MESSAGES = int(os.getenv("SURGIFORM_CHAT_MAX_MESSAGES", "40"))
+SUMMARY_MODEL = os.getenv("SURGIFORM_CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MAX_TOKENS = 400
+# 메시지마다 붙는 role/구분자 토큰
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WIDE_CHARS = re.compile(r"[ᄀ-ᇿ㄰-㆏가-힣぀-ヿ一-鿿]")
+
+SUMMARY_PROMPT = (
+    "다음은 의료진과 수술 동의서 작성 도우미의 이전 대화입니다. "
+    "기존 요약과 새 대화를 합쳐, 이후 답변에 필요한 사실(수술명, 진단명, 요청한 수정 사항, "
+    "합의된 문구)만 한국어로 간결하게 요약하세요."
+)
+
+
+def estimate_tokens(text):
+    """Rough token count: one per Hangul/CJK character, one per 4 other characters"""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + -(-(len(text) - wide) // 4)
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def groq_summarizer(client, model=SUMMARY_MODEL, scheduler=None):
+    """summarize_fn that asks a small Groq model to merge turns into the summary.
+
+    With a scheduler the call waits behind every interactive request, and a
+    429 puts it back in the scheduler's queue instead of the SDK retrying on
+    its own.
+    """
+    if scheduler is not None:
+        # SDK 자체 재시도는 스케줄러 순서를 건너뛰므로 끄고 429는 대기열에서 처리
+        client = client.with_options(max_retries=0)
+
+    def summarize(summary, turns):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+        content = f"기존 요약:\n{summary or '(없음)'}\n\n새 대화:\n{transcript}"
+        request = dict(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": content},
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        )
+        if scheduler is None:
+            completion = client.chat.completions.create(**request)
+        else:
+            tokens = estimate_tokens(SUMMARY_PROMPT) + estimate_tokens(content) + SUMMARY_MAX_TOKENS
+            ticket = scheduler.enqueue("chat-summary", PRIORITY_BACKGROUND, tokens)
+            attempt = 0
+            while True:
+                scheduler.wait(ticket)
+                try:
+                    raw = client.chat.completions.with_raw_response.create(**request)
+                    break
+                except RateLimitError as e:
+                    scheduler.record_rate_limited(e.response.headers)
+                    attempt += 1
+                    if attempt > RATE_LIMIT_RETRIES:
+                        raise
+                    scheduler.requeue(ticket)
+            scheduler.record_headers(raw.headers)
+            completion = raw.parse()
+        return completion.choices[0].message.content or summary
+    return summarize
+
+
+@st.cache_resource
+def get_summary_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+class ChatMemory:
+    """Per-session context builder; keep one in st.session_state"""
+
+    def __init__(self, summarize_fn=None, budget=CONTEXT_TOKEN_BUDGET,
+                 max_messages=MAX_STORED_MESSAGES, executor=None):
+        self.summarize_fn = summarize_fn
+        self.budget = budget
+        self.max_messages = max_messages
+        self.executor = executor
+        self.summary = ""
+        # messages[:summarized]는 summary에 반영됨
+        self.summarized = 0
+        self._future = None
+        self._future_upto = 0
+
+    def context(self, messages, system_prompt):
+        """Messages to send: system prompt, summary, then the newest turns that fit"""
+        self._collect()
+        start = self._window_start(messages, system_prompt)
+        context = [{"role": "system", "content": system_prompt}]
+        if self.summary and start > 0:
+            context.append({"role": "system", "content": f"이전 대화 요약:\n{self.summary}"})
+        context += [{"role": m["role"], "content": m["content"]} for m in messages[start:]]
+        return context
+
+    def after_turn(self, messages, system_prompt):
+        """Summarize turns that left the window and cap the stored history.
+
+        Trims messages in place. Call after the assistant reply is appended.
+        """
+        self._collect()
+        start = self._window_start(messages, system_prompt)
+        if (start > self.summarized and self._future is None
+                and self.summarize_fn is not None):
+            turns = [dict(m) for m in messages[self.summarized:start]]
+            executor = self.executor or get_summary_executor()
+            self._future = executor.submit(self.summarize_fn, self.summary, turns)
+            self._future_upto = start
+
+        excess = len(messages) - self.max_messages
+        if excess > 0:
+            # 요약에 반영되지 않은 메시지는 상한의 두 배까지만 보관
+            drop = max(min(excess, self.summarized), len(messages) - 2 * self.max_messages)
+            if drop > 0:
+                del messages[:drop]
+                self.summarized = max(0, self.summarized - drop)
+                self._future_upto = max(0, self._future_upto - drop)
+
+    def _window_start(self, messages, system_prompt):
+        remaining = self.budget - estimate_tokens(system_prompt) - MESSAGE_OVERHEAD_TOKENS
+        if self.summary:
+            remaining -= estimate_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS
+        start = len(messages)
+        while start > 0:
+            cost = message_tokens(messages[start - 1])
+            # 가장 최근 메시지는 예산을 넘더라도 항상 포함
+            if cost > remaining and start < len(messages):
+                break
+            remaining -= cost
+            start -= 1
+        return start
+
+    def _collect(self):
+        if self._future is None or not self._future.done():
+            return
+        future, self._future = self._future, None
+        try:
+            self.summary = future.result()
+            self.summarized = max(self.summarized, self._future_upto)
+        except Exception as e:
+            # 요약 실패 시 해당 구간은 다음 턴에 다시 시도
+            logger.warning("chat summary failed: %s", e)
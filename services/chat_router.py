@@ -0,0 +1,133 @@
+"""Local fast/search model routing for chatbot turns.
+
+compound-beta searches the web on every call, which is slow and burns the
+shared quota even for "make this sentence simpler". Each prompt is scored
+locally with keyword rules before the call: requests that need retrieval
+(guidelines, statistics, literature, anything "latest") go to the compound
+model, plain rewrites go to a small low-latency model. A retrieval turn that
+the local textbook index can answer is moved to the textbook route, a plain
+model given the excerpts, instead of waiting on web search. Every decision and
+the latency of the answer that followed are recorded per route, so the
+weights and the threshold can be tuned from real traffic.
+"""
+import collections
+import logging
+import os
+import re
+import threading
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+ROUTE_FAST = "fast"
+ROUTE_SEARCH = "search"
+ROUTE_TEXTBOOK = "textbook"
+
+FAST_MODEL = os.getenv("SURGIFORM_CHAT_FAST_MODEL", "llama-3.1-8b-instant")
+SEARCH_MODEL = os.getenv("SURGIFORM_CHAT_SEARCH_MODEL", "compound-beta")
+TEXTBOOK_MODEL = os.getenv("SURGIFORM_CHAT_TEXTBOOK_MODEL", "llama-3.3-70b-versatile")
+# 점수가 이 값 이상이면 검색 모델로 보냄
+ROUTE_THRESHOLD = float(os.getenv("SURGIFORM_CHAT_ROUTE_THRESHOLD", "1.0"))
+# 기록해 두는 최근 라우팅 결정 수
+RECENT_DECISIONS = 200
+
+# (패턴, 가중치): 양수는 검색 필요, 음수는 단순 문장 수정
+# 영어 단어는 \b로 감싸 operate/accurate 같은 단어 안에서 맞지 않게 함
+# (한국어는 조사가 붙으므로 경계 없이 맞춤)
+ROUTE_RULES = [
+    (r"최신|최근|업데이트|(?<!\d)20[12]\d(?!\d)|\b(?:latest|recent(?:ly)?|updated?s?)\b", 1.5),
+    (r"가이드라인|지침|권고|\b(?:guidelines?|recommendations?)\b", 1.5),
+    (r"논문|문헌|연구|근거|출처|참고|"
+     r"\b(?:study|studies|trials?|evidence|literature|references?|pubmed)\b", 1.5),
+    (r"검색|찾아|알아봐|\b(?:search|look up)\b", 2.0),
+    (r"통계|발생률|빈도|확률|사망률|합병증률|몇\s*%|퍼센트|\b(?:rates?|incidences?)\b", 1.0),
+    (r"보완|추가|빠진|누락", 0.5),
+    (r"쉽게|간단히|간결|짧게|줄여|다듬|매끄럽|자연스럽|\b(?:simpl\w*|shorten|rephrase)\b", -1.5),
+    (r"고쳐|바꿔|수정|문장|표현|어투|말투|존댓말|맞춤법|띄어쓰기|오타|번역|요약", -1.0),
+]
+_COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in ROUTE_RULES]
+
+
+def score_prompt(prompt):
+    """(score, matched patterns); higher means the turn needs retrieval"""
+    score, reasons = 0.0, []
+    for pattern, weight in _COMPILED_RULES:
+        match = pattern.search(prompt or "")
+        if match:
+            score += weight
+            reasons.append(match.group(0))
+    return score, reasons
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ChatRouter:
+    """Scores prompts and keeps per-route latency statistics"""
+
+    def __init__(self, threshold=ROUTE_THRESHOLD, fast_model=FAST_MODEL, search_model=SEARCH_MODEL,
+                 textbook_model=TEXTBOOK_MODEL):
+        self.threshold = threshold
+        self.models = {ROUTE_FAST: fast_model, ROUTE_SEARCH: search_model, ROUTE_TEXTBOOK: textbook_model}
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=RECENT_DECISIONS)
+        self._routes = {
+            route: {"count": 0, "failed": 0, "seconds": [], "ttft_seconds": []}
+            for route in self.models
+        }
+
+    def route(self, prompt):
+        """Return {"route", "model", "score", "reasons"} for a user prompt"""
+        score, reasons = score_prompt(prompt)
+        route = ROUTE_SEARCH if score >= self.threshold else ROUTE_FAST
+        decision = {"route": route, "model": self.models[route], "score": score, "reasons": reasons}
+        with self._lock:
+            self._routes[route]["count"] += 1
+            self._recent.append({"prompt": prompt[:80], **decision})
+        logger.info("chat route %s (score %.1f, %s)", route, score, ", ".join(reasons) or "-")
+        return decision
+
+    def reroute(self, decision, route):
+        """Move a decision to another route, e.g. search → textbook"""
+        with self._lock:
+            self._routes[decision["route"]]["count"] -= 1
+            self._routes[route]["count"] += 1
+        return {**decision, "route": route, "model": self.models[route], "rerouted_from": decision["route"]}
+
+    def record(self, route, seconds=None, ttft_seconds=None, failed=False):
+        """Latency of the answer generated for a routed turn"""
+        with self._lock:
+            stats = self._routes[route]
+            if failed:
+                stats["failed"] += 1
+                return
+            if seconds is not None:
+                stats["seconds"] = (stats["seconds"] + [seconds])[-RECENT_DECISIONS:]
+            if ttft_seconds is not None:
+                stats["ttft_seconds"] = (stats["ttft_seconds"] + [ttft_seconds])[-RECENT_DECISIONS:]
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                summary = {"model": self.models[route], "count": stats["count"], "failed": stats["failed"]}
+                for name in ("seconds", "ttft_seconds"):
+                    values = sorted(stats[name])
+                    if values:
+                        summary[f"p50_{name}"] = round(_percentile(values, 0.5), 3)
+                        summary[f"p95_{name}"] = round(_percentile(values, 0.95), 3)
+                result[route] = summary
+            result["threshold"] = self.threshold
+            return result
+
+    def recent(self):
+        """Latest decisions, oldest first, for reviewing the thresholds"""
+        with self._lock:
+            return list(self._recent)
+
+
+@st.cache_resource
+def get_chat_router():
+    return ChatRouter()
@@ -0,0 +1,151 @@
+"""Sentence-level citations for the generated consent sections.
+
+The references tab retrieves textbook passages per section; this module
+tells which sentence is backed by which of them. All sentences of all
+sections and all retrieved passages are embedded (text_embedding) and
+scored in one matrix product, masked so a sentence only cites passages
+retrieved for its own section. Sentences whose best passage is below the
+threshold get no marker.
+
+Results are cached per section by a hash of its text and its passage ids,
+and sentence vectors by a hash of the sentence, so after an edit only the
+sentences that changed are embedded again.
+"""
+import collections
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+from services.text_embedding import embed
+
+# 이 값 이상의 코사인 유사도여야 문장에 출처 표시
+ALIGN_THRESHOLD = float(os.getenv("SURGIFORM_CITATION_THRESHOLD", "0.3"))
+# 문장 하나에 붙이는 최대 출처 수
+MAX_CITATIONS = 2
+# 캐시에 보관하는 섹션 결과 / 문장 벡터 수
+SECTION_CACHE_SIZE = 1024
+VECTOR_CACHE_SIZE = 20000
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text or "") if s and s.strip()]
+
+
+def _digest(*parts):
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CitationAligner:
+    """Aligns section sentences to passages; keep one per process"""
+
+    def __init__(self, threshold=ALIGN_THRESHOLD, max_citations=MAX_CITATIONS):
+        self.threshold = threshold
+        self.max_citations = max_citations
+        self._lock = threading.Lock()
+        self._sections = collections.OrderedDict()
+        self._vectors = collections.OrderedDict()
+        self._stats = {"sections": 0, "section_hits": 0, "sentences_embedded": 0, "last_ms": 0.0}
+
+    def align(self, sections, passages):
+        """{key: [{"sentence", "sources": [passage index], "scores"}]} for every section.
+
+        sections maps section keys to text, passages maps the same keys to
+        the passages retrieved for them; source indices point into that list.
+        """
+        started = time.perf_counter()
+        result, todo = {}, {}
+        with self._lock:
+            for key, text in sections.items():
+                ids = [str(p.get("id")) for p in passages.get(key, [])]
+                digest = _digest(key, text or "", *ids)
+                self._stats["sections"] += 1
+                if digest in self._sections:
+                    self._sections.move_to_end(digest)
+                    self._stats["section_hits"] += 1
+                    result[key] = self._sections[digest]
+                else:
+                    todo[key] = digest
+        if todo:
+            computed = self._align_batch(
+                {key: sections[key] for key in todo}, {key: passages.get(key, []) for key in todo}
+            )
+            with self._lock:
+                for key, digest in todo.items():
+                    self._sections[digest] = computed[key]
+                while len(self._sections) > SECTION_CACHE_SIZE:
+                    self._sections.popitem(last=False)
+            result.update(computed)
+        with self._lock:
+            self._stats["last_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {key: result[key] for key in sections}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _align_batch(self, sections, passages):
+        sentences = {key: split_sentences(text) for key, text in sections.items()}
+        sentence_rows, passage_rows = [], []
+        sentence_owner, passage_owner = [], []
+        for key in sections:
+            sentence_rows += sentences[key]
+            sentence_owner += [key] * len(sentences[key])
+            passage_rows += [p["text"] for p in passages[key]]
+            passage_owner += [key] * len(passages[key])
+        result = {key: [{"sentence": s, "sources": [], "scores": []} for s in sentences[key]]
+                  for key in sections}
+        if not sentence_rows or not passage_rows:
+            return result
+
+        # 모든 문장 × 모든 발췌를 한 번에 계산하고 다른 섹션의 발췌는 가림
+        scores = self._embed(sentence_rows) @ self._embed(passage_rows).T
+        owners = np.unique(sentence_owner + passage_owner, return_inverse=True)[1]
+        sentence_section = owners[:len(sentence_rows)]
+        passage_section = owners[len(sentence_rows):]
+        scores[sentence_section[:, None] != passage_section[None, :]] = -1.0
+        best = np.argsort(-scores, axis=1, kind="stable")[:, :self.max_citations]
+
+        first_passage = {}
+        for column, key in enumerate(passage_owner):
+            first_passage.setdefault(key, column)
+        row = 0
+        for key in sections:
+            for entry in result[key]:
+                for column in best[row]:
+                    score = float(scores[row, column])
+                    if score >= self.threshold:
+                        entry["sources"].append(int(column) - first_passage[key])
+                        entry["scores"].append(round(score, 3))
+                row += 1
+        return result
+
+    def _embed(self, texts):
+        """Vectors for texts, embedding only the ones not seen before"""
+        digests = [_digest(text) for text in texts]
+        with self._lock:
+            missing = list({d: t for d, t in zip(digests, texts) if d not in self._vectors}.items())
+        if missing:
+            vectors = embed([text for _, text in missing])
+            with self._lock:
+                for (digest, _), vector in zip(missing, vectors):
+                    self._vectors[digest] = vector
+                self._stats["sentences_embedded"] += len(missing)
+        with self._lock:
+            for digest in digests:
+                self._vectors.move_to_end(digest)
+            matrix = np.stack([self._vectors[digest] for digest in digests])
+            while len(self._vectors) > VECTOR_CACHE_SIZE:
+                self._vectors.popitem(last=False)
+        return matrix
+
+
+@st.cache_resource
+def get_citation_aligner():
+    return CitationAligner()
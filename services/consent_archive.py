@@ -0,0 +1,217 @@
+"""Consent archive: one zip per signed consent.
+
+save_all_canvas_data used to write the whole consent as pretty-printed JSON
+with every canvas as image_data.tolist(), i.e. 600,000 Python ints per
+750x200 canvas. The archive keeps the same content in a zip:
+
+    manifest.json          format version, timestamp, canvas counts and an
+                           entry per canvas (which members it has, shape)
+    patient_info.json      patient_data.json as it was at signing
+    sections.json          consent section text by session key
+    strokes/<key>.json     fabric.js stroke JSON (vector canvases)
+    canvases/<key>.png     canvas raster as PNG (default), or
+    canvases/<key>.rgba    raw uint8 pixel bytes, stored uncompressed so the
+                           reader maps them without copying
+
+JSON members are deflated and compact; rasters are stored as is (PNG is
+already compressed). ConsentArchiveWriter streams each canvas into the zip
+as it is added and writes the manifest last, so only one canvas is in
+memory at a time. ConsentArchiveReader decodes canvases lazily.
+convert_legacy_json turns an existing consent_form_*.json into an archive.
+"""
+import io
+import json
+import mmap
+import struct
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+ARCHIVE_FORMAT = 1
+RASTER_PNG = "png"
+RASTER_RAW = "raw"
+# PNG 압축 수준: 손글씨 캔버스는 대부분 배경이라 1로도 충분히 작고 6보다 몇 배 빠름
+PNG_COMPRESS_LEVEL = 1
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ConsentArchiveWriter:
+    """Write a consent archive one member at a time.
+
+    Use as a context manager; the manifest is written on close. path may be
+    a file name or a writable binary file object.
+    """
+
+    def __init__(self, path, raster=RASTER_PNG, timestamp=None):
+        if raster not in (RASTER_PNG, RASTER_RAW):
+            raise ValueError(f"unknown raster format: {raster}")
+        self.raster = raster
+        self._zip = zipfile.ZipFile(path, "w")
+        self._manifest = {"format": ARCHIVE_FORMAT, "timestamp": timestamp, "raster": raster,
+                          "canvas_counts": {}, "canvases": {}}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, name, data, compress):
+        self._zip.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+
+    def write_info(self, patient_info, sections=None, canvas_counts=None):
+        self._write("patient_info.json", _dumps(patient_info or {}), compress=True)
+        self._write("sections.json", _dumps(sections or {}), compress=True)
+        self._manifest["canvas_counts"].update(canvas_counts or {})
+
+    def add_canvas(self, key, image=None, strokes=None):
+        """Store one canvas: an (h, w, c) uint8 array, its stroke JSON, or both"""
+        entry = {}
+        if strokes:
+            entry["strokes"] = f"strokes/{key}.json"
+            self._write(entry["strokes"], _dumps(strokes), compress=True)
+        if image is not None:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            entry["shape"] = list(image.shape)
+            if self.raster == RASTER_RAW:
+                entry["raw"] = f"canvases/{key}.rgba"
+                self._write(entry["raw"], image.data, compress=False)
+            else:
+                entry["png"] = f"canvases/{key}.png"
+                buffer = io.BytesIO()
+                Image.fromarray(image).save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+                self._write(entry["png"], buffer.getvalue(), compress=False)
+        if entry:
+            self._manifest["canvases"][key] = entry
+
+    def close(self):
+        if self._zip.fp is None:
+            return
+        self._write("manifest.json", _dumps(self._manifest), compress=True)
+        self._zip.close()
+
+
+class ConsentArchiveReader:
+    """Read a consent archive; canvases are decoded only when asked for"""
+
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path, "r")
+        self.manifest = json.loads(self._zip.read("manifest.json"))
+        if self.manifest.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"unsupported consent archive format: {self.manifest.get('format')}")
+        self._map = None
+        if isinstance(path, str):
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+        self._map = None
+
+    @property
+    def timestamp(self):
+        return self.manifest.get("timestamp")
+
+    @property
+    def canvas_counts(self):
+        return self.manifest.get("canvas_counts", {})
+
+    @property
+    def patient_info(self):
+        return json.loads(self._zip.read("patient_info.json"))
+
+    @property
+    def sections(self):
+        return json.loads(self._zip.read("sections.json"))
+
+    def canvas_keys(self):
+        return list(self.manifest["canvases"])
+
+    def strokes(self, key):
+        name = self.manifest["canvases"][key].get("strokes")
+        return json.loads(self._zip.read(name)) if name else None
+
+    def image(self, key):
+        """(h, w, c) uint8 array of a canvas raster, or None if it only has strokes"""
+        entry = self.manifest["canvases"][key]
+        if "raw" in entry:
+            return np.frombuffer(self._member_buffer(entry["raw"]), dtype=np.uint8).reshape(entry["shape"])
+        if "png" in entry:
+            with self._zip.open(entry["png"]) as f:
+                return np.asarray(Image.open(f))
+        return None
+
+    def _member_buffer(self, name):
+        """Bytes of a member; a view into the mapped file for stored members"""
+        info = self._zip.getinfo(name)
+        if self._map is None or info.compress_type != zipfile.ZIP_STORED:
+            return self._zip.read(name)
+        # 로컬 헤더 길이는 중앙 디렉터리 값과 다를 수 있어 헤더에서 직접 읽음
+        header = _LOCAL_HEADER.unpack_from(self._map, info.header_offset)
+        start = info.header_offset + _LOCAL_HEADER.size + header[9] + header[10]
+        return memoryview(self._map)[start:start + info.file_size]
+
+    def canvases(self):
+        """(key, image or None, strokes or None) for each canvas, decoded one at a time"""
+        for key in self.canvas_keys():
+            yield key, self.image(key), self.strokes(key)
+
+    def to_canvas_data(self):
+        """The dict collect_canvas_data builds (images as arrays, not lists)"""
+        canvas_data = {
+            "patient_info": self.patient_info,
+            "sections": self.sections,
+            "canvas_counts": dict(self.canvas_counts),
+            "canvas_drawings": {},
+            "canvas_images": {},
+            "timestamp": self.timestamp,
+        }
+        for key, image, strokes in self.canvases():
+            if strokes:
+                canvas_data["canvas_drawings"][key] = strokes
+            if image is not None:
+                canvas_data["canvas_images"][key] = image
+        return canvas_data
+
+
+def write_canvas_data(path, canvas_data, raster=RASTER_PNG):
+    """Write a collect_canvas_data dict as an archive"""
+    images = canvas_data.get("canvas_images", {})
+    drawings = canvas_data.get("canvas_drawings", {})
+    with ConsentArchiveWriter(path, raster=raster, timestamp=canvas_data.get("timestamp")) as writer:
+        writer.write_info(canvas_data.get("patient_info"), canvas_data.get("sections"),
+                          canvas_data.get("canvas_counts"))
+        for key in dict.fromkeys([*drawings, *images]):
+            writer.add_canvas(key, images.get(key), drawings.get(key))
+
+
+def convert_legacy_json(source, destination, raster=RASTER_PNG):
+    """Convert a consent_form_*.json written by the old save_all_canvas_data.
+
+    Returns the number of canvases written.
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        canvas_data = json.load(f)
+    images = canvas_data.get("canvas_images", {})
+    drawings = canvas_data.get("canvas_drawings", {})
+    with ConsentArchiveWriter(destination, raster=raster, timestamp=canvas_data.get("timestamp")) as writer:
+        writer.write_info(canvas_data.get("patient_info"), canvas_data.get("sections"),
+                          canvas_data.get("canvas_counts"))
+        keys = list(dict.fromkeys([*drawings, *images]))
+        for key in keys:
+            # 중첩 리스트는 한 캔버스씩 배열로 바꾸고 바로 버려 메모리를 아낌
+            image = images.pop(key, None)
+            writer.add_canvas(key, None if image is None else np.asarray(image, dtype=np.uint8), drawings.get(key))
+    return len(keys)
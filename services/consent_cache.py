@@ -0,0 +1,184 @@
+"""Two-tier cache for /consent responses.
+
+Consent content is generated from the surgery, diagnosis, yes/no special
+conditions, POSSUM risk, the patient's age, sex, condition and surgical site
+and the care team, so payloads that agree on all of these are served from an
+in-process LRU or a local SQLite store with TTL instead of another LLM
+generation.
+
+The key is a hash of those fields only. The patient's name, registration
+number and scheduled date never enter the key, and responses that mention
+the name or registration number are never stored, so a cached answer cannot
+leak into another patient's consent.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# 키에 들어가는 필드가 바뀌면 올려서 이전 항목을 무효화
+CACHE_KEY_VERSION = 2
+# POSSUM 위험도 구간 경계 (<5%, 5-15%, 15-30%, 30-50%, ≥50%)
+POSSUM_BAND_EDGES = (0.05, 0.15, 0.30, 0.50)
+
+CACHE_DIR = os.getenv("SURGIFORM_CACHE_DIR", ".cache")
+CACHE_TTL_SECONDS = int(os.getenv("SURGIFORM_CONSENT_CACHE_TTL", str(7 * 24 * 3600)))
+MEMORY_MAX_ENTRIES = int(os.getenv("SURGIFORM_CONSENT_CACHE_SIZE", "256"))
+
+
+def possum_band(risk):
+    """Bucket a POSSUM probability so nearby scores share a cache entry"""
+    if risk is None:
+        return None
+    return bisect_right(POSSUM_BAND_EDGES, float(risk))
+
+
+def _normalize_text(value):
+    return " ".join(str(value or "").split()).lower()
+
+
+def _participant(participant):
+    return {
+        "name": _normalize_text(participant.get("name")),
+        "is_lead": bool(participant.get("is_lead")),
+        "is_specialist": bool(participant.get("is_specialist")),
+        "department": _normalize_text(participant.get("department")),
+    }
+
+
+def patient_fields(payload):
+    """The patient and care-team fields of a /consent payload that reach the generated text"""
+    age = payload.get("age")
+    return {
+        "age": None if age in (None, "") else int(age),
+        "gender": _normalize_text(payload.get("gender")),
+        "site": _normalize_text(payload.get("surgical_site_mark")),
+        "condition": _normalize_text(payload.get("patient_condition")),
+        # 의료진 순서는 동의서에 그대로 나열되므로 정렬하지 않음
+        "participants": [_participant(p) for p in payload.get("participants") or []],
+    }
+
+
+def clinical_fields(payload):
+    """The subset of a /consent payload that determines the generated text"""
+    conditions = payload.get("special_conditions") or {}
+    possum = payload.get("possum_score") or {}
+    return {
+        "surgery": payload.get("surgery_name"),
+        "diagnosis": payload.get("diagnosis"),
+        "conditions": {k: _normalize_text(v) for k, v in sorted(conditions.items())},
+        "mortality_band": possum_band(possum.get("mortality_risk")),
+        "morbidity_band": possum_band(possum.get("morbidity_risk")),
+        **patient_fields(payload),
+    }
+
+
+def cache_key(payload):
+    canonical = json.dumps(
+        {"v": CACHE_KEY_VERSION, **clinical_fields(payload)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _mentions_identifiers(result, payload):
+    text = json.dumps(result, ensure_ascii=False)
+    for field in ("patient_name", "registration_no"):
+        value = str(payload.get(field) or "").strip()
+        if value and value in text:
+            return True
+    return False
+
+
+class ConsentCache:
+    """In-process LRU in front of a SQLite store, both with a TTL"""
+
+    def __init__(self, db_path, ttl=CACHE_TTL_SECONDS, max_entries=MEMORY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "skipped": 0}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS consent_cache ("
+            " key TEXT PRIMARY KEY, stored_at REAL NOT NULL, body TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, payload):
+        """Return the cached response body for an equivalent payload, or None"""
+        key = cache_key(payload)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+
+            row = self._db.execute(
+                "SELECT stored_at, body FROM consent_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[0] < self.ttl:
+                result = json.loads(row[1])
+                self._remember(key, row[0], result)
+                self._stats["disk_hits"] += 1
+                return result
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, payload, result):
+        if _mentions_identifiers(result, payload):
+            # 환자 식별 정보가 포함된 응답은 다른 환자에게 재사용되면 안 됨
+            with self._lock:
+                self._stats["skipped"] += 1
+            logger.info("consent response mentions patient identifiers; not cached")
+            return False
+        key = cache_key(payload)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, result)
+            self._db.execute(
+                "INSERT OR REPLACE INTO consent_cache (key, stored_at, body) VALUES (?, ?, ?)",
+                (key, stored_at, json.dumps(result, ensure_ascii=False)),
+            )
+            self._db.execute(
+                "DELETE FROM consent_cache WHERE stored_at < ?", (stored_at - self.ttl,)
+            )
+            self._db.commit()
+            self._stats["stores"] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, stored_at, result):
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+@st.cache_resource
+def get_consent_cache():
+    return ConsentCache(os.path.join(CACHE_DIR, "consent_cache.sqlite3"))
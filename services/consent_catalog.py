@@ -0,0 +1,105 @@
+"""Closed vocabularies of the basic-info form and the baseline payload."""
+
+SURGERY_NAMES = [
+    "복강경 담낭절제", "복강경 충수절제", "십이지장궤양 천공의 일차봉합",
+    "위궤양 천공으로 인한 위절제술", "소장 절제 및 문합", "회장맹장절제",
+    "결장우반절제술", "하트만 수술", "탐색개복술", "서혜부 탈장 수술", "절개탈장 수술"
+]
+
+DIAGNOSES = [
+    "Acute cholecystitis (급성담낭염)",
+    "Acute appendicitis (급성충수염)",
+    "Duodenal ulcer perforation (십이지장궤양 천공)",
+    "Gastric ulcer perforation (위궤양 천공)",
+    "Small intestine obstruction (소장 폐쇄)",
+    "Small intestine perforation (소장 천공)",
+    "Ascending colon perforation (상행결장 천공)",
+    "Transverse colon perforation (횡행결장 천공)",
+    "Sigmoid colon perforation (에스상결장 천공)",
+    "Pneumoperitoneum (기복증)",
+    "Inguinal hernia (서혜부 탈장)",
+    "Incisional hernia (절개탈장)"
+]
+
+_INTRA_ABDOMINAL = [d for d in DIAGNOSES if "hernia" not in d]
+
+# 임상적으로 의미 있는 수술명 × 진단명 조합 (템플릿 라이브러리 생성 대상)
+SURGERY_DIAGNOSES = {
+    "복강경 담낭절제": ["Acute cholecystitis (급성담낭염)"],
+    "복강경 충수절제": ["Acute appendicitis (급성충수염)"],
+    "십이지장궤양 천공의 일차봉합": [
+        "Duodenal ulcer perforation (십이지장궤양 천공)",
+        "Pneumoperitoneum (기복증)",
+    ],
+    "위궤양 천공으로 인한 위절제술": [
+        "Gastric ulcer perforation (위궤양 천공)",
+        "Pneumoperitoneum (기복증)",
+    ],
+    "소장 절제 및 문합": [
+        "Small intestine obstruction (소장 폐쇄)",
+        "Small intestine perforation (소장 천공)",
+        "Incisional hernia (절개탈장)",
+    ],
+    "회장맹장절제": [
+        "Acute appendicitis (급성충수염)",
+        "Small intestine obstruction (소장 폐쇄)",
+        "Small intestine perforation (소장 천공)",
+        "Ascending colon perforation (상행결장 천공)",
+    ],
+    "결장우반절제술": [
+        "Ascending colon perforation (상행결장 천공)",
+        "Transverse colon perforation (횡행결장 천공)",
+    ],
+    "하트만 수술": [
+        "Sigmoid colon perforation (에스상결장 천공)",
+        "Transverse colon perforation (횡행결장 천공)",
+    ],
+    "탐색개복술": _INTRA_ABDOMINAL,
+    "서혜부 탈장 수술": ["Inguinal hernia (서혜부 탈장)"],
+    "절개탈장 수술": ["Incisional hernia (절개탈장)"],
+}
+
+# 특이사항이 모두 "무"인 기본 상태 (payload의 special_conditions 키와 동일)
+DEFAULT_SPECIAL_CONDITIONS = {
+    "past_history": "무",
+    "diabetes": "무",
+    "smoking": "무",
+    "hypertension": "무",
+    "allergy": "무",
+    "cardiovascular": "무",
+    "respiratory": "무",
+    "coagulation": "무",
+    "medications": "무",
+    "renal": "무",
+    "drug_abuse": "무",
+    "other": "",
+}
+
+# 기본 조건 payload의 대표 나이/성별 (캐시 키에 들어가므로 바꾸면 기존 항목과 맞지 않음)
+BASELINE_AGE = 50
+BASELINE_GENDER = "M"
+
+
+def valid_pairs(all_pairs=False):
+    """(surgery, diagnosis) pairs to pre-generate, in form order"""
+    if all_pairs:
+        return [(s, d) for s in SURGERY_NAMES for d in DIAGNOSES]
+    return [(s, d) for s in SURGERY_NAMES for d in DIAGNOSES if d in SURGERY_DIAGNOSES[s]]
+
+
+def baseline_payload(surgery_name, diagnosis):
+    """A /consent payload with default conditions and no patient identifiers"""
+    return {
+        "registration_no": "",
+        "patient_name": "",
+        "age": BASELINE_AGE,
+        "gender": BASELINE_GENDER,
+        "scheduled_date": "",
+        "surgery_name": surgery_name,
+        "diagnosis": diagnosis,
+        "surgical_site_mark": "해당없음",
+        "participants": [],
+        "patient_condition": "Stable",
+        "special_conditions": dict(DEFAULT_SPECIAL_CONDITIONS),
+        "possum_score": {"mortality_risk": None, "morbidity_risk": None},
+    }
@@ -0,0 +1,296 @@
+"""Shared HTTP client for the consent generation backend.
+
+One client (and one keep-alive connection pool) is shared by every session
+through st.cache_resource. Failures that are safe to repeat - connection
+errors and 502/503/504 from a proxy in front of the backend - are retried
+with exponential backoff. A circuit breaker stops sending requests to a
+backend that keeps failing, so users get an error in milliseconds instead of
+after the full read timeout.
+
+stream_consent() consumes /consent/stream, which sends one event per
+finished section as NDJSON or server-sent events:
+
+    {"section": "surgery_method_content.overall_description", "content": "..."}
+    {"done": true}
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://10.104.198.155:8000"
+# 요청이 백엔드에 도달하지 못했거나 게이트웨이가 거절한 경우에만 재시도
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class ConsentAPIError(Exception):
+    """Raised when the consent backend cannot produce a usable response"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(ConsentAPIError):
+    """Raised without touching the network while the circuit is open"""
+
+
+class StreamingNotSupported(ConsentAPIError):
+    """Raised when the backend has no streaming endpoint"""
+
+
+class CircuitBreaker:
+    """Closed → open after N consecutive failures → half-open after a cool-down.
+
+    In half-open state a single trial request is let through; its outcome
+    decides whether the circuit closes again or re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def before_request(self):
+        """Raise while the circuit is open; True if this request is the half-open trial"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(
+                    f"동의서 생성 서버가 응답하지 않습니다. {remaining:.0f}초 후 다시 시도해주세요."
+                )
+            if state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError("동의서 생성 서버 상태를 확인하는 중입니다. 잠시 후 다시 시도해주세요.")
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Let the next trial through when the current one ended without an outcome"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("consent API circuit opened after %d failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ConsentClient:
+    """Pooled, retrying client for POST /consent"""
+
+    def __init__(
+        self,
+        base_url=DEFAULT_BASE_URL,
+        connect_timeout=3.05,
+        read_timeout=60.0,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        pool_size=10,
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # 재시도는 아래 _post에서 직접 처리 (urllib3 재시도는 POST를 건드리지 않음)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def generate_consent(self, payload):
+        """Return the parsed /consent response body"""
+        response = self._post("consent", payload)
+        try:
+            return response.json()
+        except ValueError:
+            raise ConsentAPIError(
+                f"동의서 생성 서버가 올바르지 않은 응답을 보냈습니다: {response.text[:200]}",
+                status_code=response.status_code,
+            )
+
+    def stream_consent(self, payload):
+        """Yield (section path, text) pairs as the backend finishes each section"""
+        try:
+            response = self._post("consent/stream", payload, stream=True)
+        except ConsentAPIError as e:
+            if e.status_code in (404, 405):
+                raise StreamingNotSupported(str(e), status_code=e.status_code)
+            raise
+        with response:
+            content_type = response.headers.get("Content-Type", "")
+            if "charset" not in content_type.lower():
+                # requests는 text/*의 기본 인코딩을 ISO-8859-1로 가정함
+                response.encoding = "utf-8"
+            if "text/event-stream" in content_type:
+                events = _iter_sse(response)
+            else:
+                events = _iter_ndjson(response)
+            try:
+                for event in events:
+                    if event.get("error"):
+                        raise ConsentAPIError(f"동의서 생성 실패: {event['error']}")
+                    if event.get("done"):
+                        return
+                    if event.get("section"):
+                        yield event["section"], event.get("content", "")
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                raise ConsentAPIError(f"동의서 스트림이 중단되었습니다: {e}")
+        raise ConsentAPIError("동의서 스트림이 완료 표시 없이 종료되었습니다.")
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _post(self, path, payload, **kwargs):
+        trial = self.breaker.before_request()
+        try:
+            return self._send(self.url(path), payload, **kwargs)
+        finally:
+            if trial:
+                # 예상치 못한 예외로 결과가 기록되지 않아도 다음 시험 요청은 보낼 수 있게 함
+                self.breaker.release_trial()
+
+    def _send(self, url, payload, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # 연결 자체가 실패한 경우 서버는 요청을 처리하지 않았으므로 재시도해도 안전
+                if last_attempt:
+                    self.breaker.record_failure()
+                    raise ConsentAPIError(f"동의서 생성 서버에 연결할 수 없습니다: {e}")
+                logger.info("consent API connection failed (attempt %d): %s", attempt + 1, e)
+                time.sleep(self._backoff(attempt))
+                continue
+            except requests.Timeout as e:
+                # 읽기 타임아웃은 서버가 이미 생성 중일 수 있으므로 재시도하지 않음
+                self.breaker.record_failure()
+                raise ConsentAPIError(f"동의서 생성 서버 응답 시간이 초과되었습니다: {e}")
+            except requests.RequestException as e:
+                # 잘못된 URL, 리디렉션 반복, 손상된 응답 등은 재시도해도 달라지지 않음
+                self.breaker.record_failure()
+                raise ConsentAPIError(f"동의서 생성 요청 중 오류가 발생했습니다: {e}")
+
+            if response.status_code in RETRYABLE_STATUS and not last_attempt:
+                logger.info("consent API returned %d (attempt %d)", response.status_code, attempt + 1)
+                response.close()
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                # 4xx는 요청 내용의 문제이므로 서버 상태와 무관
+                self.breaker.record_success()
+            if response.status_code != 200:
+                raise ConsentAPIError(
+                    f"동의서 생성 실패: {response.status_code}\n{response.text[:500]}",
+                    status_code=response.status_code,
+                )
+            return response
+
+
+def _parse_event(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise ConsentAPIError(f"동의서 스트림에서 잘못된 데이터를 받았습니다: {data[:200]}")
+
+
+def _iter_ndjson(response):
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.strip():
+            yield _parse_event(line)
+
+
+def _iter_sse(response):
+    data_lines = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            # 빈 줄이 이벤트의 끝
+            if data_lines:
+                yield _parse_event("\n".join(data_lines))
+                data_lines = []
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield _parse_event("\n".join(data_lines))
+
+
+def _setting(name, default):
+    """Read a setting from st.secrets, then the environment"""
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        # secrets.toml이 없는 환경에서는 st.secrets 접근 시 예외 발생
+        value = None
+    return value or os.getenv(name) or default
+
+
+@st.cache_resource
+def get_consent_client():
+    return ConsentClient(
+        base_url=_setting("CONSENT_API_URL", DEFAULT_BASE_URL),
+        connect_timeout=float(_setting("CONSENT_API_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(_setting("CONSENT_API_READ_TIMEOUT", 60)),
+        max_retries=int(_setting("CONSENT_API_MAX_RETRIES", 3)),
+    )
+
+
+def streaming_enabled():
+    return str(_setting("CONSENT_API_STREAMING", "1")).lower() not in ("0", "false", "no")
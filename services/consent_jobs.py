@@ -0,0 +1,515 @@
+"""Background jobs for consent generation.
+
+The /consent call is a full LLM round trip (30-60 s). Running it on the
+Streamlit script thread freezes the clinician's session and any rerun throws
+the work away, so submissions are handed to a process-wide worker pool
+instead. The session only keeps the job id; the job itself lives in the pool
+and survives reruns.
+
+Submissions are single-flight: while a job is generating, a resubmission of
+the same payload (a double click, a rerun, a second clinician on the same
+registration number) is handed the running job instead of starting another
+generation.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from services.consent_cache import cache_key, get_consent_cache, patient_fields
+from services.consent_catalog import baseline_payload
+from services.consent_client import StreamingNotSupported, get_consent_client, streaming_enabled
+from services.consent_library import load_consent_library
+
+logger = logging.getLogger(__name__)
+
+# 서버 프로세스 당 동시에 실행되는 생성 작업 수 (나머지는 대기열에서 기다림)
+MAX_CONCURRENT_JOBS = int(os.getenv("SURGIFORM_MAX_CONSENT_JOBS", "4"))
+# 수술명/진단명 선택 직후 시작하는 추측성 사전 생성이 위 작업 수 안에서 쓸 수 있는
+# 워커 수. 이만큼 실행 중이거나 쉬는 워커가 없으면 대기열에 넣지 않고 건너뜀
+MAX_SPECULATIVE_JOBS = int(os.getenv("SURGIFORM_MAX_PREFETCH_JOBS", "2"))
+# 중복 제출 판단에서 빼는 필드 (동의서 내용에 들어가지 않음)
+FLIGHT_IGNORED_FIELDS = ("scheduled_date",)
+# 완료된 작업 결과를 보관하는 시간 (초)
+JOB_RETENTION_SECONDS = 60 * 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 결과 출처
+SOURCE_BACKEND = "backend"
+SOURCE_CACHE = "cache"
+
+# /consent 응답의 consents 필드 경로 → 수술 정보 폼의 session key
+CONSENT_SECTION_KEYS = {
+    "no_surgery_prognosis": ("prognosis_without_surgery",),
+    "alternative_methods": ("alternative_treatments",),
+    "purpose": ("surgery_purpose_necessity_effect",),
+    "method_1": ("surgery_method_content", "overall_description"),
+    "method_2": ("surgery_method_content", "estimated_duration"),
+    "method_3": ("surgery_method_content", "method_change_or_addition"),
+    "method_4": ("surgery_method_content", "transfusion_possibility"),
+    "method_5": ("surgery_method_content", "surgeon_change_possibility"),
+    "complications": ("possible_complications_sequelae",),
+    "preop_care": ("emergency_measures",),
+    "mortality_risk": ("mortality_risk",),
+}
+
+
+class ConsentJob:
+    """A single consent generation request and its outcome"""
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.source = SOURCE_BACKEND
+        # 생성이 끝나기 전에 먼저 보여줄 템플릿 라이브러리의 기본 응답
+        self.baseline = None
+        # 스트리밍 중 지금까지 도착한 섹션 (consents와 같은 구조)
+        self.partial = {}
+        self.key = cache_key(payload)
+        # 중복 제출을 합치는 기준 (flight_key), 실제 제출 작업에만 설정
+        self.flight = None
+        # 사전 생성 작업은 이를 기다리는 세션 수를 세고, 0이 되면 취소
+        self.speculative = False
+        self.refs = 0
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def elapsed(self):
+        end = self.finished_at or time.time()
+        return end - self.created_at
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def flight_key(payload):
+    """Identity under which in-flight submissions are coalesced.
+
+    The whole payload except FLIGHT_IGNORED_FIELDS, so a resubmission that
+    corrects anything reaching the text (name, side, age, care team, ...)
+    starts its own generation instead of joining the stale one.
+    """
+    relevant = {k: v for k, v in payload.items() if k not in FLIGHT_IGNORED_FIELDS}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ConsentJobManager:
+    """Runs consent jobs on a bounded thread pool shared by all sessions"""
+
+    def __init__(self, request_fn, stream_fn=None, cache=None, library=None,
+                 max_workers=MAX_CONCURRENT_JOBS):
+        # 사전 생성도 같은 풀에서 돌려 서버로 가는 동시 생성 수가 max_workers를 넘지 않게 함
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="consent-job"
+        )
+        self._max_workers = max_workers
+        self._request_fn = request_fn
+        self._stream_fn = stream_fn
+        self._cache = cache
+        self._library = library
+        self._jobs = {}
+        # cache key → 진행 중인 사전 생성 작업
+        self._speculative = {}
+        # flight key → 진행 중인 제출 작업
+        self._inflight = {}
+        # 풀에 넘겨 아직 끝나지 않은 작업 수, 그중 사전 생성으로 시작한 작업의 id
+        # (이어받거나 취소해도 끝날 때까지 워커를 쓰므로 끝날 때 뺌)
+        self._active = 0
+        self._prefetch_workers = set()
+        self._metrics = {
+            "submitted": 0,
+            "coalesced": 0,
+            "prefetch_started": 0,
+            "prefetch_shared": 0,
+            "prefetch_skipped": 0,
+            "prefetch_adopted": 0,
+            "prefetch_cancelled": 0,
+        }
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        flight = flight_key(payload)
+        with self._lock:
+            self._metrics["submitted"] += 1
+            running = self._live_inflight(flight)
+            if running is not None:
+                return self._coalesce(running)
+            prefetch = self._live_speculative(cache_key(payload))
+            # 사전 생성은 대표 환자(기본 조건)로 만든 것이라 나이/성별/부위/의료진까지
+            # 같을 때만 이어받음; 아니면 세션이 사전 생성을 release하고 새로 생성함
+            if prefetch is not None and patient_fields(prefetch.payload) == patient_fields(payload):
+                prefetch.speculative = False
+                del self._speculative[prefetch.key]
+                prefetch.flight = flight
+                self._inflight[flight] = prefetch
+                self._metrics["prefetch_adopted"] += 1
+                logger.info("consent job %s adopted from prefetch", prefetch.id)
+                return prefetch.id
+
+        job = ConsentJob(payload)
+        result, source = self._lookup(payload)
+        if result is not None:
+            job.result = result
+            job.source = source
+            job.status = DONE
+            job.started_at = job.finished_at = time.time()
+        else:
+            job.baseline = self._baseline(payload)
+        with self._lock:
+            if not job.finished:
+                # 조회하는 동안 같은 제출이 먼저 등록됐으면 그 작업을 공유
+                running = self._live_inflight(flight)
+                if running is not None:
+                    return self._coalesce(running)
+                job.flight = flight
+                self._inflight[flight] = job
+                self._active += 1
+            self._prune()
+            self._jobs[job.id] = job
+        if job.finished:
+            logger.info("consent job %s served from %s", job.id, job.source)
+        else:
+            self._executor.submit(self._run, job)
+            logger.info("consent job %s queued", job.id)
+        return job.id
+
+    def prefetch(self, payload):
+        """Start a speculative generation, shared by every session asking for it.
+
+        Returns the job id, or None when nothing needs to run (the answer is
+        already stored), prefetches already hold MAX_SPECULATIVE_JOBS workers,
+        or no worker is idle; a prefetch never waits behind real jobs.
+        """
+        if self._lookup(payload)[0] is not None:
+            return None
+        if self._library is not None and self._library.exact(payload) is not None:
+            # 라이브러리에 이미 있는 기본 조건 응답은 _baseline이 그대로 보여줌
+            return None
+        key = cache_key(payload)
+        with self._lock:
+            job = self._live_speculative(key)
+            if job is not None:
+                job.refs += 1
+                self._metrics["prefetch_shared"] += 1
+                return job.id
+            if (len(self._prefetch_workers) >= MAX_SPECULATIVE_JOBS
+                    or self._active >= self._max_workers):
+                self._metrics["prefetch_skipped"] += 1
+                return None
+            job = ConsentJob(payload)
+            job.speculative = True
+            job.refs = 1
+            self._prune()
+            self._jobs[job.id] = job
+            self._speculative[key] = job
+            self._prefetch_workers.add(job.id)
+            self._active += 1
+            self._metrics["prefetch_started"] += 1
+        self._executor.submit(self._run, job)
+        logger.info("consent prefetch %s started", job.id)
+        return job.id
+
+    def release(self, job_id):
+        """Drop one session's interest in a prefetch; cancel it if nobody is left"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.speculative or job.finished:
+                return
+            job.refs -= 1
+            if job.refs > 0:
+                return
+            job.cancel_event.set()
+            self._speculative.pop(job.key, None)
+            self._metrics["prefetch_cancelled"] += 1
+        logger.info("consent prefetch %s cancelled", job.id)
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def _live_inflight(self, flight):
+        job = self._inflight.get(flight)
+        if job is None or job.finished:
+            return None
+        return job
+
+    def _coalesce(self, job):
+        self._metrics["coalesced"] += 1
+        logger.info("duplicate consent submission coalesced into job %s", job.id)
+        return job.id
+
+    def _live_speculative(self, key):
+        job = self._speculative.get(key)
+        if job is None or job.finished or job.cancel_event.is_set():
+            return None
+        return job
+
+    def _baseline(self, payload):
+        """Something to show while the patient-specific generation runs"""
+        surgery_name, diagnosis = payload.get("surgery_name"), payload.get("diagnosis")
+        if self._library is not None:
+            baseline = self._library.baseline(surgery_name, diagnosis)
+            if baseline is not None:
+                return baseline
+        if self._cache is not None and surgery_name and diagnosis:
+            # 사전 생성된 기본 조건 결과가 캐시에 있으면 그것을 먼저 표시
+            return self._cache.get(baseline_payload(surgery_name, diagnosis))
+        return None
+
+    def _lookup(self, payload):
+        """A stored response for this payload, without calling the backend.
+
+        The template library is not consulted: its entries were generated for
+        a placeholder patient, so they are only ever shown as the baseline.
+        """
+        if self._cache is not None:
+            result = self._cache.get(payload)
+            if result is not None:
+                return result, SOURCE_CACHE
+        return None, None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self):
+        """Number of jobs per status, for monitoring"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _run(self, job):
+        job.started_at = time.time()
+        try:
+            if job.cancel_event.is_set():
+                raise JobCancelled()
+            job.status = RUNNING
+            job.result = self._generate(job)
+            job.status = DONE
+            if self._cache is not None:
+                self._cache.put(job.payload, job.result)
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception("consent job %s failed", job.id)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active -= 1
+                self._prefetch_workers.discard(job.id)
+                if self._speculative.get(job.key) is job:
+                    del self._speculative[job.key]
+                if job.flight is not None and self._inflight.get(job.flight) is job:
+                    del self._inflight[job.flight]
+            logger.info(
+                "consent job %s %s in %.1fs", job.id, job.status, job.finished_at - job.started_at
+            )
+
+    def _generate(self, job):
+        if self._stream_fn is not None:
+            try:
+                stream = self._stream_fn(job.payload)
+                try:
+                    for section, text in stream:
+                        if job.cancel_event.is_set():
+                            raise JobCancelled()
+                        # 스크립트 스레드가 읽는 중일 수 있으므로 통째로 교체
+                        job.partial = _with_section(job.partial, section, text)
+                finally:
+                    # 취소 시 스트림을 닫아 백엔드 연결을 바로 반납
+                    stream.close()
+                return {"consents": job.partial}
+            except StreamingNotSupported:
+                logger.info("consent backend has no streaming endpoint; falling back to /consent")
+                self._stream_fn = None
+        # 비스트리밍 요청은 중간에 끊을 수 없으므로 끝까지 받아 캐시에 남김
+        return self._request_fn(job.payload)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        stale = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_job_manager():
+    client = get_consent_client()
+    return ConsentJobManager(
+        client.generate_consent,
+        stream_fn=client.stream_consent if streaming_enabled() else None,
+        cache=get_consent_cache(),
+        library=load_consent_library(),
+    )
+
+
+def _with_section(consents, section, text):
+    """Copy of consents with the dotted section path set to text"""
+    updated = dict(consents)
+    node = updated
+    parts = section.split(".")
+    for part in parts[:-1]:
+        node[part] = dict(node.get(part) or {})
+        node = node[part]
+    node[parts[-1]] = text
+    return updated
+
+
+def consent_sections(consents):
+    """Flatten the backend's consents dict into {session key: text}"""
+    sections = {}
+    for key, path in CONSENT_SECTION_KEYS.items():
+        value = consents
+        for part in path:
+            value = value.get(part, {}) if isinstance(value, dict) else {}
+        sections[key] = value if isinstance(value, str) else ""
+    return sections
+
+
+def apply_sections(sections):
+    """Write sections into the surgery-info session keys.
+
+    A key is only overwritten if it still holds what we last wrote there, so
+    text the clinician edited after a baseline or a streamed section arrived
+    is left alone. Returns the keys that changed.
+    """
+    written = st.session_state.setdefault("consent_written", {})
+    changed = []
+    for key, text in sections.items():
+        # 다른 페이지에 다녀오면 text_area 키가 지워지므로, 없는 키는 수정되지 않은 것으로 봄
+        if key in written and key in st.session_state and st.session_state[key] != written[key]:
+            continue
+        if written.get(key) == text and key in st.session_state:
+            continue
+        st.session_state[key] = text
+        written[key] = text
+        changed.append(key)
+    return changed
+
+
+def submit_consent_job(payload):
+    """Queue a generation for the current session and remember its job id.
+
+    If the session's prefetch was generated for the same patient fields as
+    the final payload the manager hands that job back; otherwise the
+    prefetch is released and a real generation is queued. A duplicate of the
+    session's running submission keeps its progress as is.
+    """
+    job_id = get_job_manager().submit(payload)
+    if job_id == st.session_state.get("consent_job_id"):
+        return job_id
+    prefetch_id = st.session_state.pop("consent_prefetch_job_id", None)
+    if prefetch_id and prefetch_id != job_id:
+        get_job_manager().release(prefetch_id)
+    st.session_state.consent_job_id = job_id
+    st.session_state.consent_job_applied = False
+    st.session_state.consent_written = {}
+    st.session_state.consent_baseline_shown = False
+    return job_id
+
+
+def remember_consent_scope(surgery_name, diagnosis):
+    """Keep the chosen surgery/diagnosis in plain session keys.
+
+    The selectbox keys on the basic-info page are dropped by Streamlit as
+    soon as another page runs, so later pages read the pair from here.
+    """
+    st.session_state.consent_scope = {"surgery_name": surgery_name, "diagnosis": diagnosis}
+
+
+def consent_scope():
+    """(surgery_name, diagnosis) last chosen on the basic-info page; None where unset"""
+    scope = st.session_state.get("consent_scope") or {}
+    return scope.get("surgery_name"), scope.get("diagnosis")
+
+
+def start_consent_prefetch(surgery_name, diagnosis):
+    """Speculatively generate the default-condition consent for a pair.
+
+    Replaces (and cancels, if unused elsewhere) the session's previous
+    prefetch.
+    """
+    cancel_consent_prefetch()
+    if not surgery_name or not diagnosis:
+        return None
+    job_id = get_job_manager().prefetch(baseline_payload(surgery_name, diagnosis))
+    st.session_state.consent_prefetch_job_id = job_id
+    return job_id
+
+
+def cancel_consent_prefetch():
+    job_id = st.session_state.pop("consent_prefetch_job_id", None)
+    if job_id:
+        get_job_manager().release(job_id)
+
+
+def current_consent_job():
+    job_id = st.session_state.get("consent_job_id")
+    if not job_id:
+        return None
+    return get_job_manager().get(job_id)
+
+
+def consent_job_pending():
+    """True while the session's job still has results to deliver"""
+    return bool(st.session_state.get("consent_job_id")) and not st.session_state.get(
+        "consent_job_applied", False
+    )
+
+
+def collect_consent_job():
+    """Copy whatever the session's job has produced into session state.
+
+    While the job is running this is the library baseline for its
+    surgery/diagnosis (if any) and every section streamed so far; once it
+    finishes, the full result. Returns (job, changed keys); job is None if it
+    is gone. Must run on the script thread.
+    """
+    job = current_consent_job()
+    if job is None:
+        st.session_state.consent_job_applied = True
+        return None, []
+    if st.session_state.get("consent_job_applied", False):
+        return job, []
+
+    changed = []
+    if job.baseline is not None and not st.session_state.get("consent_baseline_shown"):
+        changed += apply_sections(consent_sections(job.baseline.get("consents", {})))
+        st.session_state.consent_baseline_shown = True
+    if job.status == DONE:
+        changed += apply_sections(consent_sections(job.result.get("consents", {})))
+    elif not job.finished and job.partial:
+        streamed = {k: v for k, v in consent_sections(job.partial).items() if v}
+        changed += apply_sections(streamed)
+    if job.finished:
+        st.session_state.consent_job_applied = True
+    return job, changed
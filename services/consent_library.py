@@ -0,0 +1,97 @@
+"""Offline library of pre-generated baseline consent sections.
+
+tools/build_consent_library.py generates one /consent response per valid
+surgery × diagnosis pair with default conditions and writes it to
+consent_library/consent_library_v<N>.json. The app loads the newest version
+at startup. The entries are written for a placeholder patient (50/M, no
+site mark, no care team), so they are never a final answer: a submission
+shows the baseline for its pair at once while the patient-specific
+generation runs in the background.
+"""
+import glob
+import json
+import logging
+import os
+import re
+
+import streamlit as st
+
+from services.consent_cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_DIR = os.getenv("SURGIFORM_CONSENT_LIBRARY_DIR", "consent_library")
+LIBRARY_FORMAT = 1
+
+_VERSION_RE = re.compile(r"consent_library_v(\d+)\.json$")
+
+
+def library_path(version, library_dir=LIBRARY_DIR):
+    return os.path.join(library_dir, f"consent_library_v{version}.json")
+
+
+def library_versions(library_dir=LIBRARY_DIR):
+    """Versions present on disk, oldest first"""
+    versions = []
+    for path in glob.glob(os.path.join(library_dir, "consent_library_v*.json")):
+        match = _VERSION_RE.search(path)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+class ConsentLibrary:
+    """Baseline consent responses indexed by cache key and by pair"""
+
+    def __init__(self, version=None, entries=()):
+        self.version = version
+        self._by_key = {}
+        self._by_pair = {}
+        for entry in entries:
+            self._by_key[entry["cache_key"]] = entry
+            self._by_pair[(entry["surgery_name"], entry["diagnosis"])] = entry
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def exact(self, payload):
+        """The stored response if payload is exactly a baseline payload.
+
+        Only the default-condition prefetch asks this, to skip generating what
+        the library already holds.
+        """
+        entry = self._by_key.get(cache_key(payload))
+        return entry["result"] if entry else None
+
+    def baseline(self, surgery_name, diagnosis):
+        """The baseline response for a pair, regardless of patient conditions"""
+        entry = self._by_pair.get((surgery_name, diagnosis))
+        return entry["result"] if entry else None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != LIBRARY_FORMAT:
+            raise ValueError(f"unsupported consent library format: {data.get('format')}")
+        entries = data["entries"]
+        # 키 생성 규칙이 바뀐 경우에도 정확 일치 조회가 동작하도록 키를 다시 계산
+        for entry in entries:
+            entry["cache_key"] = cache_key(entry["payload"])
+        return cls(version=data.get("version"), entries=entries)
+
+
+@st.cache_resource
+def load_consent_library():
+    versions = library_versions()
+    if not versions:
+        logger.info("no consent library found in %s", LIBRARY_DIR)
+        return ConsentLibrary()
+    path = library_path(versions[-1])
+    try:
+        library = ConsentLibrary.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("failed to load consent library %s: %s", path, e)
+        return ConsentLibrary()
+    logger.info("loaded consent library v%s (%d entries)", library.version, len(library))
+    return library
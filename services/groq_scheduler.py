@@ -0,0 +1,274 @@
+"""Process-wide Groq rate-limit scheduler.
+
+Every session shares the same API key, so one burst of chat requests can
+exhaust the per-minute request and token quotas for everybody. Calls take a
+ticket from the scheduler of their model and wait until both token buckets
+(requests/minute, tokens/minute) can cover them. The buckets refill
+continuously and are corrected from the x-ratelimit-* headers of each
+response (tokens are per minute; Groq's request headers are per day and
+only cap what is left); a 429 pauses dispatch for its retry-after.
+
+Waiting tickets are served by priority, then arrival. Priority follows the
+POSSUM "Timing of surgery" of the session's case, so an immediate emergency
+is answered before elective cases. Waiting time slowly raises a ticket's
+priority so elective requests are never starved.
+"""
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# 낮을수록 먼저 처리
+PRIORITY_IMMEDIATE = 0
+PRIORITY_URGENT = 1
+PRIORITY_EMERGENCY = 2
+PRIORITY_ELECTIVE = 3
+PRIORITY_BACKGROUND = 4
+
+# POSSUM "Timing of surgery" 선택지 → 우선순위
+TIMING_PRIORITY = {
+    "Emergency (immediate)": PRIORITY_IMMEDIATE,
+    "Emergency (within 6h)": PRIORITY_URGENT,
+    "Emergency (within 24h)": PRIORITY_EMERGENCY,
+    "Elective": PRIORITY_ELECTIVE,
+}
+
+DEFAULT_RPM = int(os.getenv("GROQ_RPM_LIMIT", "30"))
+DEFAULT_TPM = int(os.getenv("GROQ_TPM_LIMIT", "6000"))
+# 이 시간(초)만큼 기다릴 때마다 우선순위를 한 단계 올림
+AGING_SECONDS = 20.0
+# 429 응답 뒤 다시 줄을 서는 최대 횟수
+RATE_LIMIT_RETRIES = 3
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def priority_for_timing(timing):
+    return TIMING_PRIORITY.get(timing, PRIORITY_ELECTIVE)
+
+
+def parse_duration(value):
+    """Seconds in a Groq reset header such as "2m59.56s" or "120ms" """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """Continuously refilling quota: capacity per `period` seconds"""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.period = period
+        self.level = float(capacity)
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / self.period
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def can_take(self, amount):
+        # 한 번에 용량보다 큰 요청은 버킷이 가득 찼을 때 허용
+        return self.level >= min(amount, self.capacity)
+
+    def take(self, amount):
+        self.level -= amount
+
+    def seconds_until(self, amount):
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if self.rate else 1.0
+
+    def sync(self, limit, remaining, now):
+        """Adopt the server's view of this quota"""
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(float(remaining), self.capacity)
+            self._updated = now
+
+
+class Ticket:
+    def __init__(self, seq, session_id, priority, tokens):
+        self.seq = seq
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.cancelled = False
+
+    @property
+    def granted(self):
+        return self.granted_at is not None
+
+    def effective_priority(self, now):
+        return self.priority - (now - self.enqueued_at) / AGING_SECONDS
+
+
+class TicketCancelled(Exception):
+    pass
+
+
+class GroqScheduler:
+    """Token buckets plus a priority queue of waiting calls"""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._queue = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._stats = {"granted": 0, "queued": 0, "rate_limited": 0, "cancelled": 0}
+        self._wait_total = 0.0
+
+    def enqueue(self, session_id, priority=PRIORITY_ELECTIVE, tokens=1):
+        with self._cond:
+            ticket = Ticket(next(self._seq), session_id, priority, tokens)
+            self._queue.append(ticket)
+            self._dispatch(time.monotonic())
+            if not ticket.granted:
+                self._stats["queued"] += 1
+            return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Block until the ticket is granted; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not ticket.granted:
+                if ticket.cancelled:
+                    raise TicketCancelled()
+                now = time.monotonic()
+                self._dispatch(now)
+                if ticket.granted:
+                    break
+                if deadline is not None and now >= deadline:
+                    return False
+                step = min(1.0, max(0.05, self._next_dispatch_in(now)))
+                if deadline is not None:
+                    step = min(step, deadline - now)
+                self._cond.wait(step)
+        return True
+
+    def requeue(self, ticket):
+        """Put a granted ticket back in line after a 429, keeping its age"""
+        with self._cond:
+            ticket.granted_at = None
+            if not ticket.cancelled and ticket not in self._queue:
+                self._queue.append(ticket)
+            self._cond.notify_all()
+
+    def cancel(self, ticket):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._stats["cancelled"] += 1
+            ticket.cancelled = True
+            self._cond.notify_all()
+
+    def position(self, ticket):
+        """1-based place in the dispatch order, 0 once granted"""
+        with self._cond:
+            if ticket.granted or ticket not in self._queue:
+                return 0
+            return self._ordered(time.monotonic()).index(ticket) + 1
+
+    def record_headers(self, headers):
+        """Correct the buckets from a response's x-ratelimit-* headers"""
+        if not headers:
+            return
+        now = time.monotonic()
+
+        def number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._cond:
+            # Groq의 requests 헤더는 일일 한도(RPD)이므로 남은 양으로 상한만 맞춤
+            remaining_requests = number("x-ratelimit-remaining-requests")
+            if remaining_requests is not None:
+                self.requests.refill(now)
+                self.requests.level = min(self.requests.level, remaining_requests)
+            self.tokens.sync(
+                number("x-ratelimit-limit-tokens"), number("x-ratelimit-remaining-tokens"), now
+            )
+            self._cond.notify_all()
+
+    def record_rate_limited(self, headers=None):
+        """A 429 came back: pause dispatch until retry-after"""
+        retry_after = parse_duration((headers or {}).get("retry-after")) or 2.0
+        with self._cond:
+            self._stats["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self.requests.level = min(self.requests.level, 0)
+        logger.warning("Groq rate limit hit; pausing dispatch for %.1fs", retry_after)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["waiting"] = len(self._queue)
+            stats["avg_wait_seconds"] = (
+                round(self._wait_total / stats["granted"], 3) if stats["granted"] else 0.0
+            )
+            stats["requests_available"] = round(self.requests.level, 1)
+            stats["tokens_available"] = round(self.tokens.level)
+            return stats
+
+    def _ordered(self, now):
+        return sorted(self._queue, key=lambda t: (t.effective_priority(now), t.seq))
+
+    def _dispatch(self, now):
+        if now < self._paused_until:
+            return
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        granted = False
+        for ticket in self._ordered(now):
+            # 우선순위가 높은 요청이 기다리는 동안 뒤의 요청이 새치기하지 않도록 맨 앞에서 멈춤
+            if not (self.requests.can_take(1) and self.tokens.can_take(ticket.tokens)):
+                break
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+            ticket.granted_at = now
+            self._queue.remove(ticket)
+            self._stats["granted"] += 1
+            self._wait_total += now - ticket.enqueued_at
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _next_dispatch_in(self, now):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self._queue:
+            return 1.0
+        head = self._ordered(now)[0]
+        return max(self.requests.seconds_until(1), self.tokens.seconds_until(head.tokens))
+
+
+@st.cache_resource
+def get_groq_scheduler(model):
+    """One scheduler per model, since Groq quotas are per model"""
+    return GroqScheduler()
@@ -0,0 +1,145 @@
+"""POSSUM bands from raw lab values and vital signs.
+
+Each numeric physiological variable has a sorted interval table: inclusive
+upper bounds and the option code of each interval. One value is banded with
+bisect and a whole column with np.searchsorted, so a lab export is banded a
+column at a time with no Python loop per row. Options that the calculator
+lists as "X or Y" (pulse, SBP, Hb, WCC, K) are just intervals on both sides
+of the normal range that share a code.
+
+Cardiac and respiratory signs and the ECG are not single numbers and stay
+manual.
+"""
+import bisect
+import math
+
+import numpy as np
+import pandas as pd
+
+from services.possum_engine import MISSING, PHYSIOLOGICAL
+
+# 성별 열 이름과 여성으로 보는 값 (Hb 정상 범위가 다름)
+SEX_COLUMNS = ("sex", "gender", "성별")
+FEMALE_VALUES = {"f", "female", "w", "woman", "여", "여성", "여자"}
+
+
+class RawBand:
+    """Interval table mapping a raw value to one variable's option code"""
+
+    def __init__(self, variable, unit, upper_bounds, codes, columns):
+        if len(codes) != len(upper_bounds) + 1 or list(upper_bounds) != sorted(upper_bounds):
+            raise ValueError(f"bad interval table for {variable}")
+        self.variable = variable
+        self.unit = unit
+        self.upper_bounds = list(upper_bounds)
+        self.codes = list(codes)
+        # 원시값 열 이름 (선택지 라벨 열과 겹치지 않게)
+        self.columns = columns
+        self._bounds = np.asarray(upper_bounds, dtype=np.float64)
+        # 마지막 칸은 NaN 용
+        self._codes = np.asarray(list(codes) + [MISSING], dtype=np.int8)
+
+    def code(self, value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return MISSING
+        return self.codes[bisect.bisect_left(self.upper_bounds, value)]
+
+    def encode(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        index = np.searchsorted(self._bounds, values, side="left")
+        index[np.isnan(values)] = len(self._codes) - 1
+        return self._codes[index]
+
+
+RAW_BANDS = {band.variable: band for band in [
+    RawBand("Age", "years", [60, 70], [0, 1, 2], ("age_years", "age_yr")),
+    RawBand("Systolic blood pressure (mmHg)", "mmHg",
+            [89, 99, 109, 130, 170], [3, 2, 1, 0, 1, 2], ("sbp", "systolic_bp")),
+    RawBand("Pulse rate (bpm)", "bpm",
+            [39, 49, 80, 100, 120], [2, 1, 0, 1, 2, 3], ("pulse", "heart_rate", "hr")),
+    RawBand("Glasgow Coma Scale", "",
+            [8, 11, 14], [3, 2, 1, 0], ("gcs",)),
+    RawBand("Hemoglobin (g/dL)", "g/dL",
+            [7.9, 9.9, 12.9, 16, 17, 18], [3, 2, 1, 0, 1, 2, 3], ("hb", "hgb", "hemoglobin")),
+    RawBand("White cell count (×10⁹/L)", "×10⁹/L",
+            [3, 3.9, 10, 20], [2, 1, 0, 1, 2], ("wbc", "wcc")),
+    RawBand("Urea (mmol/L)", "mmol/L",
+            [7.5, 10, 15], [0, 1, 2, 3], ("urea",)),
+    RawBand("Sodium (mmol/L)", "mmol/L",
+            [125, 130, 135], [3, 2, 1, 0], ("na", "sodium")),
+    RawBand("Potassium (mmol/L)", "mmol/L",
+            [2.8, 3.1, 3.4, 5, 5.3, 5.9], [3, 2, 1, 0, 1, 2, 3], ("k", "potassium")),
+]}
+
+# 여성 Hb는 11.5-14.5를 정상으로 보고 나머지 구간은 그대로
+FEMALE_HEMOGLOBIN = RawBand("Hemoglobin (g/dL)", "g/dL",
+                            [7.9, 9.9, 11.4, 14.5, 17, 18], [3, 2, 1, 0, 1, 2, 3], ())
+
+
+def is_female(sex):
+    return str(sex).strip().lower() in FEMALE_VALUES
+
+
+def _band(name, sex=None):
+    if name == FEMALE_HEMOGLOBIN.variable and sex is not None and is_female(sex):
+        return FEMALE_HEMOGLOBIN
+    return RAW_BANDS[name]
+
+
+def band_value(name, value, sex=None):
+    """Option label for one raw value, or None if missing"""
+    code = _band(name, sex).code(value)
+    return None if code == MISSING else PHYSIOLOGICAL.options[PHYSIOLOGICAL.names.index(name)][code]
+
+
+def _numbers(values):
+    """float64 array from a column; text that is not a number → NaN"""
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64, copy=False)
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _per_value(values, fn):
+    """fn over a column; for categoricals only over the categories, then gathered by code"""
+    if isinstance(values, pd.Series):
+        values = values.array
+    if isinstance(values, pd.Categorical):
+        # 코드 -1(NaN)은 NaN 카테고리를 덧붙여 처리
+        mapped = fn(np.append(values.categories.to_numpy(dtype=object), np.nan))
+        return mapped[values.codes]
+    return fn(np.asarray(values))
+
+
+def _find(columns, names):
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return None
+
+
+def band_columns(columns, sex=None):
+    """{variable name: pd.Categorical of option labels} for the raw columns present.
+
+    columns maps column names to arrays (a DataFrame works). Raw columns are
+    found by the names in RAW_BANDS (e.g. "sbp", "hb"); the sex for Hb comes
+    from a sex/gender column, or from sex for the whole batch.
+    """
+    sex_values = _find(columns, SEX_COLUMNS)
+    female = None
+    if sex_values is not None:
+        female = _per_value(sex_values, lambda v: pd.Series(v, dtype=object).map(is_female).to_numpy(dtype=bool))
+    elif sex is not None:
+        female = is_female(sex)
+
+    banded = {}
+    for name, band in RAW_BANDS.items():
+        values = _find(columns, band.columns)
+        if values is None:
+            continue
+        numbers = _per_value(values, _numbers)
+        codes = band.encode(numbers)
+        if name == FEMALE_HEMOGLOBIN.variable and female is not None:
+            codes = np.where(female, FEMALE_HEMOGLOBIN.encode(numbers), codes)
+        options = PHYSIOLOGICAL.options[PHYSIOLOGICAL.names.index(name)]
+        banded[name] = pd.Categorical.from_codes(codes, categories=options)
+    return banded
@@ -0,0 +1,260 @@
+"""Headless POSSUM / P-POSSUM scoring, one patient or millions at a time.
+
+Each variable's options are compiled once into a lookup table, so a batch is
+scored by encoding the selected options as small integer codes and summing
+one table gather per variable. Scores are small bounded integers, so the
+risks for every (PS, OS) pair are precomputed per model and looked up
+instead of evaluating exp per row. Nothing here imports Streamlit: the
+calculator page, the scoring CLI (tools/score_possum.py) and the benchmark
+all share it.
+
+Equations (PS = physiological score, OS = operative score):
+
+    POSSUM   mortality  ln(R/(1-R)) = -7.04  + 0.13   PS + 0.16   OS
+    P-POSSUM mortality  ln(R/(1-R)) = -9.065 + 0.1692 PS + 0.1550 OS
+    morbidity (both)    ln(R/(1-R)) = -5.91  + 0.16   PS + 0.19   OS
+"""
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+MODEL_POSSUM = "possum"
+MODEL_P_POSSUM = "p-possum"
+
+# (절편, 생리 점수 계수, 수술 점수 계수)
+MORTALITY_COEFFICIENTS = {
+    MODEL_POSSUM: (-7.04, 0.13, 0.16),
+    MODEL_P_POSSUM: (-9.065, 0.1692, 0.1550),
+}
+MORBIDITY_COEFFICIENTS = (-5.91, 0.16, 0.19)
+
+# 선택하지 않았거나 알 수 없는 선택지의 코드
+MISSING = -1
+
+# POSSUM physiological variables with proper scoring options
+PHYSIOLOGICAL_VARIABLES = {
+    "Age": {
+        "options": ["≤ 60", "61-70", "≥ 71"],
+        "scores": [1, 2, 4]
+    },
+    "Cardiac signs | Chest X-ray": {
+        "options": [
+            "Normal",
+            "Cardiac drugs or steroids",
+            "Oedema; warfarin | Borderline cardiomegaly",
+            "Jugular venous pressure | Cardiomegaly"
+        ],
+        "scores": [1, 2, 4, 8]
+    },
+    "Respiratory signs | Chest X-ray": {
+        "options": [
+            "Normal",
+            "Shortness of breath on exertion | Mild chronic obstructive airway disease",
+            "Shortness of breath on stairs | Moderate chronic obstructive airway disease",
+            "Shortness of breath at rest | Any other change"
+        ],
+        "scores": [1, 2, 4, 8]
+    },
+    "Systolic blood pressure (mmHg)": {
+        "options": ["110-130", "131-170 or 100-109", "≥ 171 or 90-99", "≤ 89"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Pulse rate (bpm)": {
+        "options": ["50-80", "81-100 or 40-49", "101-120 or ≤ 39", "≥ 121"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Glasgow Coma Scale": {
+        "options": ["15", "12-14", "9-11", "≤ 8"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Hemoglobin (g/dL)": {
+        "options": [
+            "13-16 (male), 11.5-14.5 (female)",
+            "10-12.9 or 16.1-17",
+            "8-9.9 or 17.1-18",
+            "≤ 7.9 or ≥ 18.1"
+        ],
+        "scores": [1, 2, 4, 8]
+    },
+    "White cell count (×10⁹/L)": {
+        "options": ["4-10", "10.1-20 or 3.1-3.9", "≥ 20.1 or ≤ 3", "N/A"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Urea (mmol/L)": {
+        "options": ["≤ 7.5", "7.6-10", "10.1-15", "≥ 15.1"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Sodium (mmol/L)": {
+        "options": ["≥ 136", "131-135", "126-130", "≤ 125"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Potassium (mmol/L)": {
+        "options": ["3.5-5", "3.2-3.4 or 5.1-5.3", "2.9-3.1 or 5.4-5.9", "≤ 2.8 or ≥ 6"],
+        "scores": [1, 2, 4, 8]
+    },
+    "ECG": {
+        "options": [
+            "Normal",
+            "Atrial fibrillation (rate 60-90)",
+            "Other arrhythmia or minor abnormality",
+            "Ventricular arrhythmia or multiple abnormalities"
+        ],
+        "scores": [1, 2, 4, 8]
+    }
+}
+
+# Operative variables
+OPERATIVE_VARIABLES = {
+    "Operative severity": {
+        "options": ["Minor", "Intermediate", "Major", "Major+"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Multiple procedures": {
+        "options": ["No", "Yes, 2 procedures", "Yes, major procedure", "Yes, >1 major procedure"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Total blood loss (ml)": {
+        "options": ["< 100", "100-500", "501-999", "≥ 1000"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Peritoneal soiling": {
+        "options": ["None", "Minor (serous fluid)", "Local pus", "Free pus or blood or feces"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Presence of malignancy": {
+        "options": ["None", "Primary only", "Nodal mets", "Distant mets"],
+        "scores": [1, 2, 4, 8]
+    },
+    "Timing of surgery": {
+        "options": ["Elective", "Emergency (within 24h)", "Emergency (within 6h)", "Emergency (immediate)"],
+        "scores": [1, 2, 4, 8]
+    }
+}
+
+
+class ScoreTable:
+    """Option → code dicts and a (variables × options) score matrix for one group"""
+
+    def __init__(self, variables):
+        self.names = list(variables)
+        self.options = [variables[name]["options"] for name in self.names]
+        self.option_codes = [{option: i for i, option in enumerate(options)} for options in self.options]
+        self.option_scores = [dict(zip(variables[name]["options"], variables[name]["scores"]))
+                              for name in self.names]
+        width = max(len(options) for options in self.options)
+        # 마지막 열은 MISSING(-1) 코드용 0점
+        self.scores = np.zeros((len(self.names), width + 1), dtype=np.int16)
+        for row, name in enumerate(self.names):
+            self.scores[row, :len(variables[name]["scores"])] = variables[name]["scores"]
+        self.max_total = int(self.scores.max(axis=1).sum())
+
+    def score_of(self, name, option):
+        """Points for one selected option (0 if not selected)"""
+        return self.option_scores[self.names.index(name)].get(option, 0)
+
+    def encode(self, name, values):
+        """Integer codes for an array of option labels; unknown labels → MISSING"""
+        index = self.names.index(name)
+        if isinstance(values, pd.Series):
+            values = values.array
+        if isinstance(values, pd.Categorical):
+            # 이미 범주형이면 범주 목록만 변환하고 행은 정수 gather로 처리
+            lookup = self.option_codes[index]
+            remap = np.array([lookup.get(c, MISSING) for c in values.categories] + [MISSING], dtype=np.int8)
+            return remap[values.codes]
+        categorical = pd.Categorical(np.asarray(values, dtype=object), categories=self.options[index])
+        return categorical.codes.astype(np.int8)
+
+    def total(self, codes):
+        """Row sums of the points for a (rows × variables) code matrix"""
+        codes = np.asarray(codes)
+        total = np.zeros(len(codes), dtype=np.int16)
+        for row in range(len(self.names)):
+            # MISSING(-1)은 마지막 열의 0점을 가리킴
+            total += self.scores[row].take(codes[:, row])
+        return total, codes.min(axis=1) != MISSING
+
+
+PHYSIOLOGICAL = ScoreTable(PHYSIOLOGICAL_VARIABLES)
+OPERATIVE = ScoreTable(OPERATIVE_VARIABLES)
+
+
+def _logistic(intercept, physiological_coefficient, operative_coefficient, physiological, operative):
+    logit = intercept + physiological_coefficient * np.asarray(physiological, dtype=np.float64)
+    logit = logit + operative_coefficient * np.asarray(operative, dtype=np.float64)
+    return 1.0 / (1.0 + np.exp(-logit))
+
+
+def predict(physiological_score, operative_score, model=MODEL_P_POSSUM):
+    """(mortality, morbidity) risks for scalar or array scores"""
+    mortality = _logistic(*MORTALITY_COEFFICIENTS[model], physiological_score, operative_score)
+    morbidity = _logistic(*MORBIDITY_COEFFICIENTS, physiological_score, operative_score)
+    return mortality, morbidity
+
+
+@functools.lru_cache(maxsize=None)
+def _risk_tables(model):
+    """(mortality, morbidity) for every possible (PS, OS) pair"""
+    physiological = np.arange(PHYSIOLOGICAL.max_total + 1)[:, None]
+    operative = np.arange(OPERATIVE.max_total + 1)[None, :]
+    return predict(physiological, operative, model)
+
+
+def score_codes(physiological_codes, operative_codes, model=MODEL_P_POSSUM):
+    """Score batches given as (rows × 12) and (rows × 6) option-code matrices.
+
+    Returns a dict of arrays: physiological_score, operative_score,
+    mortality, morbidity, complete (False where any variable is missing).
+    """
+    physiological, physiological_complete = PHYSIOLOGICAL.total(physiological_codes)
+    operative, operative_complete = OPERATIVE.total(operative_codes)
+    mortality_table, morbidity_table = _risk_tables(model)
+    mortality = mortality_table[physiological, operative]
+    morbidity = morbidity_table[physiological, operative]
+    return {
+        "physiological_score": physiological,
+        "operative_score": operative,
+        "mortality": mortality,
+        "morbidity": morbidity,
+        "complete": physiological_complete & operative_complete,
+    }
+
+
+def column_slug(name):
+    """snake_case column name for a variable, e.g. "Pulse rate (bpm)" → "pulse_rate_bpm" """
+    return re.sub(r"[^0-9a-z]+", "_", name.lower()).strip("_")
+
+
+def encode_columns(columns, table):
+    """(rows × variables) codes from {variable name or slug: array of option labels}"""
+    missing = [name for name in table.names if name not in columns and column_slug(name) not in columns]
+    if missing:
+        raise KeyError(f"missing POSSUM columns: {', '.join(missing)}")
+    return np.column_stack([
+        table.encode(name, columns[name] if name in columns else columns[column_slug(name)])
+        for name in table.names
+    ])
+
+
+def score_labels(columns, model=MODEL_P_POSSUM):
+    """Score a batch given as {variable name: array of option labels}"""
+    return score_codes(encode_columns(columns, PHYSIOLOGICAL), encode_columns(columns, OPERATIVE), model)
+
+
+def score_case(selections, model=MODEL_P_POSSUM):
+    """One patient from {variable name: selected option}; same keys as score_codes, as scalars"""
+    physiological = sum(PHYSIOLOGICAL.score_of(name, selections.get(name)) for name in PHYSIOLOGICAL.names)
+    operative = sum(OPERATIVE.score_of(name, selections.get(name)) for name in OPERATIVE.names)
+    mortality, morbidity = predict(physiological, operative, model)
+    complete = all(selections.get(name) in options
+                   for table in (PHYSIOLOGICAL, OPERATIVE)
+                   for name, options in zip(table.names, table.options))
+    return {
+        "physiological_score": physiological,
+        "operative_score": operative,
+        "mortality": float(mortality),
+        "morbidity": float(morbidity),
+        "complete": complete,
+    }
@@ -0,0 +1,115 @@
+"""Structured edits to the surgery-info sections proposed by the chatbot.
+
+In patch mode the model sees the current text of every section and answers
+with a small JSON object listing only the sentences to change, instead of
+rewriting whole sections in prose. The clinician reviews the edits in the
+chat and applies them to the form in one click.
+
+Patch format:
+
+    {"note": "한 줄 설명",
+     "edits": [{"key": "complications", "find": "원문 문장", "replace": "새 문장"}]}
+
+An empty "find" appends "replace" to the end of the section.
+"""
+import json
+import re
+
+import streamlit as st
+
+# 수정 가능한 수술 정보 폼 항목 (session key → 제목)
+SECTION_LABELS = {
+    "no_surgery_prognosis": "2. 예정된 수술/시술/검사를 하지 않을 경우의 예후",
+    "alternative_methods": "3. 예정된 수술 이외의 시행 가능한 다른 방법",
+    "purpose": "4. 수술 목적/필요/효과",
+    "method_1": "5-1) 수술 과정 전반에 대한 설명",
+    "method_2": "5-2) 수술 추정 소요시간",
+    "method_4": "5-4) 수혈 가능성",
+    "complications": "6. 발생 가능한 합병증/후유증/부작용",
+    "preop_care": "7. 문제 발생시 조치사항",
+    "mortality_risk": "8. 진단/수술 관련 사망 위험성",
+}
+
+PATCH_PROMPT = """수정 요청에는 아래 형식의 JSON 객체 하나로만 답하세요. 다른 설명은 쓰지 마세요.
+{"note": "무엇을 왜 바꿨는지 한 문장", "edits": [{"key": "항목 키", "find": "바꿀 원문 문장(원문 그대로)", "replace": "새 문장"}]}
+- key는 다음 중 하나입니다: """ + ", ".join(SECTION_LABELS) + """
+- 바뀌는 문장만 포함하고 나머지 문장은 절대 다시 쓰지 마세요.
+- find는 현재 항목 내용에 있는 문장을 한 글자도 바꾸지 말고 그대로 복사하세요.
+- 새 문장을 덧붙일 때는 find를 빈 문자열로 두세요.
+- 수정이 필요 없으면 edits를 빈 배열로 두고 note에 이유를 쓰세요."""
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class PatchError(ValueError):
+    pass
+
+
+def sections_context(state):
+    """Current section texts, formatted for the model"""
+    blocks = [
+        f"[{key}] {label}\n{state.get(key, '') or '(비어 있음)'}"
+        for key, label in SECTION_LABELS.items()
+    ]
+    return "현재 수술 정보 항목 내용:\n\n" + "\n\n".join(blocks)
+
+
+def parse_patch(text):
+    """Validate the model's answer; returns {"note", "edits"}"""
+    text = _CODE_FENCE.sub("", (text or "").strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise PatchError("수정안 형식(JSON)이 아닙니다.")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise PatchError(f"수정안을 해석할 수 없습니다: {e}") from e
+
+    edits = []
+    for edit in data.get("edits") or []:
+        if not isinstance(edit, dict) or edit.get("key") not in SECTION_LABELS:
+            raise PatchError(f"알 수 없는 항목입니다: {edit!r}")
+        edits.append({
+            "key": edit["key"],
+            "find": str(edit.get("find") or ""),
+            "replace": str(edit.get("replace") or ""),
+        })
+    return {"note": str(data.get("note") or ""), "edits": edits}
+
+
+def _locate(text, find):
+    """(start, end) of find in text, tolerating whitespace differences"""
+    index = text.find(find)
+    if index != -1:
+        return index, index + len(find)
+    pattern = r"\s+".join(re.escape(word) for word in find.split())
+    match = re.search(pattern, text) if pattern else None
+    if match is None:
+        raise PatchError("원문에서 바꿀 문장을 찾을 수 없습니다.")
+    return match.start(), match.end()
+
+
+def apply_edit(text, edit):
+    """text with one edit applied"""
+    if not edit["find"]:
+        separator = "\n" if text and not text.endswith("\n") else ""
+        return text + separator + edit["replace"]
+    start, end = _locate(text, edit["find"])
+    return text[:start] + edit["replace"] + text[end:]
+
+
+def apply_patch(edits, state=None):
+    """Apply edits to the section keys; returns one status string per edit.
+
+    Meant to run as an on_click callback, before the form's text areas are
+    created in the rerun.
+    """
+    state = st.session_state if state is None else state
+    statuses = []
+    for edit in edits:
+        try:
+            state[edit["key"]] = apply_edit(state.get(edit["key"], "") or "", edit)
+            statuses.append("applied")
+        except PatchError as e:
+            statuses.append(str(e))
+    return statuses
@@ -0,0 +1,173 @@
+"""Ramer–Douglas–Peucker simplification of free-draw canvas strokes.
+
+fabric.js's pencil brush keeps every mouse sample of a stroke. It writes
+them as M p0, then Q p_i mid(p_i, p_i+1) for each sample, then L p_last, so
+the samples are the control points of a chain of quadratic curves. This
+module drops the samples that lie within a tolerance (canvas px) of the
+simplified polyline and rebuilds the same M/Q/L chain from the ones kept.
+The rendered stroke therefore moves by about the tolerance at most, while
+long strokes usually keep only a fraction of their points.
+
+RDP runs level by level instead of recursively. Each pass measures every
+point that is still undecided against the chord of the interval it lies
+in, with one set of numpy operations. It then splits every interval whose
+farthest point is outside the tolerance at that point. All strokes of a
+drawing go through together, so the number of passes is the recursion
+depth of the deepest stroke, not the number of strokes.
+
+Paths that are not pencil-brush chains (edited, scaled or rotated objects,
+C commands) are left as they are.
+"""
+import os
+
+import numpy as np
+
+from services.canvas_raster import path_polylines
+
+# 허용 오차(캔버스 px). 0.75면 PDF 배율 2에서 1.5px 이내로, 점 수는 7-9배 줄어듦
+# (python -m tools.bench_stroke_simplify); 0이면 단순화하지 않음
+SIMPLIFY_TOLERANCE = float(os.getenv("SURGIFORM_CANVAS_SIMPLIFY_TOLERANCE", "0.75"))
+# fabric이 시작/끝점을 이만큼 벌려 점 하나짜리 획도 보이게 함
+_PENCIL_CORRECTION = 0.003
+
+
+def rdp_mask(points, tolerance, breaks=()):
+    """Boolean mask of the points RDP keeps.
+
+    points is an (n, 2) array. breaks are the indices where a new polyline
+    starts, so one call can simplify many strokes that are stacked together.
+    The first and last point of every polyline are always kept.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    starts = np.unique(np.concatenate([[0], np.asarray(breaks, dtype=np.intp)]))
+    keep[starts] = True
+    keep[starts[1:] - 1] = True
+    keep[-1] = True
+    if tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    index = np.arange(n)
+    pending = ~keep
+    while pending.any():
+        kept = np.flatnonzero(keep)
+        # 아직 정해지지 않은 점마다 양옆의 남긴 점을 찾아 그 현(chord)까지의 거리를 잼
+        candidates = index[pending]
+        slot = np.searchsorted(kept, candidates)
+        left, right = points[kept[slot - 1]], points[kept[slot]]
+        chord = right - left
+        length = np.einsum("ij,ij->i", chord, chord)
+        t = np.einsum("ij,ij->i", points[candidates] - left, chord) / np.where(length > 0, length, 1)
+        nearest = left + np.clip(t, 0, 1)[:, None] * chord
+        distance = np.hypot(*(points[candidates] - nearest).T)
+
+        # 구간마다 가장 먼 점; 후보는 구간 순서대로 정렬되어 있어 reduceat으로 한 번에 구함
+        first = np.flatnonzero(np.r_[True, slot[1:] != slot[:-1]])
+        farthest = np.maximum.reduceat(distance, first)
+        split = farthest > tolerance
+        if not split.any():
+            break
+        interval = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(slot)]))
+        hit = (distance == farthest[interval]) & split[interval]
+        # 같은 거리의 점이 여럿이면 구간의 첫 번째만
+        _, first_hit = np.unique(interval[hit], return_index=True)
+        keep[candidates[np.flatnonzero(hit)[first_hit]]] = True
+        # 오차 안에 든 구간의 점은 더 볼 필요 없음
+        pending[candidates[~split[interval]]] = False
+        pending &= ~keep
+    return keep
+
+
+def pencil_samples(path):
+    """(n, 2) mouse samples of a pencil-brush path, or None for any other path"""
+    if (len(path) < 3 or path[0][0] != "M" or path[-1][0] != "L"
+            or any(command[0] != "Q" or len(command) != 5 for command in path[1:-1])):
+        return None
+    curves = np.asarray([command[1:] for command in path[1:-1]], dtype=np.float64)
+    # 마지막 샘플은 마지막 곡선 끝점(중점)에서 되짚음; L 좌표에는 보정값이 더해져 있음
+    last = 2 * curves[-1, 2:] - curves[-1, :2]
+    return np.vstack([curves[:, :2], last])
+
+
+def _number(value):
+    """Coordinate as fabric writes it: an int when whole, else 3 decimals"""
+    value = round(float(value), 3)
+    return int(value) if value.is_integer() else value
+
+
+def _numbers(values):
+    return [int(v) if v.is_integer() else v for v in values]
+
+
+def pencil_path(samples, start=None, end=None):
+    """fabric.js pencil-brush path commands through samples"""
+    samples = np.asarray(samples, dtype=np.float64)
+    if start is None:
+        start = samples[0] - _PENCIL_CORRECTION
+    if end is None:
+        end = samples[-1] + _PENCIL_CORRECTION
+    # 곡선 명령의 좌표를 한 번에 반올림해 리스트로 바꿈
+    curves = np.round(np.hstack([samples[:-1], (samples[:-1] + samples[1:]) / 2]), 3).tolist()
+    path = [["M", _number(start[0]), _number(start[1])]]
+    path += [["Q", *_numbers(curve)] for curve in curves]
+    path.append(["L", _number(end[0]), _number(end[1])])
+    return path
+
+
+def _untransformed(obj):
+    return (obj.get("type") == "path" and not obj.get("angle") and not obj.get("pathOffset")
+            and float(obj.get("scaleX", 1)) == 1 and float(obj.get("scaleY", 1)) == 1
+            and obj.get("originX", "left") == "left" and obj.get("originY", "top") == "top")
+
+
+def _bounds(path):
+    points = np.vstack(path_polylines(path))
+    return points.min(axis=0), points.max(axis=0)
+
+
+def simplify_drawing(json_data, tolerance=SIMPLIFY_TOLERANCE):
+    """Copy of a canvas drawing with its pencil strokes simplified.
+
+    Returns json_data itself when nothing changes (tolerance 0, no strokes).
+    """
+    if tolerance <= 0 or not json_data or not json_data.get("objects"):
+        return json_data
+    objects = json_data["objects"]
+    strokes = []
+    for position, obj in enumerate(objects):
+        samples = pencil_samples(obj.get("path") or []) if _untransformed(obj) else None
+        if samples is not None and len(samples) > 2:
+            strokes.append((position, samples))
+    if not strokes:
+        return json_data
+
+    # 모든 획을 이어 붙여 한 번에 단순화
+    points = np.concatenate([samples for _, samples in strokes])
+    breaks = np.cumsum([len(samples) for _, samples in strokes])[:-1]
+    keep = np.split(rdp_mask(points, tolerance, breaks), breaks)
+
+    objects = list(objects)
+    for (position, samples), mask in zip(strokes, keep):
+        if mask.all():
+            continue
+        obj = objects[position]
+        path = pencil_path(samples[mask], start=obj["path"][0][1:3], end=obj["path"][-1][1:3])
+        simplified = {**obj, "path": path}
+        if "left" in obj and "width" in obj:
+            # 경계 상자가 조금 줄어들 수 있어 fabric이 다시 불러올 때 위치가 밀리지 않게 맞춤
+            (old_low, old_high), (low, high) = _bounds(obj["path"]), _bounds(path)
+            simplified["left"] = _number(obj["left"] + low[0] - old_low[0])
+            simplified["top"] = _number(obj["top"] + low[1] - old_low[1])
+            simplified["width"] = _number(obj["width"] + (high - low)[0] - (old_high - old_low)[0])
+            simplified["height"] = _number(obj["height"] + (high - low)[1] - (old_high - old_low)[1])
+        objects[position] = simplified
+    return {**json_data, "objects": objects}
+
+
+def point_count(json_data):
+    """Number of path commands in a drawing"""
+    return sum(len(obj.get("path") or []) for obj in (json_data or {}).get("objects", []))
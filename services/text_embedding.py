@@ -0,0 +1,57 @@
+"""Dependency-free text embeddings for similarity lookups on CPU.
+
+Texts are normalized, split into character n-grams (which works for Korean
+without a tokenizer or a model download), and each n-gram is hashed into a
+fixed-size vector. Vectors are L2-normalized, so a dot product is the cosine
+similarity.
+"""
+import functools
+import hashlib
+import re
+import unicodedata
+
+import numpy as np
+
+EMBEDDING_DIM = 512
+NGRAM_SIZES = (2, 3)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text):
+    """NFKC, lowercase, punctuation removed, whitespace collapsed"""
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def _ngrams(text):
+    text = f" {normalize_text(text)} "
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.strip():
+                yield gram
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _bucket(gram, dim):
+    digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    # 최하위 비트로 부호를 정해 해시 충돌이 한쪽으로 쌓이지 않게 함
+    return (value >> 1) % dim, 1.0 if value & 1 else -1.0
+
+
+def embed(texts, dim=EMBEDDING_DIM):
+    """(len(texts), dim) float32 array of unit vectors (zero rows for empty text)"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for gram in _ngrams(text):
+            index, sign = _bucket(gram, dim)
+            vectors[row, index] += sign
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def embed_one(text, dim=EMBEDDING_DIM):
+    return embed([text], dim)[0]
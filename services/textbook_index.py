@@ -0,0 +1,430 @@
+"""Local retrieval over the licensed surgical textbook chunks.
+
+The index lives in SURGIFORM_TEXTBOOK_INDEX_DIR as a list of immutable
+segments named in manifest.json. Each segment holds one ingest batch:
+
+    terms.json            term strings, position = term id
+    postings_offsets.npy  CSR offsets into the postings, per term
+    postings_docs.npy     doc numbers, sorted within each term
+    postings_tf.npy       term frequency per posting (uint16)
+    doc_len.npy           token count per doc
+    vectors.npy           float32 unit vectors (text_embedding, DENSE_DIM)
+    docs.jsonl            chunk records (text and citation fields)
+    doc_offsets.npy       byte offset of each record in docs.jsonl
+    ids.json              chunk ids, for updates
+    deleted.npy           docs replaced or removed by later batches
+
+Arrays are memory-mapped, so opening an index of a million chunks only reads
+the term lists. A query scores BM25 over the postings of its terms, reranks
+the best candidates by dense cosine similarity and fuses both rankings; when
+no query term is indexed it falls back to a full dense scan.
+
+Updates never rewrite a segment: new chunks are written as a new segment and
+older copies of the same ids are marked deleted. compact() merges everything
+back into one segment.
+"""
+import collections
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import streamlit as st
+
+from services.section_patch import SECTION_LABELS
+from services.text_embedding import embed, embed_one, normalize_text
+
+logger = logging.getLogger(__name__)
+
+TEXTBOOK_INDEX_DIR = os.getenv("SURGIFORM_TEXTBOOK_INDEX_DIR", "textbook_index")
+INDEX_FORMAT = 1
+MANIFEST = "manifest.json"
+DENSE_DIM = 256
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# BM25 후보 중 dense 유사도로 다시 순위를 매길 개수
+RERANK_CANDIDATES = 200
+# reciprocal rank fusion 상수
+RRF_K = 60
+# dense 전체 검색 시 한 번에 곱하는 행 수 (float16 변환은 행렬곱보다 느려 float32로 저장)
+SCAN_BLOCK = 65536
+# 임베딩 계산 시 한 번에 처리하는 청크 수
+EMBED_BATCH = 2048
+# 챗봇 답변에 쓸 발췌의 최소 dense 유사도
+MIN_SIMILARITY = float(os.getenv("SURGIFORM_TEXTBOOK_MIN_SIMILARITY", "0.2"))
+
+# 동의서 항목별 검색어 (수술명·진단명 뒤에 붙임)
+SECTION_QUERIES = {
+    "no_surgery_prognosis": "수술하지 않을 경우 예후 자연 경과 진행",
+    "alternative_methods": "대체 치료 방법 보존적 치료 비수술적 치료",
+    "purpose": "수술 목적 적응증 효과",
+    "method_1": "수술 방법 과정 술기 절차",
+    "method_2": "수술 소요 시간",
+    "method_4": "수혈 출혈량",
+    "complications": "합병증 부작용 후유증",
+    "preop_care": "합병증 발생 시 처치 관리",
+    "mortality_risk": "사망률 사망 위험",
+}
+
+_HANGUL = re.compile(r"[가-힣]")
+
+
+def tokenize(text):
+    """BM25 terms: words, with Hangul words split into character bigrams.
+
+    Bigrams match Korean words regardless of the particles attached to them,
+    without a morphological analyzer.
+    """
+    terms = []
+    for word in normalize_text(text).split():
+        if len(word) > 1 and _HANGUL.search(word):
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def citation(record):
+    """"source, chapter, p. page" from a chunk record"""
+    parts = [record.get("source") or "출처 미상"]
+    if record.get("chapter"):
+        parts.append(str(record["chapter"]))
+    if record.get("page") not in (None, ""):
+        parts.append(f"p. {record['page']}")
+    return ", ".join(parts)
+
+
+# ---------------------------------------------------------------- writing
+
+def write_segment(path, records, terms, pair_docs, pair_terms, pair_tf, doc_len, vectors):
+    """Write one segment from (doc, term, tf) triples, one per distinct term in a doc"""
+    os.makedirs(path)
+    pair_docs = np.asarray(pair_docs, dtype=np.int32)
+    pair_terms = np.asarray(pair_terms, dtype=np.int64)
+    order = np.lexsort((pair_docs, pair_terms))
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_terms, minlength=len(terms)), out=offsets[1:])
+
+    np.save(os.path.join(path, "postings_offsets.npy"), offsets)
+    np.save(os.path.join(path, "postings_docs.npy"), pair_docs[order])
+    np.save(os.path.join(path, "postings_tf.npy"),
+            np.minimum(np.asarray(pair_tf)[order], 65535).astype(np.uint16))
+    np.save(os.path.join(path, "doc_len.npy"), np.asarray(doc_len, dtype=np.int32))
+    np.save(os.path.join(path, "vectors.npy"), np.asarray(vectors, dtype=np.float32))
+    np.save(os.path.join(path, "deleted.npy"), np.zeros(len(records), dtype=bool))
+
+    doc_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    with open(os.path.join(path, "docs.jsonl"), "wb") as f:
+        for i, record in enumerate(records):
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            doc_offsets[i + 1] = f.tell()
+    np.save(os.path.join(path, "doc_offsets.npy"), doc_offsets)
+    with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+    with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump([str(record["id"]) for record in records], f, ensure_ascii=False)
+
+
+def build_segment(path, chunks, dim=DENSE_DIM, vectors=None):
+    """Tokenize and embed chunk dicts ({"id", "text", citation fields}) into a segment"""
+    vocab = {}
+    pair_docs, pair_terms, pair_tf, doc_len = [], [], [], []
+    for doc, chunk in enumerate(chunks):
+        counts = collections.Counter(tokenize(chunk["text"]))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            pair_docs.append(doc)
+            pair_terms.append(vocab.setdefault(term, len(vocab)))
+            pair_tf.append(tf)
+    if vectors is None:
+        vectors = np.zeros((len(chunks), dim), dtype=np.float32)
+        for start in range(0, len(chunks), EMBED_BATCH):
+            batch = chunks[start:start + EMBED_BATCH]
+            vectors[start:start + len(batch)] = embed([c["text"] for c in batch], dim)
+    write_segment(path, chunks, list(vocab), pair_docs, pair_terms, pair_tf, doc_len, vectors)
+
+
+def read_manifest(index_dir=TEXTBOOK_INDEX_DIR):
+    try:
+        with open(os.path.join(index_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(index_dir, manifest):
+    manifest["version"] = manifest.get("version", 0) + 1
+    manifest["updated_at"] = time.time()
+    tmp = os.path.join(index_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    # 읽는 쪽은 항상 완전한 manifest만 보도록 원자적으로 교체
+    os.replace(tmp, os.path.join(index_dir, MANIFEST))
+
+
+def _new_manifest(dim):
+    return {"format": INDEX_FORMAT, "dim": dim, "segments": [], "next_segment": 0, "version": 0}
+
+
+def _mark_deleted(index_dir, manifest, ids):
+    """Flag docs with these ids in existing segments; returns how many"""
+    ids = set(ids)
+    marked = 0
+    for name in manifest["segments"]:
+        path = os.path.join(index_dir, name)
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            hits = [i for i, chunk_id in enumerate(json.load(f)) if chunk_id in ids]
+        if not hits:
+            continue
+        deleted = np.load(os.path.join(path, "deleted.npy"))
+        marked += int((~deleted[hits]).sum())
+        deleted[hits] = True
+        # np.save는 .npy를 붙이므로 임시 파일 이름도 .npy로 끝나야 함
+        np.save(os.path.join(path, "deleted.tmp.npy"), deleted)
+        os.replace(os.path.join(path, "deleted.tmp.npy"), os.path.join(path, "deleted.npy"))
+    return marked
+
+
+def add_chunks(chunks, index_dir=TEXTBOOK_INDEX_DIR, dim=DENSE_DIM):
+    """Index chunks as a new segment; earlier chunks with the same id are replaced"""
+    # 같은 배치 안에서 id가 겹치면 마지막 것을 사용
+    chunks = list({str(c["id"]): {**c, "id": str(c["id"])} for c in chunks}.values())
+    if not chunks:
+        return 0
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = read_manifest(index_dir) or _new_manifest(dim)
+    name = f"seg_{manifest['next_segment']:05d}"
+    build_segment(os.path.join(index_dir, name), chunks, manifest["dim"])
+    replaced = _mark_deleted(index_dir, manifest, [c["id"] for c in chunks])
+    manifest["segments"].append(name)
+    manifest["next_segment"] += 1
+    _write_manifest(index_dir, manifest)
+    logger.info("textbook index: +%d chunks in %s (%d replaced)", len(chunks), name, replaced)
+    return len(chunks)
+
+
+def delete_chunks(ids, index_dir=TEXTBOOK_INDEX_DIR):
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        return 0
+    removed = _mark_deleted(index_dir, manifest, ids)
+    _write_manifest(index_dir, manifest)
+    return removed
+
+
+def compact(index_dir=TEXTBOOK_INDEX_DIR):
+    """Merge all live chunks into one segment and drop the old ones"""
+    manifest = read_manifest(index_dir)
+    if manifest is None or not manifest["segments"]:
+        return 0
+    index = TextbookIndex(index_dir)
+    chunks, vectors = [], []
+    for segment in index.segments:
+        live = np.flatnonzero(~segment.deleted)
+        chunks.extend(segment.record(i) for i in live)
+        vectors.append(np.asarray(segment.vectors[live]))
+    old = list(manifest["segments"])
+    name = f"seg_{manifest['next_segment']:05d}"
+    build_segment(os.path.join(index_dir, name), chunks, manifest["dim"], np.concatenate(vectors))
+    manifest["segments"] = [name]
+    manifest["next_segment"] += 1
+    _write_manifest(index_dir, manifest)
+    for segment_name in old:
+        shutil.rmtree(os.path.join(index_dir, segment_name), ignore_errors=True)
+    return len(chunks)
+
+
+# ---------------------------------------------------------------- reading
+
+class _Segment:
+    def __init__(self, path):
+        self.path = path
+
+        def load(name, mmap=True):
+            return np.load(os.path.join(path, name), mmap_mode="r" if mmap else None)
+
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.offsets = load("postings_offsets.npy")
+        self.docs = load("postings_docs.npy")
+        self.tf = load("postings_tf.npy")
+        self.vectors = load("vectors.npy")
+        self.doc_offsets = load("doc_offsets.npy", mmap=False)
+        self.doc_len = load("doc_len.npy", mmap=False)
+        self.deleted = load("deleted.npy", mmap=False)
+        self.has_deleted = bool(self.deleted.any())
+        # BM25 길이 정규화 항, 전체 평균 길이를 알게 된 뒤 채움
+        self.norm = None
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def df(self, term):
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+
+    def postings(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None, None
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.docs[start:end], self.tf[start:end]
+
+    def record(self, doc):
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            f.seek(self.doc_offsets[doc])
+            return json.loads(f.read(self.doc_offsets[doc + 1] - self.doc_offsets[doc]))
+
+
+def _top(scores, count):
+    """Indices of the `count` highest positive scores, best first"""
+    if len(scores) > count:
+        candidates = np.argpartition(-scores, count)[:count]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[scores[candidates] > 0]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class TextbookIndex:
+    """Read-only view of the segments named in the manifest"""
+
+    def __init__(self, index_dir=TEXTBOOK_INDEX_DIR):
+        manifest = read_manifest(index_dir)
+        if manifest is None:
+            raise FileNotFoundError(os.path.join(index_dir, MANIFEST))
+        self.index_dir = index_dir
+        self.version = manifest["version"]
+        self.dim = manifest["dim"]
+        self.segments = [_Segment(os.path.join(index_dir, name)) for name in manifest["segments"]]
+
+        live_docs, live_len = 0, 0
+        for segment in self.segments:
+            live = ~segment.deleted
+            live_docs += int(live.sum())
+            live_len += int(segment.doc_len[live].sum())
+        self.size = live_docs
+        avgdl = live_len / live_docs if live_docs else 1.0
+        for segment in self.segments:
+            segment.norm = (BM25_K1 * (1 - BM25_B + BM25_B * segment.doc_len / avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query, k=5, candidates=RERANK_CANDIDATES):
+        """Top-k passages: record fields plus "score", "bm25", "similarity", "citation" """
+        vector = embed_one(query, self.dim)
+        hits = self._bm25(collections.Counter(tokenize(query)), candidates)
+        if hits:
+            similarities = self._similarities(hits, vector)
+        else:
+            hits = self._dense_scan(vector, candidates)
+            similarities = [score for _, _, score in hits]
+            hits = [(s, d, 0.0) for s, d, _ in hits]
+
+        # BM25 순위와 dense 순위를 reciprocal rank fusion으로 결합
+        dense_rank = {i: rank for rank, i in enumerate(np.argsort(-np.asarray(similarities), kind="stable"))}
+        fused = sorted(
+            (
+                (1 / (RRF_K + rank + 1) + 1 / (RRF_K + dense_rank[rank] + 1), rank)
+                for rank in range(len(hits))
+            ),
+            reverse=True,
+        )
+        passages = []
+        for score, rank in fused[:k]:
+            segment_no, doc, bm25 = hits[rank]
+            record = self.segments[segment_no].record(doc)
+            record.update(score=score, bm25=bm25, similarity=similarities[rank],
+                          citation=citation(record))
+            passages.append(record)
+        return passages
+
+    def relevant(self, query, k=4, min_similarity=MIN_SIMILARITY):
+        """Passages close enough to ground a chatbot answer (possibly none)"""
+        return [p for p in self.search(query, k) if p["similarity"] >= min_similarity]
+
+    def section_passages(self, surgery_name, diagnosis, k=3, sections=None):
+        """{section key: passages} for the consent sections of one surgery"""
+        subject = f"{surgery_name or ''} {diagnosis or ''}"
+        return {
+            key: self.search(f"{subject} {SECTION_QUERIES[key]}", k)
+            for key in (sections or SECTION_LABELS)
+        }
+
+    def _bm25(self, query_terms, count):
+        """[(segment no, doc, score)] for the best `count` docs across segments"""
+        weights = {}
+        for term, query_tf in query_terms.items():
+            df = sum(segment.df(term) for segment in self.segments)
+            if df:
+                weights[term] = query_tf * math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+        hits = []
+        for segment_no, segment in enumerate(self.segments):
+            scores = None
+            for term, weight in weights.items():
+                docs, tf = segment.postings(term)
+                if docs is None or not len(docs):
+                    continue
+                if scores is None:
+                    scores = np.zeros(len(segment), dtype=np.float32)
+                tf = tf.astype(np.float32)
+                # 한 용어의 postings 안에서 문서는 중복되지 않으므로 fancy index 덧셈이 안전
+                scores[docs] += weight * tf * (BM25_K1 + 1) / (tf + segment.norm[docs])
+            if scores is None:
+                continue
+            if segment.has_deleted:
+                scores[segment.deleted] = 0
+            top = _top(scores, count)
+            hits.extend((segment_no, int(doc), float(scores[doc])) for doc in top)
+        hits.sort(key=lambda hit: -hit[2])
+        return hits[:count]
+
+    def _similarities(self, hits, vector):
+        similarities = [0.0] * len(hits)
+        by_segment = collections.defaultdict(list)
+        for i, (segment_no, doc, _) in enumerate(hits):
+            by_segment[segment_no].append(i)
+        for segment_no, positions in by_segment.items():
+            docs = [hits[i][1] for i in positions]
+            rows = self.segments[segment_no].vectors[docs]
+            for i, score in zip(positions, rows @ vector):
+                similarities[i] = float(score)
+        return similarities
+
+    def _dense_scan(self, vector, count):
+        hits = []
+        for segment_no, segment in enumerate(self.segments):
+            scores = np.empty(len(segment), dtype=np.float32)
+            for start in range(0, len(segment), SCAN_BLOCK):
+                block = segment.vectors[start:start + SCAN_BLOCK]
+                scores[start:start + len(block)] = block @ vector
+            if segment.has_deleted:
+                scores[segment.deleted] = 0
+            hits.extend((segment_no, int(doc), float(scores[doc])) for doc in _top(scores, count))
+        hits.sort(key=lambda hit: -hit[2])
+        return hits[:count]
+
+
+@st.cache_resource(max_entries=1)
+def _open_index(index_dir, version):
+    return TextbookIndex(index_dir)
+
+
+def load_textbook_index(index_dir=TEXTBOOK_INDEX_DIR):
+    """The current index, reopened when the manifest changes; None if not built"""
+    manifest = read_manifest(index_dir)
+    if manifest is None or not manifest["segments"]:
+        return None
+    return _open_index(index_dir, manifest["version"])
+
+
+def format_passages(passages):
+    """Numbered excerpts for the chatbot's system prompt"""
+    blocks = [f"[{i}] {p['citation']}\n{p['text']}" for i, p in enumerate(passages, start=1)]
+    return "참고 교과서 발췌 (답변에 사용한 내용은 [번호]로 인용하세요):\n\n" + "\n\n".join(blocks)
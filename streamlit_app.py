@@ -10,10 +10,11 @@ from page_pdf_success import page_pdf_success
 import extra_streamlit_components as stx
 
 from page_basic_info import page_basic_info
-from possum_calculator import main as possum_main
+from services.consent_library import load_consent_library
+
+# 사전 생성된 동의서 템플릿 라이브러리를 서버 시작 시 한 번 로드
+load_consent_library()
 
-if "show_possum" not in st.session_state:
-    st.session_state.show_possum = False
 STEP_LABELS = [
     "Basic Information",
     "Surgery Information",
@@ -39,19 +40,15 @@ if "step" not in st.session_state:
 st.set_page_config(layout="wide")
 render_header()
 
-if st.session_state.show_possum:
-    possum_main()  # Show the POSSUM calculator
+if st.session_state.step == -1:
+    if page_main():
+        st.session_state.step = 0
+        st.markdown("<script>window.scrollTo(0, 0);</script>", unsafe_allow_html=True)
+        st.rerun()
 else:
-    # Your existing stepper logic
-    if st.session_state.step == -1:
-        if page_main():
-            st.session_state.step = 0
-            st.markdown("<script>window.scrollTo(0, 0);</script>", unsafe_allow_html=True)
-            st.rerun()
-    else:
-        val = stx.stepper_bar(steps=STEP_LABELS, lock_sequence=False)
-        if val != st.session_state.step:
-            st.session_state.step = val
-            st.markdown("<script>window.scrollTo(0, 0);</script>", unsafe_allow_html=True)
-            st.rerun()
-        PAGE_FUNCS[st.session_state.step]()
\ No newline at end of file
+    val = stx.stepper_bar(steps=STEP_LABELS, lock_sequence=False)
+    if val != st.session_state.step:
+        st.session_state.step = val
+        st.markdown("<script>window.scrollTo(0, 0);</script>", unsafe_allow_html=True)
+        st.rerun()
+    PAGE_FUNCS[st.session_state.step]()
\ No newline at end of file
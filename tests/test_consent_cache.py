@@ -0,0 +1,34 @@
+from services.consent_cache import cache_key
+from services.consent_catalog import baseline_payload
+
+
+def _payload(**changes):
+    payload = baseline_payload("복강경 담낭절제", "Acute cholecystitis (급성담낭염)")
+    payload.update(
+        age=30,
+        gender="F",
+        surgical_site_mark="L",
+        participants=[{"name": "김의사", "is_lead": True, "is_specialist": True, "department": "외과"}],
+    )
+    payload.update(changes)
+    return payload
+
+
+def test_identifiers_do_not_change_key():
+    assert cache_key(_payload()) == cache_key(
+        _payload(patient_name="홍길동", registration_no="12345", scheduled_date="2025-07-01")
+    )
+
+
+def test_side_changes_key():
+    assert cache_key(_payload(surgical_site_mark="L")) != cache_key(_payload(surgical_site_mark="R"))
+
+
+def test_age_and_gender_change_key():
+    assert cache_key(_payload(age=30)) != cache_key(_payload(age=70))
+    assert cache_key(_payload(gender="F")) != cache_key(_payload(gender="M"))
+
+
+def test_care_team_changes_key():
+    other = [{"name": "이의사", "is_lead": True, "is_specialist": False, "department": "외과"}]
+    assert cache_key(_payload()) != cache_key(_payload(participants=other))
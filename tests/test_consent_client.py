@@ -0,0 +1,41 @@
+import pytest
+import requests
+
+from services.consent_client import CircuitBreaker, CircuitOpenError, ConsentAPIError, ConsentClient
+
+
+def _half_open_client(error):
+    # reset_timeout=0: 한 번 실패하면 바로 반개방 상태가 되어 다음 요청이 시험 요청이 됨
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    client = ConsentClient(base_url="http://consent.invalid", max_retries=0, breaker=breaker)
+
+    def post(*args, **kwargs):
+        raise error
+
+    client.session.post = post
+    return client
+
+
+def test_other_request_error_settles_half_open_trial():
+    client = _half_open_client(requests.exceptions.ChunkedEncodingError("connection broken"))
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+
+    with pytest.raises(ConsentAPIError) as raised:
+        client.generate_consent({})
+    assert not isinstance(raised.value, CircuitOpenError)
+
+    # 실패로 기록되어 다시 열렸다가 곧바로 다음 시험 요청을 받음
+    with pytest.raises(ConsentAPIError) as raised:
+        client.generate_consent({})
+    assert not isinstance(raised.value, CircuitOpenError)
+
+
+def test_unexpected_error_releases_half_open_trial():
+    client = _half_open_client(RuntimeError("bug"))
+
+    with pytest.raises(RuntimeError):
+        client.generate_consent({})
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(RuntimeError):
+        client.generate_consent({})
@@ -0,0 +1,96 @@
+"""Size and render cost of vector vs raster canvas storage.
+
+Usage (from the repository root):
+
+    python -m tools.bench_canvas --canvases 40 --strokes 30
+
+Builds synthetic free-draw canvases and compares, per consent, what the
+raster mode keeps in the session and sends over the websocket (the RGBA
+array st_canvas returns with every stroke, plus the thumbnail PNG) with
+what the vector mode keeps (the fabric.js JSON only). Also times the
+server-side rasterizer for a thumbnail and a PDF-resolution image, cold
+and cached.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from services.canvas_raster import CANVAS_HEIGHT, CANVAS_WIDTH, rasterize, render_png
+
+# components/canvas_group.py의 썸네일 폭과 같음
+THUMBNAIL_SCALE = 240 / CANVAS_WIDTH
+
+
+def synthetic_drawing(strokes, rng):
+    """fabric.js JSON of free-draw strokes like the ones st_canvas produces"""
+    objects = []
+    for _ in range(strokes):
+        x, y = rng.uniform(20, CANVAS_WIDTH - 20), rng.uniform(20, CANVAS_HEIGHT - 20)
+        path = [["M", round(x, 3), round(y, 3)]]
+        for _ in range(int(rng.integers(20, 60))):
+            cx, cy = x + rng.normal(0, 3), y + rng.normal(0, 3)
+            x, y = x + rng.normal(0, 4), y + rng.normal(0, 4)
+            path.append(["Q", round(cx, 3), round(cy, 3), round(x, 3), round(y, 3)])
+        path.append(["L", round(x, 3), round(y, 3)])
+        objects.append({"type": "path", "version": "4.4.0", "originX": "left", "originY": "top",
+                        "stroke": "#222", "strokeWidth": 3, "fill": None, "path": path})
+    return {"version": "4.4.0", "objects": objects}
+
+
+def _best(fn, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--canvases", type=int, default=40, help="canvases per consent")
+    parser.add_argument("--strokes", type=int, default=30, help="strokes per canvas")
+    parser.add_argument("--pdf-scale", type=float, default=2.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    drawings = [synthetic_drawing(args.strokes, rng) for _ in range(args.canvases)]
+    json_bytes = sum(len(json.dumps(d, separators=(",", ":"))) for d in drawings)
+    rgba_bytes = args.canvases * CANVAS_WIDTH * CANVAS_HEIGHT * 4
+    thumbnail_bytes = sum(len(render_png(d, THUMBNAIL_SCALE)) for d in drawings)
+
+    sample = drawings[0]
+    report = {
+        "canvases": args.canvases,
+        "session_bytes": {"raster": rgba_bytes + json_bytes + thumbnail_bytes, "vector": json_bytes},
+        # 획 하나를 그을 때마다 브라우저가 보내는 값 (canvas 하나 기준)
+        "per_stroke_bytes": {"raster": rgba_bytes // args.canvases + json_bytes // args.canvases,
+                             "vector": json_bytes // args.canvases},
+        "render_ms": {
+            "thumbnail": round(_best(lambda: rasterize(sample, THUMBNAIL_SCALE)), 2),
+            "pdf": round(_best(lambda: rasterize(sample, args.pdf_scale)), 2),
+        },
+    }
+    # 같은 그림은 두 번째부터 캐시에서 나옴
+    render_png(sample, args.pdf_scale)
+    report["render_ms"]["pdf_cached"] = round(_best(lambda: render_png(sample, args.pdf_scale)), 2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for name in ("session_bytes", "per_stroke_bytes"):
+        row = report[name]
+        print(f"{name:<18}raster {row['raster']:>12,}  vector {row['vector']:>10,}  "
+              f"({row['raster'] / row['vector']:.0f}x)")
+    for name, ms in report["render_ms"].items():
+        print(f"render {name:<11}{ms:>8.2f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Save/load time and size of the consent archive vs the old JSON format.
+
+Usage (from the repository root):
+
+    python -m tools.bench_consent_archive --canvases 12
+
+Builds a consent with drawn canvases (rasterized synthetic strokes, RGBA as
+st_canvas returns them) and times, for each format, writing it to disk and
+reading it back: the old pretty-printed JSON with image_data.tolist(), the
+archive with PNG rasters, the archive with raw rasters, and the archive with
+strokes only (vector mode). Prints file size and best-of-N times.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from services.canvas_raster import rasterize
+from services.consent_archive import RASTER_PNG, RASTER_RAW, ConsentArchiveReader, write_canvas_data
+from tools.bench_canvas import synthetic_drawing
+
+
+def _consent(canvases, strokes, rng):
+    drawings, images = {}, {}
+    for i in range(canvases):
+        key = f"canvas_2_{i}"
+        drawings[key] = synthetic_drawing(strokes, rng)
+        rgb = np.asarray(rasterize(drawings[key]))
+        images[key] = np.dstack([rgb, np.full(rgb.shape[:2], 255, dtype=np.uint8)])
+    return {
+        "patient_info": {"환자명": "홍길동", "수술명": "복강경 담낭절제술", "의료진": [{"집도의": "홍길동"}]},
+        "sections": {"purpose": "수술의 목적 " * 200, "complications": "합병증 " * 400},
+        "canvas_counts": {"canvas_count_2": canvases},
+        "canvas_drawings": drawings,
+        "canvas_images": images,
+        "timestamp": "2025-01-01T00:00:00",
+    }
+
+
+def _write_json(path, canvas_data):
+    # 예전 save_all_canvas_data와 같은 방식
+    legacy = dict(canvas_data, canvas_images={k: v.tolist() for k, v in canvas_data["canvas_images"].items()})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(legacy, f, ensure_ascii=False, indent=2)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {k: np.asarray(v, dtype=np.uint8) for k, v in data["canvas_images"].items()}
+
+
+def _read_archive(path):
+    with ConsentArchiveReader(path) as archive:
+        return archive.to_canvas_data()
+
+
+def _best(fn, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--canvases", type=int, default=12)
+    parser.add_argument("--strokes", type=int, default=30, help="strokes per canvas")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    canvas_data = _consent(args.canvases, args.strokes, np.random.default_rng(0))
+    vector = dict(canvas_data, canvas_images={})
+    formats = {
+        "json": ("consent.json", lambda p: _write_json(p, canvas_data), _read_json),
+        "archive_png": ("png.zip", lambda p: write_canvas_data(p, canvas_data, raster=RASTER_PNG), _read_archive),
+        "archive_raw": ("raw.zip", lambda p: write_canvas_data(p, canvas_data, raster=RASTER_RAW), _read_archive),
+        "archive_vector": ("vector.zip", lambda p: write_canvas_data(p, vector), _read_archive),
+    }
+    report = {"canvases": args.canvases}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (filename, write, read) in formats.items():
+            path = os.path.join(directory, filename)
+            # JSON은 한 번이 수 초라 반복하지 않음
+            repeat = 1 if name == "json" else args.repeat
+            report[name] = {
+                "bytes": 0,
+                "save_ms": round(_best(lambda: write(path), repeat), 1),
+                "load_ms": round(_best(lambda: read(path), repeat), 1),
+            }
+            report[name]["bytes"] = os.path.getsize(path)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    baseline = report["json"]
+    print(f"{args.canvases} canvases")
+    for name in formats:
+        row = report[name]
+        print(f"{name:<16}{row['bytes']:>14,} bytes ({baseline['bytes'] / row['bytes']:>6.0f}x smaller)  "
+              f"save {row['save_ms']:>9.1f}ms ({baseline['save_ms'] / row['save_ms']:>5.0f}x)  "
+              f"load {row['load_ms']:>9.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Throughput of the batch POSSUM engine.
+
+Usage (from the repository root):
+
+    python -m tools.bench_possum --rows 5000000
+
+Generates random cases and times five paths: scoring pre-encoded option
+codes (the engine core), scoring categorical label columns (what the CLI
+reads), scoring plain string labels, banding raw lab values and scoring
+them, and the old per-patient path of option lookups and math.exp for
+comparison. Prints rows per second for each.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.possum_banding import RAW_BANDS, band_columns
+from services.possum_engine import (
+    MODEL_P_POSSUM,
+    MORTALITY_COEFFICIENTS,
+    OPERATIVE,
+    PHYSIOLOGICAL,
+    score_case,
+    score_codes,
+    score_labels,
+)
+
+
+def random_codes(table, rows, rng):
+    limits = np.array([len(options) for options in table.options])
+    return (rng.random((rows, len(table.names))) * limits).astype(np.int8)
+
+
+def _labels(table, codes):
+    return {name: np.asarray(options, dtype=object)[codes[:, i]]
+            for i, (name, options) in enumerate(zip(table.names, table.options))}
+
+
+def _raw_values(rows, rng):
+    """Random numbers spread across every band of each raw variable"""
+    values = {}
+    for band in RAW_BANDS.values():
+        low, high = band.upper_bounds[0] * 0.8, band.upper_bounds[-1] * 1.2
+        values[band.columns[0]] = rng.uniform(low, high, rows).round(1)
+    return values
+
+
+def _rate(rows, fn, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return {"seconds": round(best, 4), "rows_per_second": round(rows / best)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--label-rows", type=int, default=1_000_000,
+                        help="rows for the label-encoding path")
+    parser.add_argument("--scalar-rows", type=int, default=20_000,
+                        help="rows for the per-patient path")
+    parser.add_argument("--model", choices=sorted(MORTALITY_COEFFICIENTS), default=MODEL_P_POSSUM)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    physiological = random_codes(PHYSIOLOGICAL, args.rows, rng)
+    operative = random_codes(OPERATIVE, args.rows, rng)
+
+    label_rows = min(args.label_rows, args.rows)
+    columns = _labels(PHYSIOLOGICAL, physiological[:label_rows])
+    columns.update(_labels(OPERATIVE, operative[:label_rows]))
+
+    categorical = {name: pd.Categorical(values) for name, values in columns.items()}
+    raw = _raw_values(label_rows, rng)
+    raw.update({name: values for name, values in categorical.items() if name not in RAW_BANDS})
+
+    scalar_rows = min(args.scalar_rows, args.rows)
+    cases = [{name: values[i] for name, values in columns.items()} for i in range(min(scalar_rows, label_rows))]
+
+    report = {
+        "codes": _rate(args.rows, lambda: score_codes(physiological, operative, args.model)),
+        "categorical": _rate(label_rows, lambda: score_labels(categorical, args.model)),
+        "labels": _rate(label_rows, lambda: score_labels(columns, args.model)),
+        "raw": _rate(label_rows, lambda: score_labels({**raw, **band_columns(raw)}, args.model)),
+        "per_patient": _rate(len(cases), lambda: [score_case(case, args.model) for case in cases], repeat=1),
+    }
+    # 배치 결과가 환자 단위 계산과 같은지 확인
+    batch = score_labels({name: values[:len(cases)] for name, values in columns.items()}, args.model)
+    single = np.array([score_case(case, args.model)["mortality"] for case in cases])
+    report["max_abs_difference"] = float(np.abs(batch["mortality"] - single).max())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for name in ("codes", "categorical", "labels", "raw", "per_patient"):
+        row = report[name]
+        print(f"{name:<12}{row['rows_per_second']:>14,} rows/s  ({row['seconds']:.3f}s)")
+    print(f"batch vs per-patient max |Δ mortality| = {report['max_abs_difference']:.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
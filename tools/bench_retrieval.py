@@ -0,0 +1,179 @@
+"""Query latency of the textbook retrieval index at scale.
+
+Usage (from the repository root):
+
+    python -m tools.bench_retrieval --chunks 1000000
+    python -m tools.bench_retrieval --index-dir textbook_index --queries 200
+
+Without --index-dir a synthetic index is written to a temporary directory:
+Zipf-distributed terms (about --doc-length tokens per chunk) and random unit
+vectors, in segments of --segment-size, through the same segment writer the
+ingest tool uses. It then times hybrid queries (BM25 + dense rerank) and the
+full dense scan used when no query term is indexed (plus the nine per-section
+lookups of the references tab on a real index), and prints p50/p95/p99 with
+the process's CPU time and RSS.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from services.textbook_index import (
+    DENSE_DIM,
+    INDEX_FORMAT,
+    MANIFEST,
+    SECTION_QUERIES,
+    TextbookIndex,
+    write_segment,
+)
+from tools.proc_stats import process_usage
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values (q in 0–100)"""
+    ordered = sorted(values)
+    return ordered[max(1, int(np.ceil(q / 100 * len(ordered)))) - 1]
+
+
+def _term(i):
+    return f"w{i}"
+
+
+def _zipf_probabilities(vocabulary):
+    weights = 1.0 / (np.arange(vocabulary) + 10.0)
+    return weights / weights.sum()
+
+
+def build_synthetic_index(index_dir, chunks, segment_size, vocabulary, doc_length, seed=0):
+    rng = np.random.default_rng(seed)
+    probabilities = _zipf_probabilities(vocabulary)
+    segments = []
+    for number, start in enumerate(range(0, chunks, segment_size)):
+        size = min(segment_size, chunks - start)
+        tokens = rng.choice(vocabulary, size=size * doc_length, p=probabilities)
+        docs = np.repeat(np.arange(size, dtype=np.int64), doc_length)
+        pairs, tf = np.unique(docs * vocabulary + tokens, return_counts=True)
+        pair_docs, pair_terms = pairs // vocabulary, pairs % vocabulary
+        # 세그먼트에 실제로 나온 용어만 남기고 id를 다시 매김
+        used, pair_terms = np.unique(pair_terms, return_inverse=True)
+        vectors = rng.standard_normal((size, DENSE_DIM), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        records = [
+            {"id": f"syn-{start + i}", "text": f"synthetic chunk {start + i}",
+             "source": "Synthetic Textbook", "page": (start + i) // 4}
+            for i in range(size)
+        ]
+        name = f"seg_{number:05d}"
+        write_segment(os.path.join(index_dir, name), records, [_term(t) for t in used],
+                      pair_docs, pair_terms, tf, np.full(size, doc_length), vectors)
+        segments.append(name)
+        print(f"  wrote {name}: {start + size}/{chunks} chunks")
+    with open(os.path.join(index_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"format": INDEX_FORMAT, "dim": DENSE_DIM, "segments": segments,
+                   "next_segment": len(segments), "version": 1}, f)
+
+
+def synthetic_queries(count, vocabulary, seed=1):
+    rng = np.random.default_rng(seed)
+    probabilities = _zipf_probabilities(vocabulary)
+    return [
+        " ".join(_term(t) for t in rng.choice(vocabulary, size=rng.integers(3, 9), p=probabilities))
+        for _ in range(count)
+    ]
+
+
+def _time(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - started)
+    return {q: percentile(timings, q) for q in (50, 95, 99)}
+
+
+def _fmt(seconds):
+    return f"{seconds * 1000:8.1f}ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index-dir", help="benchmark an existing index instead of a synthetic one")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--segment-size", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=200_000)
+    parser.add_argument("--doc-length", type=int, default=120, help="tokens per synthetic chunk")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic index directory")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    index_dir, temporary = args.index_dir, args.index_dir is None
+    if temporary:
+        index_dir = tempfile.mkdtemp(prefix="textbook_bench_")
+        started = time.perf_counter()
+        print(f"building {args.chunks} synthetic chunks in {index_dir}")
+        build_synthetic_index(index_dir, args.chunks, args.segment_size,
+                              args.vocabulary, args.doc_length)
+        build_seconds = time.perf_counter() - started
+    else:
+        build_seconds = None
+
+    try:
+        started = time.perf_counter()
+        index = TextbookIndex(index_dir)
+        open_seconds = time.perf_counter() - started
+
+        if temporary:
+            queries = synthetic_queries(args.queries, args.vocabulary)
+        else:
+            queries = [f"담낭절제술 담석증 {q}" for q in SECTION_QUERIES.values()]
+            queries = (queries * (args.queries // len(queries) + 1))[:args.queries]
+        # 첫 질의는 페이지 캐시를 채우므로 따로 측정
+        started = time.perf_counter()
+        index.search(queries[0], args.k)
+        first_query = time.perf_counter() - started
+
+        report = {
+            "sections": None,
+            "chunks": len(index),
+            "segments": len(index.segments),
+            "build_seconds": build_seconds,
+            "open_seconds": open_seconds,
+            "first_query_seconds": first_query,
+            "hybrid": _time(lambda q: index.search(q, args.k), queries),
+            # 색인에 없는 용어만 있는 질의는 dense 전체 검색으로 처리됨
+            "dense_scan": _time(lambda q: index.search(q.replace("w", "x"), args.k),
+                                queries[:max(1, args.queries // 10)]),
+        }
+        if not temporary:
+            report["sections"] = _time(lambda q: index.section_passages(q, "담석증", args.k),
+                                       ["복강경 담낭절제술"] * max(1, args.queries // 20))
+        report["process"] = process_usage()
+    finally:
+        if temporary and not args.keep:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"\n{report['chunks']} chunks in {report['segments']} segments, "
+          f"opened in {report['open_seconds']:.2f}s, first query {_fmt(report['first_query_seconds'])}")
+    print(f"{'query':<14}{'p50':>11}{'p95':>11}{'p99':>11}")
+    for name in ("hybrid", "dense_scan", "sections"):
+        row = report[name]
+        if row is None:
+            continue
+        print(f"{name:<14}{_fmt(row[50]):>11}{_fmt(row[95]):>11}{_fmt(row[99]):>11}")
+    usage = report["process"]
+    print(f"process: {usage['cpu_seconds']:.1f}s CPU, {usage['rss_bytes'] / 2**20:.0f} MiB RSS")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
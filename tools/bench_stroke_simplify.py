@@ -0,0 +1,119 @@
+"""Size saved vs rendered difference of canvas stroke simplification.
+
+Usage (from the repository root):
+
+    python -m tools.bench_stroke_simplify --strokes 40
+    python -m tools.bench_stroke_simplify --tolerances 0.25 0.5 1 --forms consent_form_*.json
+
+Simplifies synthetic pencil strokes (integer mouse samples along smooth
+curves, as the browser reports them) and the drawings in any given
+consent_form_*.json files at each tolerance. For each one it prints the
+path points and JSON bytes kept and the time taken. It also rasterizes the
+original and the simplified drawing at PDF scale and compares them: the
+share of ink pixels of either image with no ink of the other within one
+output pixel (ink that visibly moved), and the mean absolute difference over
+the whole image (mostly antialiased edges shifting by a fraction of a pixel).
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+from PIL import ImageFilter
+
+from services.canvas_raster import CANVAS_HEIGHT, CANVAS_WIDTH, rasterize
+from services.stroke_simplify import pencil_path, point_count, simplify_drawing
+
+INK_THRESHOLD = 64
+
+
+def synthetic_strokes(strokes, rng, spacing=2.0):
+    """Pencil-brush drawing of smooth strokes sampled every ~spacing px"""
+    objects = []
+    for _ in range(strokes):
+        length = rng.uniform(80, 400)
+        steps = int(length / spacing)
+        heading = rng.uniform(0, 2 * math.pi) + np.cumsum(rng.normal(0, 0.08, steps))
+        start = rng.uniform([40, 40], [CANVAS_WIDTH - 40, CANVAS_HEIGHT - 40])
+        samples = start + np.cumsum(np.c_[np.cos(heading), np.sin(heading)] * spacing, axis=0)
+        samples = np.clip(np.round(samples), 0, [CANVAS_WIDTH, CANVAS_HEIGHT])
+        # 마우스는 같은 좌표를 연달아 보내기도 함
+        samples = samples[np.r_[True, (np.diff(samples, axis=0) != 0).any(axis=1)]]
+        objects.append({"type": "path", "version": "4.4.0", "stroke": "#222", "strokeWidth": 3,
+                        "fill": None, "path": pencil_path(samples)})
+    return {"version": "4.4.0", "objects": objects}
+
+
+def _drawings(forms):
+    for path in forms:
+        with open(path, "r", encoding="utf-8") as f:
+            for key, drawing in json.load(f).get("canvas_drawings", {}).items():
+                if point_count(drawing):
+                    yield f"{path}:{key}", drawing
+
+
+def _ink(image):
+    return image.point(lambda v: 255 if 255 - v > INK_THRESHOLD else 0)
+
+
+def _difference(original, simplified, scale):
+    before, after = rasterize(original, scale).convert("L"), rasterize(simplified, scale).convert("L")
+    moved = total = 0
+    for ink, other in ((_ink(before), _ink(after)), (_ink(after), _ink(before))):
+        # 다른 쪽 잉크를 1px 넓혀도 덮이지 않는 잉크 = 눈에 띄게 옮겨진 잉크
+        ink, near = np.asarray(ink) > 0, np.asarray(other.filter(ImageFilter.MaxFilter(3))) > 0
+        moved += int((ink & ~near).sum())
+        total += int(ink.sum())
+    difference = np.abs(np.asarray(before, dtype=np.int16) - np.asarray(after, dtype=np.int16))
+    return moved / total if total else 0.0, float(difference.mean())
+
+
+def _size(drawing):
+    return len(json.dumps(drawing, separators=(",", ":")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strokes", type=int, default=40, help="synthetic strokes in the drawing")
+    parser.add_argument("--spacing", type=float, default=2.0, help="px between synthetic mouse samples")
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0.25, 0.5, 1.0, 2.0])
+    parser.add_argument("--forms", nargs="*", default=[], help="consent_form_*.json files to include")
+    parser.add_argument("--pdf-scale", type=float, default=2.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    drawings = [("synthetic", synthetic_strokes(args.strokes, np.random.default_rng(0), args.spacing))]
+    drawings += list(_drawings(args.forms))
+    report = []
+    for name, drawing in drawings:
+        for tolerance in args.tolerances:
+            seconds = math.inf
+            for _ in range(3):
+                started = time.perf_counter()
+                simplified = simplify_drawing(drawing, tolerance)
+                seconds = min(seconds, time.perf_counter() - started)
+            ink_moved, mean_difference = _difference(drawing, simplified, args.pdf_scale)
+            report.append({
+                "drawing": name, "tolerance": tolerance,
+                "points": point_count(drawing), "points_kept": point_count(simplified),
+                "bytes": _size(drawing), "bytes_kept": _size(simplified),
+                "simplify_ms": round(seconds * 1000, 2),
+                "ink_moved": round(ink_moved, 4), "mean_difference": round(mean_difference, 3),
+            })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{'drawing':<24}{'tol':>5}{'points':>14}{'bytes':>20}{'ms':>8}{'moved':>8}{'mean Δ':>8}")
+    for row in report:
+        print(f"{row['drawing'][-24:]:<24}{row['tolerance']:>5}"
+              f"{row['points']:>7}→{row['points_kept']:<6}"
+              f"{row['bytes']:>9,}→{row['bytes_kept']:<8,}({row['points'] / row['points_kept']:.1f}x)"
+              f"{row['simplify_ms']:>6.1f}{row['ink_moved']:>8.2%}{row['mean_difference']:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Pre-generate baseline consent sections for every surgery × diagnosis pair.
+
+Usage (from the repository root):
+
+    python -m tools.build_consent_library --base-url http://10.104.198.155:8000
+
+The entries use baseline_payload (default conditions, placeholder 50/M
+patient without site mark or care team), so the app shows them only as a
+placeholder until the patient's own consent is generated.
+
+Each run writes a new consent_library/consent_library_v<N>.json. Entries from
+the previous version can be carried over with --resume so an interrupted run
+only regenerates what is missing.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from services.consent_catalog import baseline_payload, valid_pairs
+from services.consent_client import ConsentAPIError, ConsentClient, DEFAULT_BASE_URL
+from services.consent_library import (
+    LIBRARY_DIR,
+    LIBRARY_FORMAT,
+    library_path,
+    library_versions,
+)
+
+
+def _previous_entries(library_dir):
+    versions = library_versions(library_dir)
+    if not versions:
+        return {}
+    with open(library_path(versions[-1], library_dir), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(e["surgery_name"], e["diagnosis"]): e for e in data.get("entries", [])}
+
+
+def _generate(client, surgery_name, diagnosis):
+    payload = baseline_payload(surgery_name, diagnosis)
+    started = time.perf_counter()
+    result = client.generate_consent(payload)
+    return {
+        "surgery_name": surgery_name,
+        "diagnosis": diagnosis,
+        "payload": payload,
+        "result": result,
+        "generated_at": datetime.now().isoformat(),
+        "generation_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default=os.getenv("CONSENT_API_URL", DEFAULT_BASE_URL))
+    parser.add_argument("--library-dir", default=LIBRARY_DIR)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent /consent requests")
+    parser.add_argument("--read-timeout", type=float, default=180.0)
+    parser.add_argument("--all-pairs", action="store_true",
+                        help="generate the full cross product instead of valid pairs only")
+    parser.add_argument("--resume", action="store_true",
+                        help="reuse entries from the newest existing version")
+    args = parser.parse_args(argv)
+
+    pairs = valid_pairs(all_pairs=args.all_pairs)
+    previous = _previous_entries(args.library_dir) if args.resume else {}
+    todo = [pair for pair in pairs if pair not in previous]
+    entries = [previous[pair] for pair in pairs if pair in previous]
+    print(f"{len(pairs)} pairs, {len(entries)} reused, {len(todo)} to generate")
+
+    client = ConsentClient(base_url=args.base_url, read_timeout=args.read_timeout,
+                           pool_size=args.workers)
+    failures = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(_generate, client, s, d): (s, d) for s, d in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            surgery_name, diagnosis = futures[future]
+            try:
+                entry = future.result()
+            except ConsentAPIError as e:
+                failures.append((surgery_name, diagnosis, str(e)))
+                print(f"[{i}/{len(todo)}] FAILED {surgery_name} / {diagnosis}: {e}")
+                continue
+            entries.append(entry)
+            print(f"[{i}/{len(todo)}] {surgery_name} / {diagnosis} "
+                  f"({entry['generation_seconds']}s)")
+
+    versions = library_versions(args.library_dir)
+    version = (versions[-1] + 1) if versions else 1
+    order = {pair: i for i, pair in enumerate(pairs)}
+    entries.sort(key=lambda e: order[(e["surgery_name"], e["diagnosis"])])
+    library = {
+        "format": LIBRARY_FORMAT,
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        "base_url": args.base_url,
+        "entries": entries,
+    }
+    os.makedirs(args.library_dir, exist_ok=True)
+    path = library_path(version, args.library_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(library, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    print(f"wrote {path}: {len(entries)} entries, {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Ingest licensed textbook chunks into the local retrieval index.
+
+Usage (from the repository root):
+
+    python -m tools.build_textbook_index chunks/*.jsonl
+    python -m tools.build_textbook_index --delete ch12-0042 ch12-0043
+    python -m tools.build_textbook_index --compact
+
+Input files are JSON Lines, one chunk per line:
+
+    {"id": "sabiston-ch54-0012", "text": "...", "source": "Sabiston Textbook of Surgery 21e",
+     "chapter": "54. Biliary System", "page": 1512}
+
+Each run appends new segments; chunks whose id is already indexed replace the
+old copy. The running app picks up the new manifest on its next query.
+"""
+import argparse
+import json
+import sys
+import time
+
+from services.textbook_index import (
+    TEXTBOOK_INDEX_DIR,
+    add_chunks,
+    compact,
+    delete_chunks,
+    read_manifest,
+)
+
+
+def _read_chunks(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if not chunk.get("id") or not chunk.get("text"):
+                    raise ValueError(f"{path}:{line_no}: chunk needs 'id' and 'text'")
+                yield chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", help="chunk .jsonl files")
+    parser.add_argument("--index-dir", default=TEXTBOOK_INDEX_DIR)
+    parser.add_argument("--segment-size", type=int, default=100_000,
+                        help="chunks per segment (bounds memory while ingesting)")
+    parser.add_argument("--delete", nargs="+", metavar="ID", help="remove chunks by id")
+    parser.add_argument("--compact", action="store_true",
+                        help="merge all segments into one afterwards")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    added = 0
+    batch = []
+    for chunk in _read_chunks(args.inputs):
+        batch.append(chunk)
+        if len(batch) >= args.segment_size:
+            added += add_chunks(batch, args.index_dir)
+            print(f"indexed {added} chunks")
+            batch = []
+    if batch:
+        added += add_chunks(batch, args.index_dir)
+    if args.delete:
+        print(f"deleted {delete_chunks(args.delete, args.index_dir)} chunks")
+    if args.compact:
+        print(f"compacted {compact(args.index_dir)} chunks into one segment")
+
+    manifest = read_manifest(args.index_dir)
+    if manifest is None:
+        print("no index built (no input chunks)")
+        return 1
+    print(f"{args.index_dir}: +{added} chunks, {len(manifest['segments'])} segments, "
+          f"version {manifest['version']}, {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Convert consent_form_*.json files to consent archives.
+
+Usage (from the repository root):
+
+    python -m tools.convert_consent_forms consent_form_*.json
+    python -m tools.convert_consent_forms old/ --out-dir archives/ --raster raw --remove
+
+Each consent_form_<timestamp>.json written by the old save_all_canvas_data
+becomes consent_form_<timestamp>.zip next to it, or in --out-dir (see
+services/consent_archive.py). Directories are searched for
+consent_form_*.json. The JSON is only removed with --remove, after the
+archive has been written and read back.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from services.consent_archive import RASTER_PNG, RASTER_RAW, ConsentArchiveReader, convert_legacy_json
+
+
+def _sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "consent_form_*.json")))
+        else:
+            yield path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="consent_form_*.json files or directories")
+    parser.add_argument("--out-dir", help="write archives here (default: next to each file)")
+    parser.add_argument("--raster", choices=(RASTER_PNG, RASTER_RAW), default=RASTER_PNG)
+    parser.add_argument("--remove", action="store_true", help="delete each JSON once converted")
+    args = parser.parse_args(argv)
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    failed = 0
+    for source in _sources(args.paths):
+        destination = os.path.splitext(source)[0] + ".zip"
+        if args.out_dir:
+            destination = os.path.join(args.out_dir, os.path.basename(destination))
+        started = time.perf_counter()
+        try:
+            canvases = convert_legacy_json(source, destination, raster=args.raster)
+            with ConsentArchiveReader(destination) as archive:
+                # 원본을 지우기 전에 다시 읽어 확인
+                if len(archive.canvas_keys()) != canvases:
+                    raise ValueError("canvas count mismatch after conversion")
+        except (OSError, ValueError) as e:
+            print(f"error: {source}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        before, after = os.path.getsize(source), os.path.getsize(destination)
+        print(f"{source} → {destination}: {canvases} canvases, {before:,} → {after:,} bytes "
+              f"in {time.perf_counter() - started:.2f}s")
+        if args.remove:
+            os.remove(source)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
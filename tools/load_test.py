@@ -0,0 +1,389 @@
+"""Replay concurrent clinician flows against the consent and Groq backends.
+
+Usage (from the repository root):
+
+    python -m tools.load_test --start-mocks --clinicians 20
+    python -m tools.load_test --consent-url http://127.0.0.1:8000 \\
+        --groq-url http://127.0.0.1:8100 --clinicians 20 --server-pid 1234
+
+Each clinician thread runs the same steps as the app, in order:
+
+    basic_info   submit the consent job and wait for it (cache, stream, fallback)
+    chat         streamed Groq answers on the surgery-info page (TTFT and total)
+    confirmation write synthetic canvases to a consent archive the way save_all_canvas_data does
+    pdf          build the consent HTML, and render it when wkhtmltopdf exists
+
+It prints p50/p95/p99 per step, error counts, and CPU time / RSS for this
+driver, for the servers' GET /metrics, and for any --server-pid (e.g. the
+streamlit process). --start-mocks launches tools.mock_consent_server and
+tools.mock_groq_server as subprocesses on free ports.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import requests
+from groq import Groq
+
+from page_confirmation import collect_canvas_data
+from page_pdf_progress import collect_all_content
+from services.canvas_raster import CANVAS_VECTOR
+from services.consent_archive import write_canvas_data
+from services.consent_cache import ConsentCache
+from services.consent_catalog import DEFAULT_SPECIAL_CONDITIONS, valid_pairs
+from services.consent_client import ConsentClient
+from services.consent_jobs import DONE, ConsentJobManager, consent_sections
+from tools.proc_stats import process_usage
+
+STEPS = ("basic_info", "chat_ttft", "chat", "confirmation", "pdf", "flow")
+
+# 확인 페이지에서 그림을 추가할 수 있는 섹션
+CANVAS_SECTIONS = ("2", "3", "4", "5_1", "5_2", "5_3", "5_4", "5_5", "6", "7_1", "8", "9")
+
+CANVAS_SHAPE = (200, 750, 4)
+
+CHAT_QUESTIONS = (
+    "이 수술의 주요 합병증을 환자가 이해하기 쉽게 정리해 주세요.",
+    "수술 후 회복 기간과 주의사항을 알려주세요.",
+    "고령 환자에게 추가로 설명해야 할 위험 요소가 있나요?",
+)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values (q in 0–100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class Recorder:
+    """Thread-safe collection of per-step timings and errors"""
+
+    def __init__(self):
+        self.timings = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.sources = {}
+        self._lock = threading.Lock()
+
+    def record(self, step, seconds):
+        with self._lock:
+            self.timings[step].append(seconds)
+
+    def error(self, step):
+        with self._lock:
+            self.errors[step] += 1
+
+    def source(self, name):
+        with self._lock:
+            self.sources[name] = self.sources.get(name, 0) + 1
+
+    def summary(self):
+        return {
+            step: {
+                "count": len(self.timings[step]),
+                "errors": self.errors[step],
+                "p50": percentile(self.timings[step], 50),
+                "p95": percentile(self.timings[step], 95),
+                "p99": percentile(self.timings[step], 99),
+            }
+            for step in STEPS
+        }
+
+
+def synthetic_payload(rng, index):
+    surgery_name, diagnosis = rng.choice(valid_pairs())
+    special_conditions = dict(DEFAULT_SPECIAL_CONDITIONS)
+    for name in rng.sample(sorted(k for k in special_conditions if k != "other"), 2):
+        special_conditions[name] = rng.choice(["유", "무"])
+    return {
+        "registration_no": f"LT{index:06d}",
+        "patient_name": f"부하테스트{index}",
+        "age": rng.randint(20, 90),
+        "gender": rng.choice(["M", "F"]),
+        "scheduled_date": "2025-01-01",
+        "surgery_name": surgery_name,
+        "diagnosis": diagnosis,
+        "surgical_site_mark": "예",
+        "participants": [],
+        "patient_condition": "Stable",
+        "special_conditions": special_conditions,
+        "possum_score": {
+            "mortality_risk": round(rng.uniform(0.01, 0.6), 3),
+            "morbidity_risk": round(rng.uniform(0.05, 0.9), 3),
+        },
+    }
+
+
+def patient_info(payload):
+    """patient_data.json equivalent of a payload"""
+    return {
+        "등록번호": payload["registration_no"],
+        "수술명": payload["surgery_name"],
+        "환자명": payload["patient_name"],
+        "시행예정일": payload["scheduled_date"],
+        "나이/성별": f"{payload['age']}/{payload['gender']}",
+        "진단명": payload["diagnosis"],
+        "의료진": [{"집도의": "홍길동", "전문의여부": "예", "진료과목": "외과"}],
+    }
+
+
+def synthetic_canvas(rng):
+    """A drawn canvas: fabric.js path JSON plus the RGBA image st_canvas returns"""
+    points = [["M", rng.uniform(0, 750), rng.uniform(0, 200)]]
+    points += [["Q", rng.uniform(0, 750), rng.uniform(0, 200),
+                rng.uniform(0, 750), rng.uniform(0, 200)] for _ in range(60)]
+    json_data = {"version": "4.4.0", "objects": [{"type": "path", "path": points,
+                                                   "stroke": "#000000", "strokeWidth": 3}]}
+    image = np.zeros(CANVAS_SHAPE, dtype=np.uint8)
+    ys = np.clip([int(p[2]) for p in points], 0, CANVAS_SHAPE[0] - 1)
+    xs = np.clip([int(p[1]) for p in points], 0, CANVAS_SHAPE[1] - 1)
+    image[ys, xs] = (0, 0, 0, 255)
+    return SimpleNamespace(json_data=json_data, image_data=image)
+
+
+def chat_once(client, model, question, recorder):
+    messages = [
+        {"role": "system", "content": "당신은 의료진을 위한 수술 동의서 작성 도우미입니다."},
+        {"role": "user", "content": question},
+    ]
+    started = time.perf_counter()
+    first_token = None
+    stream = client.chat.completions.create(
+        model=model, messages=messages, temperature=0.7, max_tokens=1000, stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content and first_token is None:
+            first_token = time.perf_counter()
+    finished = time.perf_counter()
+    if first_token is not None:
+        recorder.record("chat_ttft", first_token - started)
+    recorder.record("chat", finished - started)
+
+
+def run_flow(index, args, manager, groq_client, recorder):
+    rng = random.Random(args.seed + index)
+    time.sleep(rng.uniform(0, args.ramp_up))
+    flow_started = time.perf_counter()
+    ok = True
+
+    # 1. 기본 정보 입력 → 동의서 생성
+    payload = synthetic_payload(rng, index)
+    state = {}
+    started = time.perf_counter()
+    job = manager.get(manager.submit(payload))
+    deadline = started + args.consent_timeout
+    while not job.finished and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    if job.status == DONE:
+        recorder.record("basic_info", time.perf_counter() - started)
+        recorder.source(job.source)
+        state.update(consent_sections(job.result.get("consents", {})))
+    else:
+        recorder.error("basic_info")
+        ok = False
+
+    # 2. 수술 정보 페이지 챗봇
+    for turn in range(args.chat_turns):
+        try:
+            chat_once(groq_client, args.model, CHAT_QUESTIONS[turn % len(CHAT_QUESTIONS)], recorder)
+        except Exception:
+            recorder.error("chat")
+            ok = False
+
+    # 3. 확인 페이지 그림 저장
+    started = time.perf_counter()
+    try:
+        for section in rng.sample(CANVAS_SECTIONS, min(args.canvases, len(CANVAS_SECTIONS))):
+            state[f"canvas_count_{section}"] = 1
+            canvas = synthetic_canvas(rng)
+            state[f"canvas_{section}_0"] = canvas
+            if CANVAS_VECTOR:
+                # 확인 페이지와 같이 획 JSON만 보관하고 PDF 단계에서 그림
+                state[f"canvas_{section}_0_data"] = canvas.json_data
+            else:
+                state[f"canvas_{section}_0_image"] = canvas.image_data
+        info = patient_info(payload)
+        write_canvas_data(io.BytesIO(), collect_canvas_data(state, info))
+        recorder.record("confirmation", time.perf_counter() - started)
+    except Exception:
+        recorder.error("confirmation")
+        ok = False
+
+    # 4. PDF 생성
+    started = time.perf_counter()
+    try:
+        html = collect_all_content(state, consent_data=patient_info(payload))
+        if args.wkhtmltopdf:
+            import pdfkit
+            config = pdfkit.configuration(wkhtmltopdf=args.wkhtmltopdf)
+            pdfkit.from_string(html, False, configuration=config,
+                               options={"encoding": "UTF-8", "quiet": ""})
+        recorder.record("pdf", time.perf_counter() - started)
+    except Exception:
+        recorder.error("pdf")
+        ok = False
+
+    if ok:
+        recorder.record("flow", time.perf_counter() - flow_started)
+    else:
+        recorder.error("flow")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/metrics", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_mocks(args):
+    """Launch both mock servers and return ([processes], consent_url, groq_url)"""
+    consent_port, groq_port = _free_port(), _free_port()
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "tools.mock_consent_server", "--quiet",
+                          "--port", str(consent_port), *args.consent_mock_args.split()]),
+        subprocess.Popen([sys.executable, "-m", "tools.mock_groq_server", "--quiet",
+                          "--port", str(groq_port), *args.groq_mock_args.split()]),
+    ]
+    consent_url = f"http://127.0.0.1:{consent_port}"
+    groq_url = f"http://127.0.0.1:{groq_port}"
+    _wait_ready(consent_url)
+    _wait_ready(groq_url)
+    return processes, consent_url, groq_url
+
+
+def server_metrics(url):
+    try:
+        return requests.get(f"{url.rstrip('/')}/metrics", timeout=2).json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:8.0f}ms"
+
+
+def print_report(report):
+    print(f"\n{report['clinicians']} clinicians in {report['wall_seconds']:.1f}s")
+    print(f"{'step':<14}{'count':>6}{'errors':>7}{'p50':>11}{'p95':>11}{'p99':>11}")
+    for step, row in report["steps"].items():
+        print(f"{step:<14}{row['count']:>6}{row['errors']:>7}"
+              f"{_fmt(row['p50']):>11}{_fmt(row['p95']):>11}{_fmt(row['p99']):>11}")
+    print(f"consent sources: {report['consent_sources']}")
+    print(f"consent cache: {report['consent_cache']}")
+    for name, usage in report["processes"].items():
+        if usage is None:
+            print(f"{name}: unavailable")
+            continue
+        counts = {k: v for k, v in usage.items() if k not in ("cpu_seconds", "rss_bytes")}
+        print(f"{name}: cpu {usage['cpu_seconds']:.2f}s, "
+              f"rss {usage['rss_bytes'] / 2**20:.1f}MiB {counts or ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clinicians", type=int, default=10, help="concurrent flows")
+    parser.add_argument("--ramp-up", type=float, default=1.0,
+                        help="spread flow start times over this many seconds")
+    parser.add_argument("--consent-url", default=os.getenv("CONSENT_API_URL"))
+    parser.add_argument("--groq-url", default=os.getenv("GROQ_BASE_URL"))
+    parser.add_argument("--groq-api-key", default=os.getenv("GROQ_API_KEY", "mock"))
+    parser.add_argument("--model", default="compound-beta")
+    parser.add_argument("--start-mocks", action="store_true",
+                        help="launch the mock servers instead of using --consent-url/--groq-url")
+    parser.add_argument("--consent-mock-args", default="--section-delay 0.3 --jitter 0.3",
+                        help="extra arguments for the mock consent server")
+    parser.add_argument("--groq-mock-args", default="--ttft 0.5 --tokens-per-second 80",
+                        help="extra arguments for the mock Groq server")
+    parser.add_argument("--consent-workers", type=int, default=4,
+                        help="consent job pool size (SURGIFORM_MAX_CONSENT_JOBS in the app)")
+    parser.add_argument("--consent-timeout", type=float, default=180.0)
+    parser.add_argument("--no-stream", action="store_true", help="use POST /consent only")
+    parser.add_argument("--chat-turns", type=int, default=2)
+    parser.add_argument("--canvases", type=int, default=3, help="drawn canvases per flow")
+    parser.add_argument("--no-pdf", action="store_true", help="skip wkhtmltopdf rendering")
+    parser.add_argument("--server-pid", type=int, action="append", default=[],
+                        help="also report CPU/RSS of this process (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    args.wkhtmltopdf = None if args.no_pdf else shutil.which("wkhtmltopdf")
+
+    processes = []
+    if args.start_mocks:
+        processes, args.consent_url, args.groq_url = start_mocks(args)
+    if not args.consent_url or not args.groq_url:
+        parser.error("give --consent-url and --groq-url, or --start-mocks")
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = ConsentClient(base_url=args.consent_url, pool_size=args.consent_workers)
+            cache = ConsentCache(os.path.join(cache_dir, "consent_cache.sqlite3"))
+            manager = ConsentJobManager(
+                client.generate_consent,
+                stream_fn=None if args.no_stream else client.stream_consent,
+                cache=cache,
+                max_workers=args.consent_workers,
+            )
+            groq_client = Groq(api_key=args.groq_api_key, base_url=args.groq_url)
+            recorder = Recorder()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clinicians) as pool:
+                futures = [pool.submit(run_flow, i, args, manager, groq_client, recorder)
+                           for i in range(args.clinicians)]
+                for future in futures:
+                    future.result()
+            wall = time.perf_counter() - started
+
+            report = {
+                "clinicians": args.clinicians,
+                "wall_seconds": wall,
+                "steps": recorder.summary(),
+                "consent_sources": recorder.sources,
+                "consent_cache": cache.stats(),
+                "processes": {
+                    "driver": process_usage(),
+                    "consent_server": server_metrics(args.consent_url),
+                    "groq_server": server_metrics(args.groq_url),
+                    **{f"pid {pid}": process_usage(pid) for pid in args.server_pid},
+                },
+            }
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 1 if any(row["errors"] for row in report["steps"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""Local stand-in for the consent generation backend.
+
+Usage (from the repository root):
+
+    python -m tools.mock_consent_server --port 8000 --section-delay 2
+    CONSENT_API_URL=http://127.0.0.1:8000 streamlit run streamlit_app.py
+
+POST /consent returns the whole consents dict after every section has been
+"generated"; POST /consent/stream sends each section as soon as it is ready,
+as NDJSON by default or as server-sent events when the request's Accept
+header asks for text/event-stream (or --format sse is given).
+
+Each section takes --section-delay seconds plus its length divided by
+--tokens-per-second (one character ≈ one token), with ±--jitter random
+variation. --error-rate makes that fraction of requests fail with a 503 or
+a 500 so retries and the circuit breaker can be exercised. GET /metrics
+reports request counts and the server's CPU time and RSS.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tools.proc_stats import process_usage
+
+# 백엔드가 생성하는 순서대로의 섹션 경로
+SECTIONS = [
+    "prognosis_without_surgery",
+    "alternative_treatments",
+    "surgery_purpose_necessity_effect",
+    "surgery_method_content.overall_description",
+    "surgery_method_content.estimated_duration",
+    "surgery_method_content.method_change_or_addition",
+    "surgery_method_content.transfusion_possibility",
+    "surgery_method_content.surgeon_change_possibility",
+    "possible_complications_sequelae",
+    "emergency_measures",
+    "mortality_risk",
+]
+
+
+def section_text(section, payload):
+    surgery = payload.get("surgery_name") or "예정된 수술"
+    diagnosis = payload.get("diagnosis") or "진단명 미상"
+    return f"[{section}] {diagnosis} 환자에게 {surgery}을(를) 시행하는 경우에 대한 설명입니다."
+
+
+def build_consents(payload):
+    consents = {}
+    for section in SECTIONS:
+        node = consents
+        parts = section.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = section_text(section, payload)
+    return consents
+
+
+class MockConsentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, set by make_server
+    stats = None
+
+    def _count(self, name):
+        with self.stats["lock"]:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _section_delay(self, text):
+        delay = self.config.section_delay
+        if self.config.tokens_per_second:
+            delay += len(text) / self.config.tokens_per_second
+        if self.config.jitter:
+            delay *= random.uniform(1 - self.config.jitter, 1 + self.config.jitter)
+        return max(0.0, delay)
+
+    def log_message(self, format, *args):
+        if not self.config.quiet:
+            super().log_message(format, *args)
+
+    def _read_payload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            with self.stats["lock"]:
+                counts = {k: v for k, v in self.stats.items() if k != "lock"}
+            self._send_json(200, {**counts, **process_usage()})
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path not in ("/consent", "/consent/stream"):
+            self._send_json(404, {"detail": "Not Found"})
+            return
+        payload = self._read_payload()
+        self._count("requests")
+        if random.random() < self.config.error_rate:
+            self._count("errors")
+            status = random.choice([500, 503])
+            self._send_json(status, {"detail": f"Injected error {status}"})
+            return
+        time.sleep(self.config.first_byte_latency)
+        if path == "/consent":
+            consents = build_consents(payload)
+            time.sleep(sum(self._section_delay(section_text(s, payload)) for s in SECTIONS))
+            self._send_json(200, {"consents": consents})
+            self._count("completed")
+        else:
+            self._stream(payload)
+
+    def _stream(self, payload):
+        sse = self.config.format == "sse" or "text/event-stream" in self.headers.get("Accept", "")
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", "text/event-stream" if sse else "application/x-ndjson"
+        )
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(event):
+            line = json.dumps(event, ensure_ascii=False)
+            data = (f"data: {line}\n\n" if sse else f"{line}\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for section in SECTIONS:
+                text = section_text(section, payload)
+                time.sleep(self._section_delay(text))
+                send({"section": section, "content": text})
+            send({"done": True})
+            self.wfile.write(b"0\r\n\r\n")
+            self._count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 생성을 취소하고 연결을 끊은 경우
+            self._count("cancelled")
+            self.close_connection = True
+
+
+def make_server(host="127.0.0.1", port=8000, section_delay=1.0, format="ndjson", quiet=False,
+                first_byte_latency=0.0, tokens_per_second=0.0, jitter=0.0, error_rate=0.0):
+    config = argparse.Namespace(
+        section_delay=section_delay, format=format, quiet=quiet,
+        first_byte_latency=first_byte_latency, tokens_per_second=tokens_per_second,
+        jitter=jitter, error_rate=error_rate,
+    )
+    stats = {"lock": threading.Lock()}
+    handler = type("Handler", (MockConsentHandler,), {"config": config, "stats": stats})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--section-delay", type=float, default=1.0,
+                        help="seconds to 'generate' each section")
+    parser.add_argument("--format", choices=["ndjson", "sse"], default="ndjson")
+    parser.add_argument("--first-byte-latency", type=float, default=0.0,
+                        help="seconds before the first section starts")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="generation speed; 0 disables the length-based delay")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="relative random variation of each delay, e.g. 0.3")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 500/503")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = make_server(
+        args.host, args.port, args.section_delay, args.format, args.quiet,
+        args.first_byte_latency, args.tokens_per_second, args.jitter, args.error_rate,
+    )
+    print(f"mock consent server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Local stand-in for the Groq (OpenAI-compatible) chat completions API.
+
+Usage (from the repository root):
+
+    python -m tools.mock_groq_server --port 8100 --ttft 0.8 --tokens-per-second 80
+    GROQ_BASE_URL=http://127.0.0.1:8100 GROQ_API_KEY=mock streamlit run streamlit_app.py
+
+The Groq SDK reads GROQ_BASE_URL, so the app needs no code change to talk to
+it. Streaming answers are sent as server-sent events at a fixed token rate
+after a time-to-first-token delay. Failures can be injected: --error-rate
+returns 500s and --rate-limit-rate returns 429s with the same x-ratelimit-*
+headers Groq sends. GET /metrics reports request counts and the server's
+CPU time and RSS.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tools.proc_stats import process_usage
+
+# 응답으로 반복해서 내보낼 예시 토큰
+ANSWER_TOKENS = (
+    "복강경 담낭절제술 후 발생할 수 있는 합병증으로는 출혈, 담즙 누출, 총담관 손상, "
+    "창상 감염, 복강 내 농양 등이 있으며 대부분 보존적 치료나 추가 시술로 회복됩니다. "
+).split(" ")
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, set by make_server
+    stats = None
+
+    def log_message(self, format, *args):
+        if not self.config.quiet:
+            super().log_message(format, *args)
+
+    def _count(self, name):
+        with self.stats["lock"]:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _ratelimit_headers(self, remaining_requests):
+        return {
+            "x-ratelimit-limit-requests": str(self.config.rpm_limit),
+            "x-ratelimit-remaining-requests": str(max(0, remaining_requests)),
+            "x-ratelimit-reset-requests": "2s",
+            "x-ratelimit-limit-tokens": str(self.config.tpm_limit),
+            "x-ratelimit-remaining-tokens": str(self.config.tpm_limit),
+            "x-ratelimit-reset-tokens": "1s",
+        }
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            with self.stats["lock"]:
+                counts = {k: v for k, v in self.stats.items() if k != "lock"}
+            self._send_json(200, {**counts, **process_usage()})
+        else:
+            self._send_json(404, {"error": {"message": "Not Found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not Found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self._count("requests")
+
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self._count("rate_limited")
+            headers = self._ratelimit_headers(0)
+            headers["retry-after"] = "2"
+            self._send_json(429, {"error": {
+                "message": "Rate limit reached for model. Please try again in 2s.",
+                "type": "tokens", "code": "rate_limit_exceeded",
+            }}, headers)
+            return
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self._count("errors")
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "internal_server_error"}})
+            return
+
+        n_tokens = min(int(request.get("max_tokens") or self.config.answer_tokens),
+                       self.config.answer_tokens)
+        tokens = [ANSWER_TOKENS[i % len(ANSWER_TOKENS)] + " " for i in range(n_tokens)]
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            # 수정안 모드: 바꿀 문장이 없는 최소한의 JSON 수정안
+            tokens = [json.dumps({"note": "".join(tokens[:10]).strip(), "edits": []},
+                                 ensure_ascii=False)]
+        model = request.get("model", "mock")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        headers = self._ratelimit_headers(self.config.rpm_limit - 1)
+
+        time.sleep(self.config.ttft)
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, headers)
+        else:
+            time.sleep(len(tokens) / self.config.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens),
+                          "total_tokens": len(tokens)},
+            }, headers)
+
+    def _stream(self, completion_id, model, tokens, headers):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def send(data):
+            data = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False)
+
+        interval = 1.0 / self.config.tokens_per_second
+        try:
+            send(chunk({"role": "assistant", "content": ""}))
+            for token in tokens:
+                send(chunk({"content": token}))
+                time.sleep(interval)
+            send(chunk({}, "stop"))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self._count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림을 취소한 경우
+            self._count("cancelled")
+            self.close_connection = True
+
+
+def make_server(host="127.0.0.1", port=8100, ttft=0.5, tokens_per_second=50.0,
+                answer_tokens=200, error_rate=0.0, rate_limit_rate=0.0,
+                rpm_limit=30, tpm_limit=6000, quiet=False):
+    config = argparse.Namespace(
+        ttft=ttft, tokens_per_second=tokens_per_second, answer_tokens=answer_tokens,
+        error_rate=error_rate, rate_limit_rate=rate_limit_rate,
+        rpm_limit=rpm_limit, tpm_limit=tpm_limit, quiet=quiet,
+    )
+    stats = {"lock": threading.Lock()}
+    handler = type("Handler", (MockGroqHandler,), {"config": config, "stats": stats})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--rpm-limit", type=int, default=30)
+    parser.add_argument("--tpm-limit", type=int, default=6000)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = make_server(
+        args.host, args.port, args.ttft, args.tokens_per_second, args.answer_tokens,
+        args.error_rate, args.rate_limit_rate, args.rpm_limit, args.tpm_limit, args.quiet,
+    )
+    print(f"mock Groq server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""CPU time and resident memory of a process, for the mock servers and load tests."""
+import os
+import resource
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def process_usage(pid=None):
+    """Return {"cpu_seconds": float, "rss_bytes": int} for pid (default: self).
+
+    Reads /proc on Linux; for the current process it falls back to
+    getrusage elsewhere (RSS is then the peak, not the current value).
+    """
+    path = f"/proc/{pid or 'self'}"
+    try:
+        with open(f"{path}/stat", "r") as f:
+            # comm(2번째 필드)에 공백이 있을 수 있으므로 마지막 ')' 이후부터 분리
+            fields = f.read().rsplit(")", 1)[1].split()
+        utime, stime = int(fields[11]), int(fields[12])
+        with open(f"{path}/statm", "r") as f:
+            rss_pages = int(f.read().split()[1])
+        return {
+            "cpu_seconds": (utime + stime) / _CLOCK_TICKS,
+            "rss_bytes": rss_pages * os.sysconf("SC_PAGE_SIZE"),
+        }
+    except (OSError, IndexError, ValueError):
+        if pid not in (None, os.getpid()):
+            raise
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            # macOS는 바이트, Linux는 KB 단위
+            "rss_bytes": usage.ru_maxrss * (1 if os.uname().sysname == "Darwin" else 1024),
+        }
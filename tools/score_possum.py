@@ -0,0 +1,102 @@
+"""Score historical cases with POSSUM / P-POSSUM in bulk.
+
+Usage (from the repository root):
+
+    python -m tools.score_possum cases.csv scored.csv
+    python -m tools.score_possum cases.parquet scored.parquet --model possum
+
+The input needs one column per POSSUM variable, named as in the calculator
+("Pulse rate (bpm)") or in snake_case ("pulse_rate_bpm"), holding the option
+labels. Raw lab/vital columns (age_years, sbp, pulse, gcs, hb, wbc, urea,
+na, k, plus sex for the Hb range; see services/possum_banding.py) are
+banded first and take precedence over label columns, and the banded labels
+are written out too. Other columns are passed through. The output adds
+physiological_score, operative_score, mortality, morbidity and complete
+(False where a variable is missing or not a valid option). Files are read
+and written in chunks, so inputs larger than memory are fine.
+"""
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from services.possum_banding import band_columns
+from services.possum_engine import MODEL_P_POSSUM, MORTALITY_COEFFICIENTS, score_labels
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _read_chunks(path, chunk_size):
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas(strings_to_categorical=True)
+    else:
+        # 선택지 라벨("15", "≤ 60" 등)이 숫자로 바뀌지 않도록 범주형 문자열로 읽음
+        yield from pd.read_csv(path, dtype="category", keep_default_na=False, chunksize=chunk_size)
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self._parquet = None
+        self._first = True
+
+    def write(self, frame):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help=".csv or .parquet")
+    parser.add_argument("output", help=".csv or .parquet")
+    parser.add_argument("--model", choices=sorted(MORTALITY_COEFFICIENTS), default=MODEL_P_POSSUM,
+                        help="mortality equation (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=500_000)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    writer = _Writer(args.output)
+    rows = incomplete = 0
+    try:
+        for frame in _read_chunks(args.input, args.chunk_size):
+            # 검사 원시값은 열 단위로 구간화해서 라벨 열 대신 사용
+            banded = band_columns(frame)
+            try:
+                result = score_labels({**frame, **banded}, args.model)
+            except KeyError as e:
+                print(f"error: {e.args[0]}", file=sys.stderr)
+                return 2
+            for column, values in {**banded, **result}.items():
+                frame[column] = values
+            writer.write(frame)
+            rows += len(frame)
+            incomplete += int((~result["complete"]).sum())
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - started
+    print(f"scored {rows} cases ({incomplete} incomplete) with {args.model} in {seconds:.2f}s "
+          f"({rows / seconds if seconds else 0:,.0f} rows/s) → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())